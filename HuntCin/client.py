@@ -11,18 +11,26 @@ Observações:
  - Rodar vários clientes (terminal separados) para testar multiplayer.
 """
 
+import os
 import socket
 import threading
+import time
 import sys
 
+# Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.packet import make_pkt, parse_pkt, unwrap_seq, TIPO_DADOS, TIPO_ACK, FLAG_MAIS, FLAG_REINICIO, MASCARA_SEQ
+from rdt.rto import RttEstimator
+from rdt.log import configure, get_logger, log_event, DEBUG, WARNING
+
 # --- Configurações ---
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 62451
-TIMEOUT = 3.0
+TIMEOUT = 3.0 # RTO inicial; depois o timeout se ajusta ao RTT medido
 BUFFER_SIZE = 4096
+NIVEL_LOG = "INFO" # "DEBUG" mostra cada retransmissão do protocolo
 
-ACK0 = b'ACK0'
-ACK1 = b'ACK1'
+log = get_logger("huntcin.client")
 
 client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 # Bind na porta 0 deixa o SO escolher uma livre
@@ -30,46 +38,96 @@ client.bind(("127.0.0.1", 0))
 client.settimeout(0.5)
 
 # --- Estado RDT ---
+# Cada lado numera as suas mensagens e o ack é o próximo seq esperado
+# (cumulativo). O servidor manda várias mensagens seguidas (janela) e a
+# resposta a um comando já traz o ACK dele de carona. Mensagens grandes
+# chegam em vários pacotes: todos menos o último têm FLAG_MAIS. Um pacote
+# com FLAG_REINICIO diz que o servidor desistiu dos anteriores: a espera
+# recomeça dele.
 seq_send = 0
 seq_recv = 0
-ack_events = {0: threading.Event(), 1: threading.Event()}
+partes = [] # pedaços da mensagem que está chegando
+ack_event = threading.Event() # o comando em trânsito (seq_send) foi confirmado
+rtt = RttEstimator(TIMEOUT)
 running = True
 
-def make_pkt(seq, data):
-    return str(seq).encode() + b'|' + data.encode()
+def make_data(seq, data):
+    return make_pkt(TIPO_DADOS, seq=seq, ack=seq_recv, dados=data.encode())
 
-def extract_pkt(pkt):
-    try:
-        sep = pkt.find(b'|')
-        if sep < 0: return None, None
-        return int(pkt[:sep]), pkt[sep+1:]
-    except:
-        return None, None
+def make_ack(expected):
+    return make_pkt(TIPO_ACK, ack=expected)
+
+def on_ack(ack):
+    if ack == (seq_send + 1) & MASCARA_SEQ:
+        ack_event.set()
 
 def send_reliable(msg):
     """Envia o comando e espera o ACK do protocolo (técnico)."""
     global seq_send
-    pkt = make_pkt(seq_send, msg)
-    ack_events[seq_send].clear()
+    pkt = make_data(seq_send, msg)
+    ack_event.clear()
     
     # Tenta enviar até receber o ACK
+    retransmitido = False
     while True:
+        enviado_em = time.monotonic()
         try:
             client.sendto(pkt, (SERVER_IP, SERVER_PORT))
         except Exception as e:
-            print(f"Erro envio: {e}")
+            log_event(log, WARNING, "erro_envio", "Erro envio: %(erro)s", erro=str(e))
 
         # Aguarda ACK específico desse pacote
-        if ack_events[seq_send].wait(TIMEOUT):
-            # Recebeu ACK, inverte bit e retorna sucesso
-            seq_send = 1 - seq_send
+        if ack_event.wait(rtt.rto):
+            # Regra de Karn: só mede o RTT se o pacote não foi retransmitido
+            if not retransmitido:
+                rtt.sample(time.monotonic() - enviado_em)
+            else:
+                rtt.reset_backoff()
+            # Recebeu ACK, passa para o próximo seq e retorna sucesso
+            seq_send = (seq_send + 1) & MASCARA_SEQ
             return True
         
-        print(f" [RDT] Timeout esperando ACK{seq_send}... Reenviando.")
+        retransmitido = True
+        rtt.backoff()
+        log_event(log, DEBUG, "timeout", " [RDT] Timeout esperando ACK%(seq)d... Reenviando.", seq=seq_send)
+
+def on_data(pkt):
+    """Trata um pacote de dados do servidor. Retorna o texto da mensagem, se ela ficou completa."""
+    global seq_recv
+    s, content = pkt.seq, pkt.dados
+    # A resposta a um comando traz o ACK dele de carona
+    on_ack(pkt.ack)
+
+    # Reinício no seq esperado ou à frente dele: o servidor desistiu do que faltava (a mensagem
+    # pela metade se perde). Um reinício para trás é a retransmissão de um que já foi aceito
+    if pkt.flags & FLAG_REINICIO and unwrap_seq(s, seq_recv) >= seq_recv:
+        seq_recv = s
+        partes.clear()
+    # Verifica se é a sequência esperada (evita duplicação e mensagens fora de ordem)
+    if s == seq_recv:
+        seq_recv = (seq_recv + 1) & MASCARA_SEQ
+    else:
+        content = None
+    # Envia ACK (cumulativo) de volta pro servidor parar de encher o saco
+    client.sendto(make_ack(seq_recv), (SERVER_IP, SERVER_PORT))
+
+    if content is None:
+        return None
+    partes.append(bytes(content))
+    if pkt.flags & FLAG_MAIS:
+        return None # a mensagem continua no próximo pacote
+    content = b"".join(partes)
+    interrompida = not partes[-1]
+    partes.clear()
+    if interrompida:
+        return None # pedaço final vazio: o servidor desistiu desta mensagem no meio
+    try:
+        return str(content, "utf-8")
+    except UnicodeDecodeError:
+        return None
 
 def receiver_thread():
     """Escuta respostas do servidor (Erros, Broadcasts, Logs)."""
-    global seq_recv
     print(f"Cliente iniciado na porta {client.getsockname()[1]}")
     
     while running:
@@ -80,34 +138,26 @@ def receiver_thread():
         except:
             break
 
+        pkt = parse_pkt(data)
+        if pkt is None:
+            continue # Corrompido ou inválido: tratado como perdido
+
         # Se for ACK do servidor (confirmando nosso envio)
-        if data == ACK0:
-            ack_events[0].set()
-            continue
-        if data == ACK1:
-            ack_events[1].set()
+        if pkt.tipo == TIPO_ACK:
+            on_ack(pkt.ack)
             continue
             
         # Se for Dado vindo do servidor (Mensagem de erro, Broadcast, etc)
-        s, content = extract_pkt(data)
-        if s is not None:
-            # Envia ACK de volta pro servidor parar de encher o saco
-            reply = ACK0 if s == 0 else ACK1
-            client.sendto(reply, (SERVER_IP, SERVER_PORT))
-            
-            # Verifica se é a sequência esperada (evita duplicação)
-            if s == seq_recv:
-                seq_recv = 1 - seq_recv
-                try:
-                    texto = content.decode()
-                    # Imprime a mensagem do servidor
-                    print(f"\n{texto}")
-                    # Restaura o prompt visualmente
-                    print("> ", end="", flush=True)
-                except:
-                    pass
+        if pkt.tipo == TIPO_DADOS:
+            texto = on_data(pkt)
+            if texto is not None:
+                # Imprime a mensagem do servidor
+                print(f"\n{texto}")
+                # Restaura o prompt visualmente
+                print("> ", end="", flush=True)
 
 if __name__ == "__main__":
+    configure(NIVEL_LOG)
     t = threading.Thread(target=receiver_thread, daemon=True)
     t.start()
     
@@ -1,154 +1,453 @@
 """
 HuntCin - Server (Terceira Etapa)
-Servidor UDP multi-cliente com transmissão confiável em camada de aplicação (RDT 3.0 - alternating bit).
+Servidor UDP multi-cliente com transmissão confiável em camada de aplicação (RDT 3.0, com janela por cliente).
 Características:
  - Suporta múltiplos clientes (cada cliente é um processo com porta única).
  - Login / logout.
  - Comandos: move <up/down/left/right>, hint, suggest.
  - Rodadas temporizadas com broadcast de início e estado.
- - RDT stop-and-wait por cliente (alternating-bit).
+ - Mapa configurável (GRID_W x GRID_H, NUM_TESOUROS, NUM_OBSTACULOS). Tesouros
+   e jogadores ficam num índice espacial (SpatialHash), e com RAIO_INTERESSE
+   cada jogador só recebe os eventos e as posições perto dele.
+ - RDT com janela por cliente: as mensagens para cada cliente entram numa
+   fila de saída e saem em ordem, até JANELA delas sem ACK (Go-Back-N, ACK
+   cumulativo). A resposta a um comando leva o ACK do comando de carona.
+ - Tudo roda num laço asyncio, numa thread só: o socket é lido com
+   loop.add_reader, os comandos são tratados ali mesmo e as retransmissões
+   usam um temporizador do laço por cliente. Milhares de clientes não criam
+   nenhuma thread.
 """
 
+import asyncio
+import os
+import sys
 import socket
 import threading
 import time
 import random
-import traceback
+from collections import deque
+
+# Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.packet import make_pkt, parse_pkt, unwrap_seq, TIPO_DADOS, TIPO_ACK, FLAG_MAIS, FLAG_REINICIO, MASCARA_SEQ
+from rdt.rto import RttEstimator
+from rdt.log import configure, get_logger, log_event, DEBUG, INFO, WARNING
+from rdt.metrics import REGISTRO, MetricsServer
 
 # --- Configurações ---
-TIMEOUT = 3.0
+TIMEOUT = 3.0 # RTO inicial; depois o timeout se ajusta ao RTT medido de cada cliente
+MAX_TENTATIVAS = 5 # reliable_send desiste após MAX_TENTATIVAS * TIMEOUT segundos sem ACK
+DESISTENCIAS = 2 # desistências seguidas (sem nenhum ACK entre elas) até o jogador ser desconectado
+TEMPO_OCIOSO = 120.0 # endereço sem mandar nenhum pacote (nem ACK) por esse tempo é desconectado e esquecido
+JANELA = 8 # pacotes em trânsito (sem ACK) por cliente; os outros esperam na fila de saída
+FRAGMENTO = 1200 # maior payload por pacote; mensagens maiores vão em vários pacotes (FLAG_MAIS)
 BUFFER_SIZE = 4096
 ROUND_TIME = 30.0 # Duração da rodada em segundos
-GRID_W, GRID_H = 3, 3
-START_POS = (1, 1)
-
-ACK0 = b'ACK0'
-ACK1 = b'ACK1'
+GRID_W, GRID_H = 3, 3 # o mapa pode ter milhares de casas de lado
+START_POS = (1, 1) # None: cada jogador começa numa casa livre sorteada (para mapas grandes)
+NUM_TESOUROS = 1 # tesouros por partida; a partida acaba quando o último é encontrado
+NUM_OBSTACULOS = 0 # casas bloqueadas, sorteadas quando o servidor inicia
+RAIO_INTERESSE = None # cada jogador só recebe o que acontece a até esse nº de casas dele; None: o mapa todo
+CELULA = 16 # lado (em casas) das células do índice espacial
+NIVEL_LOG = "INFO" # "DEBUG" registra cada comando recebido e cada retransmissão
+FORMATO_LOG = "texto" # "texto" ou "json" (uma linha por evento)
+PORTA_METRICAS = 9101 # métricas em http://127.0.0.1:9101/metrics (Prometheus) e /metrics.json; None desliga
 
 # --- RDT Utils ---
-def make_pkt(seq, data):
-    # Empacota: "0|Dados" ou "1|Dados"
-    return str(seq).encode() + b'|' + data
-
-def extract_pkt(packet):
-    # Tenta separar pelo pipe '|'
-    sep = packet.find(b'|')
-    if sep == -1: return None, packet
-    try:
-        return int(packet[:sep].decode()), packet[sep+1:]
-    except:
-        return None, packet
-
-def make_ack(seq):
-    return ACK0 if seq == 0 else ACK1
+# Os pacotes usam o cabeçalho binário de rdt/packet.py. Cada lado numera as
+# suas mensagens (seq de 32 bits) e o ack é sempre o próximo seq esperado
+# (cumulativo, como o GBN de rdt/window.py). Toda mensagem de dados também
+# leva o ack de quem a envia: a resposta a um comando já confirma o comando.
+# Mensagens maiores que FRAGMENTO vão em pacotes seguidos; todos menos o
+# último levam FLAG_MAIS, e o cliente junta os pedaços (chegam em ordem).
+# Quando o servidor desiste de um cliente, o próximo pacote leva
+# FLAG_REINICIO: o cliente passa a esperar a partir dele, tenha recebido ou
+# não os pacotes descartados.
+def make_data(seq, data, ack=0, flags=0):
+    return make_pkt(TIPO_DADOS, seq=seq, ack=ack, dados=data, flags=flags)
+
+def fragment(msg_str):
+    """Os pacotes (payload, flags) de uma mensagem."""
+    dados = msg_str.encode()
+    partes = [dados[i:i + FRAGMENTO] for i in range(0, len(dados), FRAGMENTO)] or [b""]
+    return [(parte, FLAG_MAIS) for parte in partes[:-1]] + [(partes[-1], 0)]
+
+def make_ack(expected):
+    return make_pkt(TIPO_ACK, ack=expected)
 
 # --- Estado do Servidor ---
 HOST = "127.0.0.1"
 PORT = 62451 
 
-server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server.bind((HOST, PORT))
-print(f"Servidor HuntCin iniciado em {HOST}:{PORT}")
+log = get_logger("huntcin.server")
+
+server = None # socket do jogo, aberto por open_socket (no main): importar o módulo não ocupa a porta
 
-# Cadeado (RLock) pra evitar que threads mexam na lista de clientes ao mesmo tempo
-clients_lock = threading.RLock()
+def open_socket(host=HOST, port=PORT):
+    """Abre o socket do jogo em host:port."""
+    global server
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind((host, port))
+    server.setblocking(False) # lido pelo laço asyncio (loop.add_reader), nunca bloqueia
+    log_event(log, INFO, "inicio", "Servidor HuntCin iniciado em %(host)s:%(porta)d", host=host, porta=server.getsockname()[1])
+    return server
 
-clients = {} 
+# Só o laço asyncio mexe no estado do jogo (uma thread), então não há cadeados;
+# o servidor de métricas só lê, de outra thread
+clients = {} # endereço -> ClientSession, de todo endereço que já mandou um comando
+online = {} # endereço -> ClientSession, só dos jogadores logados (broadcast e rodadas percorrem este)
+names = {} # nome -> ClientSession dos jogadores logados (login confere nomes sem percorrer ninguém)
 player_scores = {}
-running = True
-current_treasure = None 
+
+# --- Métricas (rdt/metrics.py) ---
+LATENCIA_ACK = REGISTRO.histogram("huntcin_latencia_ack_segundos", "Tempo até o ACK de cada mensagem enviada sem retransmissão")
+MENSAGENS_ENVIADAS = REGISTRO.counter("huntcin_mensagens_enviadas_total", "Mensagens confirmadas pelos clientes")
+RETRANSMISSOES = REGISTRO.counter("huntcin_retransmissoes_total", "Timeouts de retransmissão (cada um reenvia a janela do cliente)")
+FALHAS_ENVIO = REGISTRO.counter("huntcin_falhas_envio_total", "Mensagens descartadas sem ACK (cliente sem resposta)")
+COMANDOS = REGISTRO.counter("huntcin_comandos_total", "Comandos recebidos dos clientes")
+DURACAO_RODADA = REGISTRO.histogram("huntcin_duracao_rodada_segundos", "Duração de cada rodada, com o cálculo e o envio dos resultados")
+REGISTRO.gauge("huntcin_sessoes_ativas", "Clientes logados", lambda: len(online))
+REGISTRO.gauge("huntcin_clientes", "Endereços com estado no servidor, logados ou não", lambda: len(clients))
+REGISTRO.gauge("huntcin_threads", "Threads vivas no processo", threading.active_count)
+DESCONECTADOS = REGISTRO.counter("huntcin_desconectados_total", "Jogadores desconectados pelo servidor (sem resposta ou ociosos)")
+REGISTRO.gauge("huntcin_fila_saida", "Pacotes na fila de saída ou em trânsito, somando todos os clientes",
+               lambda: sum(len(c.saida) + len(c.em_transito) for c in list(clients.values())))
+
+class ClientSession:
+    """
+    Estado de um endereço (ip, porta): o jogador e o RDT até ele. Com
+    __slots__, cada sessão ocupa uma fração do que ocupava o dict com as
+    mesmas chaves, o que conta com milhares de clientes.
+    """
+    __slots__ = ("addr", "name", "pos", "online", "hint_used", "suggest_used", "last_command",
+                 "expected_seq_recv", "ack_enviado", "next_seq_send", "saida", "em_transito", "meio_mensagem",
+                 "reiniciar", "sincronizado", "tentativas", "desistencias", "limite", "timer", "rtt", "visto_em")
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.name = None
+        self.pos = START_POS
+        self.online = False
+        self.hint_used = False
+        self.suggest_used = False
+        self.last_command = None
+        self.expected_seq_recv = 0 # Próximo seq que espera receber do cliente
+        self.ack_enviado = 0 # Último ack que o cliente recebeu de nós (sozinho ou de carona)
+        self.next_seq_send = 0 # Seq da próxima mensagem nova para o cliente
+        self.saida = deque() # (dados, flags) esperando espaço na janela, em ordem
+        self.em_transito = [] # [seq, dados, flags, enviado_em, retransmitido] ainda sem ACK, em ordem (no máximo JANELA)
+        self.meio_mensagem = False # o último pacote confirmado tinha FLAG_MAIS (o cliente tem uma mensagem pela metade)
+        self.reiniciar = False # desistiu de pacotes: o próximo a sair leva FLAG_REINICIO
+        self.sincronizado = False # já recebeu um estado completo do jogo; depois disso, só as mudanças
+        self.tentativas = 0 # Timeouts seguidos sem nenhum ACK novo
+        self.desistencias = 0 # Desistências seguidas (on_timeout) sem nenhum pacote do cliente entre elas
+        self.limite = 0.0 # Sem ACK novo até aqui, desiste do cliente
+        self.timer = None # Temporizador de retransmissão (loop.call_later) da janela
+        self.rtt = RttEstimator(TIMEOUT) # RTT medido até o cliente (define o timeout)
+        self.visto_em = time.monotonic() # Último pacote recebido do cliente (comando ou ACK)
 
 def ensure_client(addr):
     # Garante que o cliente existe no dicionário antes de tentar acessar
-    with clients_lock:
-        if addr not in clients:
-            clients[addr] = {
-                "name": None,
-                "pos": START_POS,
-                "online": False,
-                "hint_used": False,
-                "suggest_used": False,
-                "last_command": None,
-                "expected_seq_recv": 0, # O que espera receber (0 ou 1)
-                "next_seq_send": 0, # O que vai enviar (0 ou 1)
-                "ack_events": {0: threading.Event(), 1: threading.Event()} # Gatilhos pra acordar a thread
-            }
-
-def reliable_send(addr, msg_str):
-    """Envia mensagem RDT para o cliente e aguarda ACK."""
-    ensure_client(addr)
-    payload = msg_str.encode()
-    
-    with clients_lock:
-        if addr not in clients: return False
-        seq = clients[addr]["next_seq_send"]
-        ack_ev = clients[addr]["ack_events"][seq]
-        ack_ev.clear() # Limpa o evento
-
-    pkt = make_pkt(seq, payload)
-    
-    for i in range(5): 
-        try:
-            server.sendto(pkt, addr)
-        except:
-            pass
-            
-        if ack_ev.wait(TIMEOUT):
-            with clients_lock:
-                if addr in clients:
-                    # Recebeu ACK! Inverte o bit (0->1 ou 1->0) pra proxima msg
-                    clients[addr]["next_seq_send"] = 1 - seq
-            return True
-        print(f"[RDT] Timeout aguardando ACK{seq} de {addr} (Tentativa {i+1})")
-    
-    print(f"[RDT] Falha de envio para {addr}. Cliente pode estar offline.")
-    return False
-
-def receiver_thread():
-    """Fica ouvindo a porta UDP o tempo todo."""
-    print("[THREAD] Receptor RDT iniciado.")
-    while running:
+    client = clients.get(addr)
+    if client is None:
+        client = clients[addr] = ClientSession(addr)
+    return client
+
+def logout(client, motivo=""):
+    """Tira o jogador do jogo (online, names e o índice de jogadores) e avisa quem está perto."""
+    name = client.name
+    client.online = False
+    del online[client.addr]
+    del names[name]
+    players.remove(client)
+    if name: broadcast(f"[Servidor] {name} saiu do jogo{motivo}.", perto=client.pos)
+
+def forget_client(client, motivo):
+    """Desconecta o cliente que parou de responder e descarta o estado dele."""
+    DESCONECTADOS.inc()
+    log_event(log, WARNING, "desconectado", "[RDT] %(cliente)s desconectado: %(motivo)s.", cliente=client.addr, motivo=motivo)
+    if client.online:
+        logout(client, " (sem resposta)")
+    if client.timer is not None:
+        client.timer.cancel()
+        client.timer = None
+    client.em_transito.clear()
+    client.saida.clear()
+    clients.pop(client.addr, None)
+
+def evict_idle():
+    """Esquece os endereços que não mandam nada (nem ACK) há TEMPO_OCIOSO segundos."""
+    limite = time.monotonic() - TEMPO_OCIOSO
+    for client in [c for c in clients.values() if c.visto_em < limite]:
+        forget_client(client, f"sem pacotes há {TEMPO_OCIOSO:.0f}s")
+
+def send_raw(pkt, addr):
+    try:
+        server.sendto(pkt, addr)
+    except OSError:
+        pass # buffer cheio ou cliente inalcançável: conta como perda, o RDT retransmite
+
+def reliable_send(addr, msg_str, fragmentos=None):
+    """
+    Coloca a mensagem na fila de saída do cliente. Os pacotes saem na ordem
+    em que foram enfileirados, até JANELA deles sem ACK ao mesmo tempo.
+    `fragmentos` são os pacotes já prontos (fragment), para quem manda a
+    mesma mensagem a vários clientes.
+    """
+    client = clients.get(addr)
+    if client is None:
+        return # esquecido por forget_client: não recria a sessão, ela volta com o próximo comando
+    client.saida.extend(fragmentos or fragment(msg_str))
+    pump(addr, client)
+
+def pump(addr, client):
+    """Envia as mensagens da fila enquanto houver espaço na janela."""
+    saida, em_transito = client.saida, client.em_transito
+    if saida and not em_transito:
+        client.limite = time.monotonic() + MAX_TENTATIVAS * TIMEOUT
+    while saida and len(em_transito) < JANELA:
+        seq = client.next_seq_send
+        client.next_seq_send = (seq + 1) & MASCARA_SEQ
+        dados, flags = saida.popleft()
+        if client.reiniciar:
+            flags |= FLAG_REINICIO # fica no pacote guardado: as retransmissões também levam
+            client.reiniciar = False
+        em_transito.append([seq, dados, flags, time.monotonic(), False])
+        # O ack vai de carona: confirma os comandos já recebidos do cliente
+        send_raw(make_data(seq, dados, client.expected_seq_recv, flags), addr)
+        client.ack_enviado = client.expected_seq_recv
+    if em_transito and client.timer is None:
+        client.timer = asyncio.get_running_loop().call_later(client.rtt.rto, on_timeout, addr, client)
+
+def on_ack(addr, client, ack):
+    """ACK cumulativo do cliente: tira da janela tudo antes de `ack` e envia mais da fila."""
+    em_transito = client.em_transito
+    if not em_transito:
+        return
+    base = em_transito[0][0]
+    confirmadas = unwrap_seq(ack, base) - base
+    if confirmadas <= 0 or confirmadas > len(em_transito):
+        return # duplicado ou antigo
+    ultima = em_transito[confirmadas - 1]
+    del em_transito[:confirmadas]
+    agora = time.monotonic()
+    # Regra de Karn: só mede o RTT se o pacote não foi retransmitido
+    if not ultima[4]:
+        client.rtt.sample(agora - ultima[3])
+        LATENCIA_ACK.record(agora - ultima[3])
+    else:
+        client.rtt.reset_backoff()
+    MENSAGENS_ENVIADAS.inc(confirmadas)
+    client.meio_mensagem = bool(ultima[2] & FLAG_MAIS)
+    client.tentativas = 0
+    client.limite = agora + MAX_TENTATIVAS * TIMEOUT
+    client.timer.cancel()
+    client.timer = None
+    pump(addr, client)
+
+def on_timeout(addr, client):
+    """Temporizador da janela: reenvia tudo o que está sem ACK (Go-Back-N) ou desiste do cliente."""
+    client.timer = None
+    em_transito = client.em_transito
+    if not em_transito:
+        return
+    if time.monotonic() >= client.limite:
+        perdidas = len(em_transito) + len(client.saida)
+        FALHAS_ENVIO.inc(perdidas)
+        log_event(log, WARNING, "falha_envio", "[RDT] Falha de envio para %(cliente)s (%(mensagens)d mensagens descartadas). Cliente pode estar offline.",
+                  cliente=addr, mensagens=perdidas)
+        # Não dá para saber se o cliente recebeu os pacotes descartados (podem ter se perdido só
+        # os ACKs): a numeração continua, e o próximo pacote leva FLAG_REINICIO para o cliente
+        # esperar a partir dele
+        em_transito.clear()
+        client.saida.clear()
+        client.tentativas = 0
+        client.reiniciar = True
+        client.sincronizado = False # perdeu mudanças: a próxima rodada manda o estado completo
+        client.desistencias += 1
+        if client.desistencias >= DESISTENCIAS:
+            # Sem resposta a várias mensagens seguidas: o jogador deixa o jogo e o endereço é esquecido
+            forget_client(client, f"{client.desistencias} desistências seguidas")
+            return
+        if client.meio_mensagem:
+            # Um pedaço vazio avisa já o cliente que a mensagem pela metade foi interrompida
+            client.meio_mensagem = False
+            client.saida.append((b"", 0))
+            pump(addr, client)
+        return
+    client.tentativas += 1
+    RETRANSMISSOES.inc()
+    client.rtt.backoff()
+    log_event(log, DEBUG, "timeout", "[RDT] Timeout aguardando ACK%(seq)d de %(cliente)s (Tentativa %(tentativa)d, próximo RTO %(rto).3fs)",
+              seq=em_transito[0][0], cliente=addr, tentativa=client.tentativas, rto=client.rtt.rto)
+    for p in em_transito:
+        p[4] = True
+        send_raw(make_data(p[0], p[1], client.expected_seq_recv, p[2]), addr)
+    client.ack_enviado = client.expected_seq_recv
+    client.timer = asyncio.get_running_loop().call_later(client.rtt.rto, on_timeout, addr, client)
+
+def receive_packets():
+    """Chamada pelo laço quando o socket tem datagramas: lê todos os que estão na fila."""
+    while True:
         try:
             packet, addr = server.recvfrom(BUFFER_SIZE)
-        except:
-            continue
-        
-        ensure_client(addr)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            continue # ex.: ICMP de porta inalcançável de um cliente que fechou
         
+        pkt = parse_pkt(packet)
+        if pkt is None:
+            continue # Corrompido ou inválido: tratado como perdido
+
         # 1. É ACK?
-        if packet == ACK0 or packet == ACK1:
-            bit = 0 if packet == ACK0 else 1
-            with clients_lock:
-                if addr in clients:
-                    # Acorda a função reliable_send que está travada no wait()
-                    clients[addr]["ack_events"][bit].set()
+        if pkt.tipo == TIPO_ACK:
+            client = clients.get(addr) # ACK de quem nunca mandou um comando não cria sessão
+            if client is not None:
+                client.visto_em = time.monotonic()
+                client.desistencias = 0 # o cliente responde: as desistências foram perdas
+                on_ack(addr, client, pkt.ack)
             continue
 
+        client = clients.get(addr)
+        if client is None:
+            client = ensure_client(addr)
+            if pkt.tipo == TIPO_DADOS:
+                # Endereço novo ou esquecido (forget_client): segue a numeração que o
+                # cliente já usa, senão um cliente que volta nunca mais se entende com o servidor
+                client.expected_seq_recv = client.ack_enviado = pkt.seq
+                client.next_seq_send = pkt.ack
+        client.visto_em = time.monotonic()
+        client.desistencias = 0
+
         # 2. É DADO?
-        seq, data = extract_pkt(packet)
-        if seq is not None:
-            # Envia ACK IMEDIATAMENTE
-            ack_pkt = make_ack(seq)
-            server.sendto(ack_pkt, addr)
-
-            expected = 0
-            with clients_lock:
-                expected = clients[addr]["expected_seq_recv"]
-            
+        if pkt.tipo == TIPO_DADOS:
+            # O cliente também manda o ack de carona nos comandos
+            on_ack(addr, client, pkt.ack)
+
             # Só processa se for a sequência exata que esperava (evita duplicatas)
-            if seq == expected:
-                with clients_lock:
-                    clients[addr]["expected_seq_recv"] = 1 - expected
-                
+            if pkt.seq == client.expected_seq_recv:
+                client.expected_seq_recv = (pkt.seq + 1) & MASCARA_SEQ
                 try:
-                    msg = data.decode()
-                    # Processa em thread separada para não bloquear o receptor
-                    threading.Thread(target=handle_msg, args=(addr, msg), daemon=True).start()
-                except:
-                    pass
+                    msg = str(pkt.dados, "utf-8")
+                except UnicodeDecodeError:
+                    msg = None
+                if msg is not None:
+                    # As respostas entram na fila de saída e, se couberem na janela,
+                    # já saem levando o ACK deste comando
+                    handle_msg(addr, msg)
+                if client.ack_enviado != client.expected_seq_recv:
+                    send_raw(make_ack(client.expected_seq_recv), addr)
+                    client.ack_enviado = client.expected_seq_recv
             else:
-                # Se for duplicado, o ACK já foi enviado acima. Apenas ignoramos o processamento.
-                pass
+                # Duplicado (o nosso ACK se perdeu): confirma de novo e não processa
+                send_raw(make_ack(client.expected_seq_recv), addr)
+
+# --- Mapa ---
+class SpatialHash:
+    """
+    Índice espacial: cada objeto guardado com a sua posição (x, y), e as
+    posições agrupadas em células de `celula` x `celula` casas. Achar o que
+    está perto de um ponto só olha as células em volta dele, então o custo
+    depende de quantos objetos há ali, não no mapa inteiro.
+    """
+    __slots__ = ("celula", "_celulas", "_posicoes")
+
+    def __init__(self, celula=CELULA):
+        self.celula = celula
+        self._celulas = {} # (cx, cy) -> {objeto: posição}
+        self._posicoes = {} # objeto -> posição
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def __contains__(self, obj):
+        return obj in self._posicoes
+
+    def __iter__(self):
+        return iter(self._posicoes)
+
+    def _chave(self, pos):
+        return (pos[0] // self.celula, pos[1] // self.celula)
+
+    def add(self, obj, pos):
+        self._posicoes[obj] = pos
+        self._celulas.setdefault(self._chave(pos), {})[obj] = pos
+
+    def remove(self, obj):
+        chave = self._chave(self._posicoes.pop(obj))
+        celula = self._celulas[chave]
+        del celula[obj]
+        if not celula:
+            del self._celulas[chave]
+
+    def move(self, obj, pos):
+        self.remove(obj)
+        self.add(obj, pos)
+
+    def clear(self):
+        self._celulas.clear()
+        self._posicoes.clear()
+
+    def near(self, pos, raio):
+        """Os objetos a até `raio` casas de `pos` (em x e em y)."""
+        x, y = pos
+        (cx0, cy0), (cx1, cy1) = self._chave((x - raio, y - raio)), self._chave((x + raio, y + raio))
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for obj, (ox, oy) in self._celulas.get((cx, cy), {}).items():
+                    if abs(ox - x) <= raio and abs(oy - y) <= raio:
+                        yield obj
+
+    def nearest(self, pos):
+        """O objeto mais perto de `pos` (em número de casas andando), ou None se não há nenhum."""
+        if not self._posicoes:
+            return None
+        x, y = pos
+        cx, cy = self._chave(pos)
+        # Anéis de células cada vez mais longe; um objeto no anel r está a pelo
+        # menos (r - 1) * celula + 1 casas, então dá para parar cedo
+        melhor, distancia = None, None
+        vistos = 0
+        r = 0
+        while vistos < len(self._posicoes):
+            if distancia is not None and (r - 1) * self.celula + 1 > distancia:
+                break
+            for kx in range(cx - r, cx + r + 1):
+                for ky in ((cy - r, cy + r) if abs(kx - cx) < r else range(cy - r, cy + r + 1)):
+                    celula = self._celulas.get((kx, ky))
+                    if not celula:
+                        continue
+                    vistos += len(celula)
+                    for obj, (ox, oy) in celula.items():
+                        d = abs(ox - x) + abs(oy - y)
+                        if distancia is None or d < distancia:
+                            melhor, distancia = obj, d
+            r += 1
+        return melhor
+
+obstacles = set() # casas bloqueadas (fixas enquanto o servidor roda)
+treasures = SpatialHash() # tesouros ainda não encontrados na partida (o objeto é a própria posição)
+players = SpatialHash() # jogadores logados, por posição (para o raio de interesse)
+
+def free_cell():
+    """Uma casa sorteada sem obstáculo nem tesouro (e fora do início)."""
+    while True:
+        pos = (random.randint(1, GRID_W), random.randint(1, GRID_H))
+        if pos != START_POS and pos not in obstacles and pos not in treasures:
+            return pos
+
+def spawn_pos():
+    return START_POS if START_POS is not None else free_cell()
+
+def build_world():
+    """Sorteia os obstáculos do mapa."""
+    # O sorteio por tentativa só termina rápido se sobrar bastante casa livre
+    if NUM_OBSTACULOS + NUM_TESOUROS > GRID_W * GRID_H // 2:
+        raise ValueError(f"NUM_OBSTACULOS + NUM_TESOUROS ocupa mais da metade do mapa {GRID_W}x{GRID_H}")
+    obstacles.clear()
+    while len(obstacles) < NUM_OBSTACULOS:
+        obstacles.add(free_cell())
 
 def get_hint_text(px, py, tx, ty):
     if ty > py: return "O tesouro está mais acima."
@@ -167,18 +466,14 @@ def get_suggestion_text(px, py, tx, ty):
 
 def handle_msg(addr, msg):
     """Processa a lógica do jogo."""
-    global current_treasure
-    
-    # PEQUENO DELAY CRÍTICO: Dá tempo do cliente receber o ACK do comando
-    # antes de recebermos a resposta do servidor.
-    time.sleep(0.1) 
-
     try:
         parts = msg.strip().split()
         if not parts: return
         cmd = parts[0].lower()
+        client = clients[addr]
         
-        print(f"[CMD] {addr}: {msg}")
+        COMANDOS.inc()
+        log_event(log, DEBUG, "comando", "[CMD] %(cliente)s: %(msg)s", cliente=addr, msg=msg)
 
         # --- LOGIN ---
         if cmd == "login":
@@ -187,53 +482,40 @@ def handle_msg(addr, msg):
                 return
             nome = " ".join(parts[1:]).strip()
             
-            online = False
-            with clients_lock:
-                online = clients[addr]["online"]
-
-            if online:
+            if client.online:
                 reliable_send(addr, "ERRO: Você já está logado.")
                 return
 
-            with clients_lock:
-                for c in clients.values():
-                    if c["online"] and c["name"] == nome:
-                        reliable_send(addr, f"ERRO: O nome '{nome}' já está em uso.")
-                        return
+            if nome in names:
+                reliable_send(addr, f"ERRO: O nome '{nome}' já está em uso.")
+                return
 
-                clients[addr]["name"] = nome
-                clients[addr]["online"] = True
-                clients[addr]["pos"] = START_POS
-                player_scores.setdefault(nome, 0)
+            client.name = nome
+            client.online = True
+            client.pos = spawn_pos()
+            client.last_command = None
+            client.sincronizado = False
+            online[addr] = client
+            names[nome] = client
+            players.add(client, client.pos)
+            player_scores.setdefault(nome, 0)
             
             reliable_send(addr, "LOGIN SUCESSO: Você está online!")
-            broadcast(f"[Servidor] {nome} entrou no jogo.")
+            broadcast(f"[Servidor] {nome} entrou no jogo.", perto=client.pos)
 
         # --- LOGOUT ---
         elif cmd == "logout":
-            online = False
-            with clients_lock:
-                online = clients[addr]["online"]
-
-            if not online:
+            if not client.online:
                 reliable_send(addr, "ERRO: Você não está logado.")
                 return
             
-            name = None
-            with clients_lock:
-                name = clients[addr]["name"]
-                clients[addr]["online"] = False
+            logout(client)
             reliable_send(addr, "logout efetuado")
-            if name: broadcast(f"[Servidor] {name} saiu do jogo.")
 
         # --- MOVE ---
         elif cmd == "move":
             # VALIDAÇÃO NO SERVIDOR
-            online = False
-            with clients_lock:
-                online = clients[addr]["online"]
-            
-            if not online:
+            if not client.online:
                 reliable_send(addr, "ERRO: Faça login primeiro.")
                 return
 
@@ -242,34 +524,25 @@ def handle_msg(addr, msg):
                 reliable_send(addr, "ERRO: Direção inválida.")
                 return
 
-            with clients_lock:
-                clients[addr]["last_command"] = f"move {direction}"
+            client.last_command = f"move {direction}"
             # O servidor não responde imediatamente ao move (só ACK), espera a rodada.
 
         # --- HINT ---
         elif cmd == "hint":
-            online = False
-            with clients_lock:
-                online = clients[addr]["online"]
-
-            if not online:
+            if not client.online:
                 reliable_send(addr, "ERRO: Faça login primeiro.")
                 return
             
-            used = False
-            with clients_lock:
-                if clients[addr]["hint_used"]: used = True
-                else: clients[addr]["hint_used"] = True
-                
-            if used:
+            if client.hint_used:
                 reliable_send(addr, "ERRO: Você já usou sua dica nesta partida.")
                 return
+            client.hint_used = True
 
-            px, py = (0,0)
-            with clients_lock: px, py = clients[addr]["pos"]
+            px, py = client.pos
+            alvo = treasures.nearest(client.pos) # o tesouro mais perto do jogador
 
-            if current_treasure:
-                tx, ty = current_treasure
+            if alvo:
+                tx, ty = alvo
                 texto = get_hint_text(px, py, tx, ty)
                 reliable_send(addr, f"DICA: {texto}")
             else:
@@ -277,28 +550,20 @@ def handle_msg(addr, msg):
 
         # --- SUGGEST ---
         elif cmd == "suggest":
-            online = False
-            with clients_lock:
-                online = clients[addr]["online"]
-            
-            if not online:
+            if not client.online:
                 reliable_send(addr, "ERRO: Faça login primeiro.")
                 return
 
-            used = False
-            with clients_lock:
-                if clients[addr]["suggest_used"]: used = True
-                else: clients[addr]["suggest_used"] = True
-
-            if used:
+            if client.suggest_used:
                 reliable_send(addr, "ERRO: Você já usou sua sugestão nesta partida.")
                 return
+            client.suggest_used = True
 
-            px, py = (0,0)
-            with clients_lock: px, py = clients[addr]["pos"]
+            px, py = client.pos
+            alvo = treasures.nearest(client.pos) # o tesouro mais perto do jogador
 
-            if current_treasure:
-                tx, ty = current_treasure
+            if alvo:
+                tx, ty = alvo
                 # Pega a direção e a distância calculada
                 sug, dist = get_suggestion_text(px, py, tx, ty)
                 if sug:
@@ -308,73 +573,128 @@ def handle_msg(addr, msg):
             else:
                 reliable_send(addr, "ERRO: Jogo não iniciado.")
 
-    except Exception as e:
-        print(f"Erro processando msg de {addr}: {e}")
-        traceback.print_exc()
+    except Exception:
+        log.exception("Erro processando msg de %s", addr)
 
-def broadcast(msg):
-    targets = []
-    with clients_lock:
-        targets = [addr for addr, c in clients.items() if c["online"]]
+def broadcast(msg, perto=None):
+    # Com RAIO_INTERESSE, um aviso sobre a posição `perto` só vai para quem está perto dela
+    if perto is None or RAIO_INTERESSE is None:
+        targets = list(online)
+    else:
+        targets = [c.addr for c in players.near(perto, RAIO_INTERESSE)]
     
-    print(f"[BROADCAST] {msg}")
+    log_event(log, INFO, "broadcast", "[BROADCAST] %(msg)s", msg=msg, clientes=len(targets))
+    fragmentos = fragment(msg)
     for t in targets:
-        # Manda em thread separada pra não travar o loop principal se um cliente demorar
-        threading.Thread(target=reliable_send, args=(t, msg), daemon=True).start()
+        # Só enfileira: um cliente lento não atrasa os outros nem o loop principal
+        reliable_send(t, msg, fragmentos)
 
 def reset_game_state():
-    global current_treasure
-    while True:
-        tx = random.randint(1, GRID_W)
-        ty = random.randint(1, GRID_H)
-        if (tx, ty) != START_POS:
-            current_treasure = (tx, ty)
-            break
+    treasures.clear()
+    while len(treasures) < NUM_TESOUROS:
+        pos = free_cell()
+        treasures.add(pos, pos)
     
-    with clients_lock:
-        for c in clients.values():
-            c["pos"] = START_POS
-            c["hint_used"] = False
-            c["suggest_used"] = False
-            c["last_command"] = None
-
-def game_loop():
+    for c in clients.values():
+        c.hint_used = False
+        c.suggest_used = False
+        c.last_command = None
+        c.sincronizado = False # partida nova: todos recebem o estado completo na próxima rodada
+    players.clear()
+    for c in online.values():
+        c.pos = spawn_pos()
+        players.add(c, c.pos)
+
+def send_round_result(jogadores, eventos, achados, vencedores, fim):
+    """
+    O resultado da rodada, numa mensagem só para cada jogador: quem já tem o
+    estado do jogo recebe só as mudanças (eventos e, se mudou, o placar);
+    quem acabou de entrar, ou perdeu mensagens, recebe também o estado
+    completo. `eventos` são (posição, texto); com RAIO_INTERESSE cada jogador
+    só recebe os eventos e os jogadores perto dele. `achados` (os tesouros
+    encontrados) vão para todos.
+    """
+    cabecalho = [f"[Servidor] Resultado da rodada {round_num}:"]
+    rodape = [f"  {m}" for m in achados]
+    final = ["  Nova partida em 5 segundos..."] if fim else []
+
+    if RAIO_INTERESSE is None:
+        # Todos recebem a mesma mensagem: monta e fragmenta uma vez (e outra com o estado completo)
+        mudancas = cabecalho + [f"  {texto}" for _, texto in eventos] + rodape
+        if vencedores:
+            mudancas.append(f"  Placar atual: {player_scores}")
+        completo = list(mudancas)
+        if jogadores:
+            completo.append("  Estado atual: " + ", ".join(f"{c.name}{c.pos}" for c in jogadores))
+        if not vencedores:
+            completo.append(f"  Placar atual: {player_scores}")
+        mudancas, completo = "\n".join(mudancas + final), "\n".join(completo + final)
+        log_event(log, INFO, "resultado", "%(msg)s", msg=completo, bytes=len(completo))
+        fragmentos = {False: fragment(completo), True: fragment(mudancas)}
+        for c in jogadores:
+            reliable_send(c.addr, None, fragmentos[c.sincronizado])
+            c.sincronizado = True
+        return
+
+    # Eventos indexados pela posição: cada jogador só olha as células em volta dele
+    indice = SpatialHash()
+    for i, (pos, _) in enumerate(eventos):
+        indice.add(i, pos)
+    placar_vencedores = {nome: player_scores[nome] for nome in vencedores}
+    tamanho = 0
+    for c in jogadores:
+        linhas = cabecalho + [f"  {eventos[i][1]}" for i in sorted(indice.near(c.pos, RAIO_INTERESSE))] + rodape
+        if vencedores:
+            linhas.append(f"  Placar atual: {placar_vencedores}")
+        if not c.sincronizado:
+            vizinhos = list(players.near(c.pos, RAIO_INTERESSE))
+            linhas.append("  Estado atual: " + ", ".join(f"{v.name}{v.pos}" for v in vizinhos))
+            if not vencedores:
+                linhas.append(f"  Placar atual: { {v.name: player_scores[v.name] for v in vizinhos} }")
+        msg = "\n".join(linhas + final)
+        tamanho += len(msg)
+        reliable_send(c.addr, msg)
+        c.sincronizado = True
+    log_event(log, INFO, "resultado", "[Servidor] Resultado da rodada %(rodada)d: %(eventos)d eventos, %(bytes)d bytes para %(jogadores)d jogadores",
+              rodada=round_num, eventos=len(eventos), bytes=tamanho, jogadores=len(jogadores))
+
+async def game_loop():
     global round_num
     round_num = 0
     reset_game_state()
     
-    print("[JOGO] Loop iniciado.")
-    while running:
+    log_event(log, INFO, "jogo", "[JOGO] Loop iniciado.")
+    while True:
         round_num += 1
-        print(f"\n>>> RODADA {round_num} (Tesouro em {current_treasure})")
+        inicio_rodada = time.monotonic()
+        log_event(log, INFO, "rodada", "\n>>> RODADA %(rodada)d (Tesouros: %(tesouros)s)", rodada=round_num,
+                  tesouros=sorted(treasures) if len(treasures) <= 5 else len(treasures))
         
-        with clients_lock:
-            for c in clients.values(): c["last_command"] = None
+        evict_idle()
+        for c in online.values(): c.last_command = None
         
         # Avisa inicio da rodada
         broadcast(f"[Servidor] Início da rodada {round_num}! Envie seu movimento em {ROUND_TIME} segundos.")
         
-        time.sleep(ROUND_TIME)
+        await asyncio.sleep(ROUND_TIME)
         
-        broadcast("[Servidor] Calculando resultados...")
-        
-        msgs_log = []
+        eventos = [] # (posição, texto): com RAIO_INTERESSE, cada evento só vai para quem está perto dele
         winners = []
         
-        active_players = []
-        with clients_lock:
-            active_players = [(addr, c) for addr, c in clients.items() if c["online"]]
+        # Cópia dos jogadores do fim da rodada: quem entrar ou sair enquanto o
+        # resultado é calculado e enviado fica para a próxima
+        active_players = list(online.values())
         
-        for addr, client in active_players:
-            cmd = client["last_command"]
+        for client in active_players:
+            cmd = client.last_command
             
             if not cmd:
-                msgs_log.append(f"{client['name']} não enviou comando e foi eliminado desta rodada.")
+                eventos.append((client.pos, f"{client.name} não enviou comando e foi eliminado desta rodada."))
                 continue
             
             if cmd.startswith("move"):
                 _, d = cmd.split()
-                px, py = client["pos"]
+                px, py = client.pos
                 nx, ny = px, py
                 
                 if d == "up": ny += 1
@@ -383,49 +703,60 @@ def game_loop():
                 elif d == "left": nx -= 1
                 
                 if not (1 <= nx <= GRID_W and 1 <= ny <= GRID_H):
-                    msgs_log.append(f"{client['name']} bateu na parede em {client['pos']}.")
+                    eventos.append((client.pos, f"{client.name} bateu na parede em {client.pos}."))
+                elif (nx, ny) in obstacles:
+                    eventos.append((client.pos, f"{client.name} bateu num obstáculo em ({nx}, {ny})."))
                 else:
-                    with clients_lock:
-                        clients[addr]["pos"] = (nx, ny)
-                    msgs_log.append(f"{client['name']} moveu para ({nx}, {ny}).")
+                    client.pos = (nx, ny)
+                    players.move(client, client.pos)
+                    eventos.append((client.pos, f"{client.name} moveu para ({nx}, {ny})."))
                     
-                    if (nx, ny) == current_treasure:
-                        winners.append((addr, client["name"]))
-
-        # Mostra onde todo mundo está
-        with clients_lock:
-            status_list = [f"{c['name']}{c['pos']}" for a, c in clients.items() if c["online"]]
-        
-        if status_list:
-            broadcast("[Servidor] Estado atual: " + ", ".join(status_list))
-        
-        for m in msgs_log:
-            broadcast(f"[Servidor] {m}")
-
-        if not winners: 
-            broadcast(f"[Servidor] Placar atual: {player_scores}")
-
-        if winners:
-            for w_addr, w_name in winners:
-                msg_win = f"O jogador <{w_name}:{w_addr[1]}> encontrou o tesouro na posição {current_treasure}!"
-                broadcast(msg_win)
-                player_scores[w_name] += 1
-                broadcast(f"[Servidor] Placar atual: {player_scores}")
-            
-            broadcast("[Servidor] Nova partida em 5 segundos...")
-            time.sleep(5)
+                    if client.pos in treasures:
+                        winners.append((client.addr, client.name, client.pos))
+
+        achados = []
+        for w_addr, w_name, pos in winners:
+            achados.append(f"O jogador <{w_name}:{w_addr[1]}> encontrou o tesouro na posição {pos}!")
+            player_scores[w_name] += 1
+        for _, _, pos in winners:
+            if pos in treasures: # dois jogadores no mesmo tesouro: os dois pontuam
+                treasures.remove(pos)
+        fim = bool(winners) and not treasures
+
+        send_round_result(active_players, eventos, achados, [w_name for _, w_name, _ in winners], fim)
+
+        if fim:
+            await asyncio.sleep(5)
             reset_game_state()
+
+        DURACAO_RODADA.record(time.monotonic() - inicio_rodada)
+
+async def main():
+    loop = asyncio.get_running_loop()
+    open_socket()
+    # Um receptor só, chamado pelo laço quando chegam datagramas
+    build_world()
+    loop.add_reader(server.fileno(), receive_packets)
+    log_event(log, INFO, "receptor", "[RDT] Receptor RDT iniciado.")
+    try:
+        await game_loop()
+    finally:
+        loop.remove_reader(server.fileno())
+        server.close()
         
 
 if __name__ == "__main__":
-    t_recv = threading.Thread(target=receiver_thread, daemon=True)
-    t_recv.start()
-    t_game = threading.Thread(target=game_loop, daemon=True)
-    t_game.start()
+    configure(NIVEL_LOG, FORMATO_LOG)
+    if PORTA_METRICAS is not None:
+        try:
+            MetricsServer(PORTA_METRICAS)
+            log_event(log, INFO, "metricas", "Métricas em http://127.0.0.1:%(porta)d/metrics (e UDP na mesma porta).",
+                      porta=PORTA_METRICAS)
+        except OSError as e:
+            log_event(log, WARNING, "metricas", "Métricas desligadas: porta %(porta)d indisponível (%(erro)s).",
+                      porta=PORTA_METRICAS, erro=str(e))
     
     try:
-        while True: time.sleep(1)
+        asyncio.run(main())
     except KeyboardInterrupt:
-        running = False
-        server.close()
-        print("Servidor encerrado.")
\ No newline at end of file
+        print("Servidor encerrado.")
@@ -1,38 +1,39 @@
+import json
 import socket
-import time
 import os
-import random
+import sys
+import time
+
+## Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.rto import RttEstimator
+from rdt.window import send_window, recv_window, new_session_id, MODO_GBN, MODO_SR
+from rdt.pmtu import BLOCO_BASE, BLOCO_MAXIMO
+from rdt.log import configure
+from rdt.metrics import REGISTRO
+from rdt.verify import (StreamingDigest, recv_report, repair_ranges, VERIFICACAO_ECO, VERIFICACAO_RESUMO,
+                        ALGORITMO, TAMANHO_FAIXA)
+from rdt.parallel import send_parallel
+from rdt.delta import send_delta
+from rdt.batch import send_batch
 
 ##Configurações RDT 3.0
-TIMEOUT = 2.0 
+TIMEOUT = 1.0 ## RTO inicial; depois o timeout se ajusta ao RTT medido
 PROB_PERDA = 0.2 
-ACK0 = b'ACK0'
-ACK1 = b'ACK1'
-BUFFER_SIZE = 1024 
-
-##Funções Auxiliares RDT 3.0
-def make_pkt(seq_num, data):
-    """Cria um pacote RDT com cabeçalho de número de sequência."""
-    return str(seq_num).encode() + b'|' + data
-
-def extract_pkt(packet):
-    """Extrai o número de sequência e os dados de um pacote RDT."""
-    separator_index = packet.find(b'|')
-    if separator_index == -1: return -1, packet
-    try:
-        seq_num = int(packet[:separator_index].decode())
-        data = packet[separator_index + 1:]
-        return seq_num, data
-    except ValueError:
-        return -2, packet 
-
-def make_ack(seq_num):
-    """Cria uma mensagem ACK para o número de sequência especificado."""
-    return (ACK0 if seq_num == 0 else ACK1)
-
-def simulate_loss():
-    """Simula a perda de um pacote com base na PROB_PERDA."""
-    return random.random() < PROB_PERDA
+BLOCO = BLOCO_MAXIMO ## maior payload proposto (até ~64 KB); o caminho é sondado e o servidor pode reduzir. BLOCO_BASE = 1024 bytes, sem sondar
+BUFFER_RECEPCAO = 4 * 1024 * 1024 ## buffer de recepção pedido ao SO; a janela anunciada no retorno é quantos blocos cabem nele
+MODO = MODO_SR ## MODO_GBN (Go-Back-N) ou MODO_SR (Selective Repeat), informado ao servidor no SYN
+TAMANHO_JANELA = 64 ## máximo de pacotes em trânsito (a janela efetiva segue o congestionamento e o receptor), informado ao servidor no SYN
+FEC = 0 ## blocos por grupo de correção de erros (ex.: 16, só no SR): cada grupo leva pacotes de reparo, em número que acompanha a perda medida, e o receptor reconstrói blocos perdidos sem esperar retransmissão. 0 desliga
+FLUXOS = 1 ## fluxos paralelos (rdt/parallel.py): o arquivo é dividido em faixas, cada uma enviada por um processo com o seu socket, e o servidor junta as faixas pela posição. 0 = automático (um por núcleo, faixas de pelo menos 8 MB)
+COMPRESSAO = 0 ## nível do zlib (1 a 9) para comprimir cada bloco, nos dois sentidos; blocos que não comprimem (JPEG, ZIP...) são detectados e vão como estão. 0 desliga
+DELTA = False ## True: se o servidor já tem uma versão do arquivo, envia só as diferenças (rdt/delta.py, como o rsync). Só com FLUXOS = 1
+LOTE = None ## um diretório (ex.: "fotos") ou uma lista de arquivos: todos vão numa sessão só, em vez de caminho_arquivo (rdt/batch.py). Arquivos pequenos dividem os mesmos pacotes, e o resultado sai por arquivo
+VERIFICACAO = VERIFICACAO_ECO ## VERIFICACAO_ECO: o servidor devolve o arquivo inteiro; VERIFICACAO_RESUMO: devolve só o hash (BLAKE2b) do arquivo e de cada faixa
+NIVEL_LOG = "INFO" ## "DEBUG" mostra cada pacote e cada ACK (bem mais lento com arquivos grandes)
+FORMATO_LOG = "texto" ## "texto" ou "json" (uma linha por evento, com os campos separados)
+LOG_POR_SEGUNDO = None ## com NIVEL_LOG = "DEBUG", limita os eventos por pacote a tantos por segundo
+ARQUIVO_METRICAS = None ## ex.: "metricas.json": ao terminar, grava as métricas da transferência (RTT, retransmissões, janela...)
 
 caminho_arquivo = "mapa_westeros.jpg" ## caminho do arquivo que vai ser enviado, deve estar na pasta UDP
 
@@ -40,111 +41,126 @@ caminho_arquivo = "mapa_westeros.jpg" ## caminho do arquivo que vai ser enviado,
 #O nome do arquivo de retorno será "devolvido_" + nome do arquivo original e sera salvo na pasta "armazenamento_cliente"
 ARQUIVO_FINAL = os.path.join("armazenamento_cliente", "devolvido_" + os.path.basename(caminho_arquivo))
 
+configure(NIVEL_LOG, FORMATO_LOG, por_segundo=LOG_POR_SEGUNDO)
+
 #Cria um objeto socket para o cliente
 cliente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+cliente.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_RECEPCAO)
 end_servidor =  ("127.0.0.1", 5000) #Define o endereço (IP e porta) do servidor para onde os dados serão enviados."127.0.0.1" é o localhost, que é a própria máquina
-
-#Envia o nome/extensão do arquivo para o servidor
-print("Enviando nome/extensão do arquivo para o servidor...")
-cliente.sendto(caminho_arquivo.encode(), end_servidor)
+rto = RttEstimator(TIMEOUT) ##Mede o RTT até o servidor; é reaproveitado no envio e no retorno
+sessao = new_session_id() ##Identifica esta transferência no servidor, que atende vários clientes na mesma porta
 
 #Obtém o tamanho do arquivo a ser enviado
-tamanho_arquivo = os.path.getsize(caminho_arquivo)
-print(f"Enviando tamanho do arquivo: {tamanho_arquivo} bytes")
-cliente.sendto(str(tamanho_arquivo).encode(), end_servidor)
-
-print(f"Enviando arquivo em pacotes de 1024 bytes para o servidor...")
-
-pacotes_enviados = 0
-total_enviado = 0
-next_seq_num_send = 0
-
-with open(caminho_arquivo, "rb") as arquivo:
-    ##Loop para ler o arquivo em pedaços de 1024 bytes e enviar cada pedaço ao servidor
-    while True:
-        #Lê até 1024 bytes do arquivo
-        dados = arquivo.read(1024)
-        #Se read() retornar bytes vazios, significa que chegou ao fim do arquivo e então sai do loop
-        if not dados:
-            break
-        while True:
-            pkt = make_pkt(next_seq_num_send, dados)
+info_arquivo = os.stat(caminho_arquivo)
+tamanho_arquivo = info_arquivo.st_size
+##O nome/extensão e o tamanho do arquivo vão no SYN que abre a sessão. O `id` (tamanho + data de
+##modificação) deixa o servidor retomar um envio interrompido deste mesmo arquivo
+metadados = {"nome": caminho_arquivo, "tamanho": tamanho_arquivo,
+             "id": f"{tamanho_arquivo}-{info_arquivo.st_mtime_ns}"}
+resumo = None
+if VERIFICACAO == VERIFICACAO_RESUMO:
+    ##O hash é calculado enquanto o arquivo é enviado; o servidor calcula o dele enquanto recebe
+    metadados.update(verificacao=VERIFICACAO_RESUMO, algoritmo=ALGORITMO, faixa=TAMANHO_FAIXA)
+    resumo = StreamingDigest(ALGORITMO, TAMANHO_FAIXA)
+if LOTE is not None:
+    ##Modo lote: o manifesto (nomes e tamanhos) e os conteúdos vão um atrás do outro na mesma
+    ##sessão, e o retorno (eco ou hashes) vem arquivo por arquivo
+    print(f"Abrindo sessão {sessao}: lote {LOTE}")
+    comeco = time.monotonic()
+    try:
+        pacotes_enviados, total_enviado, retransmissoes, arquivos = send_batch(
+            cliente, end_servidor, LOTE, sessao=sessao, rto=rto, prob_perda=PROB_PERDA, verificacao=VERIFICACAO,
+            retorno="armazenamento_cliente", modo=MODO, tamanho_janela=TAMANHO_JANELA, bloco=BLOCO, fec=FEC,
+            compressao=COMPRESSAO)
+    except ConnectionRefusedError as erro:
+        print(f"Servidor recusou a transferência: {erro}")
+        cliente.close()
+        sys.exit(1)
+    segundos = time.monotonic() - comeco
+    for arquivo in arquivos:
+        print(f"  {arquivo['nome']} ({arquivo['tamanho']} bytes): {'ok' if arquivo['ok'] else arquivo['erro']}")
+    integros = sum(arquivo["ok"] for arquivo in arquivos)
+    print(f"Lote concluído: {integros} de {len(arquivos)} arquivos íntegros, {pacotes_enviados} pacotes, "
+          f"{retransmissoes} retransmissões, em {segundos:.2f}s ({len(arquivos) / segundos:.0f} arquivos/s).")
+elif FLUXOS != 1:
+    ##Modo paralelo: cada faixa do arquivo vai numa sessão própria, num processo próprio,
+    ##e o retorno de cada faixa é gravado na posição dela em ARQUIVO_FINAL
+    print(f"Enviando '{caminho_arquivo}', {tamanho_arquivo} bytes, em fluxos paralelos...")
+    try:
+        fluxos = send_parallel(end_servidor, caminho_arquivo, metadados, FLUXOS,
+                               retorno=ARQUIVO_FINAL if resumo is None else None, rto_inicial=TIMEOUT,
+                               prob_perda=PROB_PERDA, modo=MODO, tamanho_janela=TAMANHO_JANELA, bloco=BLOCO, fec=FEC,
+                               compressao=COMPRESSAO)
+    except ConnectionRefusedError as erro:
+        print(f"Servidor recusou a transferência: {erro}")
+        cliente.close()
+        sys.exit(1)
+    for fluxo in fluxos:
+        print(f"Fluxo {fluxo['fluxo']}: bytes {fluxo['inicio']} a {fluxo['inicio'] + fluxo['tamanho']}, "
+              f"{fluxo['pacotes']} pacotes, {fluxo['retransmissoes']} retransmissões em {fluxo['segundos']:.2f}s.")
+    if resumo is not None:
+        ##Cada fluxo conferiu os hashes da sua faixa; as erradas são reenviadas agora, com todos os fluxos encerrados
+        diferentes = [fluxo for fluxo in fluxos if fluxo["remoto"].get("resumo") != fluxo["local"]["resumo"]]
+        erradas = []
+        with open(caminho_arquivo, "rb") as arquivo:
+            for fluxo in diferentes:
+                erradas += repair_ranges(cliente, end_servidor, arquivo, metadados, fluxo["local"], fluxo["remoto"],
+                                         rto=rto, prob_perda=PROB_PERDA, base=fluxo["inicio"], modo=MODO,
+                                         tamanho_janela=TAMANHO_JANELA, bloco=BLOCO, fec=FEC, compressao=COMPRESSAO)
+        if erradas:
+            print(f"Resumo não confere: {len(erradas)} faixas continuam diferentes depois do reparo.")
+        elif diferentes:
+            print("Resumo não conferia: as faixas diferentes foram reenviadas e agora conferem.")
+        else:
+            print(f"Resumo {ALGORITMO} confere nos {len(fluxos)} fluxos: o servidor recebeu o arquivo íntegro.")
+    else:
+        print(f"Arquivo recebido salvo como {ARQUIVO_FINAL} ({sum(fluxo['devolvido'] for fluxo in fluxos)} bytes em {len(fluxos)} fluxos).")
+else:
+    print(f"Abrindo sessão {sessao}: '{caminho_arquivo}', {tamanho_arquivo} bytes")
+
+    print(f"Enviando arquivo em pacotes de até {BLOCO} bytes para o servidor...")
 
-            if simulate_loss():
-                print(f"  [SIMULAÇÃO] Pacote {next_seq_num_send} PERDIDO no envio.")
+    try:
+        with open(caminho_arquivo, "rb") as arquivo:
+            ##Envia o arquivo em pacotes de até BLOCO bytes, mantendo até TAMANHO_JANELA pacotes em trânsito
+            enviar = send_delta if DELTA else send_window
+            pacotes_enviados, total_enviado, retransmissoes = enviar(
+                cliente, end_servidor, arquivo, metadados, sessao, modo=MODO, tamanho_janela=TAMANHO_JANELA,
+                rto=rto, prob_perda=PROB_PERDA, resumo=resumo, bloco=BLOCO, fec=FEC,
+                compressao=COMPRESSAO) ## o ritmo de envio vem do controle de congestionamento
+    except ConnectionRefusedError as erro:
+        ##Ex.: outro cliente já está enviando um arquivo com o mesmo nome
+        print(f"Servidor recusou a transferência: {erro}")
+        cliente.close()
+        sys.exit(1)
+    print(f"Envio concluído ({pacotes_enviados} pacotes, {total_enviado} bytes, {retransmissoes} retransmissões). Aguardando retorno do servidor...")
+
+    if resumo is not None:
+        ##O servidor responde na mesma sessão com o relatório de hashes, no lugar do eco
+        local = resumo.relatorio
+        remoto = recv_report(cliente, sessao, rto=rto, prob_perda=PROB_PERDA)
+        if remoto.get("resumo") == local["resumo"]:
+            print(f"Resumo {local['algoritmo']} confere ({local['resumo'][:16]}...): o servidor recebeu o arquivo íntegro.")
+        else:
+            ##Os hashes por faixa apontam os trechos errados; só eles são reenviados
+            with open(caminho_arquivo, "rb") as arquivo:
+                erradas = repair_ranges(cliente, end_servidor, arquivo, metadados, local, remoto, rto=rto,
+                                        prob_perda=PROB_PERDA, modo=MODO, tamanho_janela=TAMANHO_JANELA, bloco=BLOCO, fec=FEC,
+                                        compressao=COMPRESSAO)
+            if erradas:
+                print(f"Resumo não confere: as faixas {erradas} continuam diferentes depois do reparo.")
             else:
-                cliente.sendto(pkt, end_servidor)
-                print(f"  [REMETENTE] Enviado pacote **{next_seq_num_send}**.")
-
-            try:
-                ack_bytes, _ = cliente.recvfrom(1024)
-                ack = ack_bytes.decode()
-
-                if ack == f'ACK{next_seq_num_send}':
-                    print(f"  [REMETENTE] ACK {next_seq_num_send} recebido. Pacote aceito.")
-                    next_seq_num_send = 1 - next_seq_num_send
-                    break
-                else:
-                    print(f"  [REMETENTE] ACK duplicado/errado ({ack}) recebido. Reenviando...")
-            
-            except socket.timeout:
-                print(f"  [REMETENTE] Timeout para pacote {next_seq_num_send}. **Reenviando**...")
-                continue
-        pacotes_enviados += 1 #contadores
-        total_enviado += len(dados)
-        time.sleep(0.001) ## adicionado um delayzinho para evitar perda de pacotes, devido a rapidez do envio
-print(f"Envio concluído ({pacotes_enviados} pacotes, {total_enviado} bytes). Aguardando confirmação do servidor...")
-
-total_recebido = 0
-pacotes_recebidos = 0
-expected_seq_num_recv = 0
-
-print("Aguardando confirmação de tamanho do servidor...")
-tamanho_retorno_bytes, _ = cliente.recvfrom(1024)
-tamanho_retorno_esperado = int(tamanho_retorno_bytes.decode())
-print(f"Servidor confirmou. Recebendo mensagem de {tamanho_retorno_esperado} bytes...")
-
-with open(ARQUIVO_FINAL, "wb") as arquivo_recebido:
-    ##Loop para receber os pacotes de volta do servidor
-    while total_recebido < tamanho_retorno_esperado:
-        try:
-            ##Recebe pacotes de até 1024 bytes do servido
-            pacotes_retorno, _ = cliente.recvfrom(1024 + 5)
-            
-            seq_num_recebido, dados = extract_pkt(pacotes_retorno)
-
-            if seq_num_recebido == expected_seq_num_recv:
-                print(f"  [RECEPTOR] Recebido pacote **{seq_num_recebido}** (esperado).")
-
-                ##Escreve os dados recebidos no arquivo de retorno
-                arquivo_recebido.write(dados)
-                total_recebido += len(dados) ##Contadores
-                pacotes_recebidos += 1
-
-                ack_para_enviar = make_ack(expected_seq_num_recv)
-                if simulate_loss():
-                    print(f"  [SIMULAÇÃO] ACK {expected_seq_num_recv} PERDIDO no envio.")
-                else:
-                    cliente.sendto(ack_para_enviar, end_servidor)
-                    print(f"  [RECEPTOR] Enviado ACK **{expected_seq_num_recv}**.")
-                
-                expected_seq_num_recv = 1 - expected_seq_num_recv
-
-            elif seq_num_recebido != -1:
-                print(f"  [RECEPTOR] Recebido pacote {seq_num_recebido} (duplicado/fora de ordem). Rejeitado.")
-                ack_para_reenviar = make_ack(1 - expected_seq_num_recv)
-                if simulate_loss():
-                    print(f"  [SIMULAÇÃO] ACK {1 - expected_seq_num_recv} (Duplicado) PERDIDO no envio.")
-                else:
-                    cliente.sendto(ack_para_reenviar, end_servidor)
-                    print(f"  [RECEPTOR] Reenviado ACK **{1 - expected_seq_num_recv}** (confirmando o anterior).")
-        
-        except socket.timeout:
-            continue
-        except Exception as e:
-            print(f"  [RECEPTOR] Erro inesperado: {e}")
-            break   
-print(f"Arquivo recebido salvo como {ARQUIVO_FINAL} ({total_recebido} bytes em {pacotes_recebidos} pacotes)." )
+                print("Resumo não conferia: as faixas diferentes foram reenviadas e agora conferem.")
+    else:
+        with open(ARQUIVO_FINAL, "wb") as arquivo_recebido:
+            ##O servidor abre a volta com um SYN da mesma sessão, que informa o tamanho do retorno
+            total_recebido, pacotes_recebidos, _, _ = recv_window(
+                cliente, arquivo_recebido, sessao, rto=rto, prob_perda=PROB_PERDA)
+        print(f"Arquivo recebido salvo como {ARQUIVO_FINAL} ({total_recebido} bytes em {pacotes_recebidos} pacotes)." )
+
+if ARQUIVO_METRICAS is not None:
+    with open(ARQUIVO_METRICAS, "w") as f:
+        json.dump(REGISTRO.json(), f, indent=2)
 
 #Fecha o socket do cliente
 cliente.close()
\ No newline at end of file
@@ -1,6 +1,16 @@
 import socket
-import time
 import os
+import sys
+
+## Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.pacer import TokenBucket
+from rdt.buffers import map_file
+
+TAXA_ENVIO = 10 * 1024 * 1024 ## taxa máxima de envio em bytes/s (sem ACKs, o UDP puro não tem como medir o caminho)
+RAJADA = 64 * 1024 ## quantos bytes podem sair de uma vez, sem esperar o pacer
+BUFFER_RECEPCAO = 4 * 1024 * 1024 ## buffer de recepção pedido ao SO para absorver rajadas
+TAMANHO_PACOTE = 1024 ## bytes de arquivo por datagrama (até 65507); o servidor devolve no mesmo tamanho. Sem retransmissão, cada datagrama perdido custa o pacote inteiro
 
 caminho_arquivo = "mapa_westeros.jpg" ## caminho do arquivo que vai ser enviado, deve estar na pasta UDP
 
@@ -10,6 +20,8 @@ ARQUIVO_FINAL = os.path.join("armazenamento_cliente", "devolvido_" + os.path.bas
 
 #Cria um objeto socket para o cliente
 cliente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+cliente.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_RECEPCAO)
+pacer = TokenBucket(TAXA_ENVIO, RAJADA) ##Espaça os envios para não estourar o buffer do servidor
 end_servidor =  ("127.0.0.1", 5000) #Define o endereço (IP e porta) do servidor para onde os dados serão enviados."127.0.0.1" é o localhost, que é a própria máquina
 
 #Envia o nome/extensão do arquivo para o servidor
@@ -21,24 +33,35 @@ tamanho_arquivo = os.path.getsize(caminho_arquivo)
 print(f"Enviando tamanho do arquivo: {tamanho_arquivo} bytes")
 cliente.sendto(str(tamanho_arquivo).encode(), end_servidor)
 
-print(f"Enviando arquivo em pacotes de 1024 bytes para o servidor...")
+print(f"Enviando arquivo em pacotes de {TAMANHO_PACOTE} bytes para o servidor...")
 
 pacotes_enviados = 0
 total_enviado = 0
 
 with open(caminho_arquivo, "rb") as arquivo:
-    ##Loop para ler o arquivo em pedaços de 1024 bytes e enviar cada pedaço ao servidor
+    ##O arquivo é mapeado em memória e cada pacote é uma fatia do mapa, sem copiar os bytes;
+    ##se não der para mapear (arquivo vazio), lê com readinto num buffer fixo
+    mapa = map_file(arquivo)
+    fonte = memoryview(mapa) if mapa is not None else None
+    bloco = memoryview(bytearray(TAMANHO_PACOTE))
+    ##Loop para enviar o arquivo ao servidor em pedaços de TAMANHO_PACOTE bytes
     while True:
-        #Lê até 1024 bytes do arquivo
-        dados = arquivo.read(1024)
-        #Se read() retornar bytes vazios, significa que chegou ao fim do arquivo e então sai do loop
+        if fonte is not None:
+            dados = fonte[total_enviado:total_enviado + TAMANHO_PACOTE]
+        else:
+            dados = bloco[:arquivo.readinto(bloco)]
+        #Pedaço vazio significa que chegou ao fim do arquivo e então sai do loop
         if not dados:
             break
-        #Envia os dados lidos para o endereço do servidor.
+        #Espera o pacer liberar e envia os dados lidos para o endereço do servidor.
+        pacer.wait(len(dados))
         cliente.sendto(dados, end_servidor)
         pacotes_enviados += 1 #contadores
         total_enviado += len(dados)
-        time.sleep(0.001) ## adicionado um delayzinho para evitar perda de pacotes, devido a rapidez do envio
+    del dados
+    if fonte is not None:
+        fonte.release() ##o mmap só fecha depois que nenhuma fatia aponta para ele
+        mapa.close()
 print(f"Envio concluído ({pacotes_enviados} pacotes, {total_enviado} bytes). Aguardando confirmação do servidor...")
 
 total_recebido = 0
@@ -49,15 +72,17 @@ tamanho_retorno_bytes, _ = cliente.recvfrom(1024)
 tamanho_retorno_esperado = int(tamanho_retorno_bytes.decode())
 print(f"Servidor confirmou. Recebendo mensagem de {tamanho_retorno_esperado} bytes...")
 
+buffer = bytearray(TAMANHO_PACOTE) ##um só buffer para todos os pacotes: recv_into não aloca nada
+view = memoryview(buffer)
 with open(ARQUIVO_FINAL, "wb") as arquivo_recebido:
     ##Loop para receber os pacotes de volta do servidor
     while total_recebido < tamanho_retorno_esperado:
-        ##Recebe pacotes de até 1024 bytes do servidor, p segundo variável endereco_cliente não é necessária aqui
-        pacotes_retorno, _ = cliente.recvfrom(1024)
-        ##Escreve os dados recebidos no arquivo de retorno
-        arquivo_recebido.write(pacotes_retorno)
-        total_recebido += len(pacotes_retorno) ##Contadores
-        pacotes_recebidos += 1   
+        ##Recebe pacotes de até TAMANHO_PACOTE bytes do servidor direto no buffer
+        n = cliente.recv_into(buffer)
+        ##Escreve os dados recebidos no arquivo de retorno antes do próximo pacote sobrescrever o buffer
+        arquivo_recebido.write(view[:n])
+        total_recebido += n ##Contadores
+        pacotes_recebidos += 1
 print(f"Arquivo recebido salvo como {ARQUIVO_FINAL} ({total_recebido} bytes em {pacotes_recebidos} pacotes)." )
 
 #Fecha o socket do cliente
@@ -1,67 +1,212 @@
+import asyncio
 import socket
-import time
 import os
+import sys
+
+## Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.pacer import TokenBucket
+from rdt.buffers import map_file
+from rdt.cache import ChunkCache
+from rdt.log import configure, get_logger, log_event, INFO, WARNING
+
+TAXA_ENVIO = 10 * 1024 * 1024 ## taxa máxima de envio em bytes/s por cliente (sem ACKs, o UDP puro não tem como medir o caminho)
+RAJADA = 64 * 1024 ## quantos bytes podem sair de uma vez, sem esperar o pacer
+BUFFER_RECEPCAO = 8 * 1024 * 1024 ## buffer de recepção pedido ao SO, dividido entre todos os clientes
+TAMANHO_MAXIMO = 65507 ## maior datagrama UDP sobre IPv4: o buffer de recepção comporta qualquer tamanho de pacote do cliente
+MEMORIA_CACHE = 64 * 1024 * 1024 ## bytes dos arquivos recebidos guardados em memória para o eco, sem reler o disco (os mais antigos saem primeiro); 0 desliga
+TEMPO_OCIOSO = 10.0 ## um cliente sem enviar nada por esse tempo tem a sessão descartada
+PORTA = 5000
+NIVEL_LOG = "INFO" ## "WARNING" mostra só sessões descartadas
+FORMATO_LOG = "texto" ## "texto" ou "json" (uma linha por evento, com os campos separados)
 
 #ARQUIVO_RECEBIDO = "arquivo_recebido.bin"
 
-##Cria um objeto socket para o servidor UDP
-servidor = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-servidor.bind(("0.0.0.0", 5000))##Bind o socket a todas as interfaces de rede na porta 5000
+##O UDP puro não tem cabeçalho, então cada cliente é identificado pelo seu endereço (IP, porta):
+##os datagramas de um endereço vão para a sessão dele, que segue o protocolo de sempre
+##(nome -> tamanho -> dados -> devolução). Todos os datagramas são lidos com recvfrom_into
+##num único buffer, e os dados vão direto dele para o arquivo, sem criar um bytes por pacote.
+sessoes = {} ## endereço do cliente -> Sessao
+arquivos_em_uso = set() ## caminhos sendo gravados agora, para dois clientes não escreverem no mesmo arquivo
+tarefas = set() ## o laço só guarda referências fracas às tarefas, então elas ficam aqui enquanto rodam
+cache = ChunkCache(MEMORIA_CACHE) if MEMORIA_CACHE else None ## cada pacote recebido, pela posição no arquivo (rdt/cache.py)
+log = get_logger("udp.server")
+
+
+class Sessao:
+    """Recebe um arquivo de `endereco_cliente` e devolve o mesmo arquivo."""
 
-print("Aguardando nome do arquivo...")
+    def __init__(self, sock, endereco_cliente):
+        self.sock = sock
+        self.endereco_cliente = endereco_cliente
+        self.nome_arquivo = None
+        self.tamanho_esperado = None
+        self.ARQUIVO_RECEBIDO = None
+        self.arquivo_recebido = None
+        self.total_bytes = 0
+        self.bloco = 1024 ## o eco usa o tamanho dos pacotes do cliente (o maior recebido)
+        self.loop = asyncio.get_running_loop()
+        self.ocioso = None
+        self._rearmar()
 
-##Recebe o nome(extensão) do arquivo do cliente
-nome_arquivo_bytes, endereco_cliente = servidor.recvfrom(1024)
-nome_arquivo = nome_arquivo_bytes.decode()
+    def _rearmar(self):
+        ##Desiste da sessão se o cliente ficar TEMPO_OCIOSO segundos sem enviar nada
+        if self.ocioso is not None:
+            self.ocioso.cancel()
+        self.ocioso = self.loop.call_later(TEMPO_OCIOSO, self._expirar)
 
-###Recebe o tamanho do arquivo esperado do cliente
-print("Aguardando tamanho do arquivo...")
-tamanho_bytes, endereco_cliente = servidor.recvfrom(1024)
-tamanho_esperado = int(tamanho_bytes.decode())
-print(f"Nome '{nome_arquivo}', Tamanho: {tamanho_esperado} bytes.")
+    def _expirar(self):
+        log_event(log, WARNING, "ociosa", "[%(cliente)s] Cliente parou de enviar por %(segundos).0fs. Sessão descartada.",
+                  cliente=self.endereco_cliente, segundos=TEMPO_OCIOSO)
+        self.encerrar()
 
-##Define o caminho onde o arquivo recebido será salvo
-ARQUIVO_RECEBIDO = os.path.join("armazenamento_server",f"recebido_{nome_arquivo}")
+    def datagram_received(self, dados):
+        """`dados` é uma fatia do buffer de recepção: só vale até o próximo datagrama."""
+        self._rearmar()
+        try:
+            if self.nome_arquivo is None:
+                ##Recebe o nome(extensão) do arquivo do cliente
+                self.nome_arquivo = os.path.basename(bytes(dados).decode())
+            elif self.tamanho_esperado is None:
+                ###Recebe o tamanho do arquivo esperado do cliente
+                self.tamanho_esperado = int(bytes(dados).decode())
+                log_event(log, INFO, "sessao", "[%(cliente)s] Nome '%(nome)s', Tamanho: %(tamanho)d bytes.",
+                          cliente=self.endereco_cliente, nome=self.nome_arquivo, tamanho=self.tamanho_esperado)
+                self._abrir()
+            elif self.arquivo_recebido is not None:
+                ##Escreve os dados recebidos no arquivo (e guarda uma cópia para o eco)
+                self.arquivo_recebido.write(dados)
+                if cache is not None:
+                    cache.put(self.ARQUIVO_RECEBIDO, self.total_bytes, dados)
+                self.bloco = max(self.bloco, len(dados))
+                self.total_bytes += len(dados) ##atualiza o total de bytes recebidos
+            if self.arquivo_recebido is not None and self.total_bytes >= self.tamanho_esperado:
+                self.arquivo_recebido.close()
+                self.arquivo_recebido = None
+                log_event(log, INFO, "salvo", "[%(cliente)s] Arquivo recebido salvo como %(caminho)s (%(bytes)d bytes).",
+                          cliente=self.endereco_cliente, caminho=self.ARQUIVO_RECEBIDO, bytes=self.total_bytes)
+                self.ocioso.cancel()
+                tarefa = self.loop.create_task(self.devolver())
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+        except ValueError:
+            log_event(log, WARNING, "invalida", "[%(cliente)s] Mensagem inválida do cliente. Sessão descartada.",
+                      cliente=self.endereco_cliente)
+            self.encerrar()
 
-print("Servidor UDP aguardando conexões na porta 5000...")
+    def _abrir(self):
+        ##Define o caminho onde o arquivo recebido será salvo
+        self.ARQUIVO_RECEBIDO = os.path.join("armazenamento_server", f"recebido_{self.nome_arquivo}")
+        if self.ARQUIVO_RECEBIDO in arquivos_em_uso:
+            ##Outro cliente está enviando um arquivo com o mesmo nome: salva com a porta no nome
+            self.ARQUIVO_RECEBIDO = os.path.join("armazenamento_server", f"recebido_{self.endereco_cliente[1]}_{self.nome_arquivo}")
+        arquivos_em_uso.add(self.ARQUIVO_RECEBIDO)
+        if cache is not None:
+            cache.invalidate(self.ARQUIVO_RECEBIDO) ## o que havia de um envio anterior não vale mais
+        self.arquivo_recebido = open(self.ARQUIVO_RECEBIDO, "wb")
 
-total_bytes = 0
+    async def enviar(self, dados):
+        try:
+            self.sock.sendto(dados, self.endereco_cliente)
+        except BlockingIOError:
+            ##Buffer de envio cheio: espera o socket liberar sem bloquear as outras sessões
+            await self.loop.sock_sendto(self.sock, dados, self.endereco_cliente)
 
-with open(ARQUIVO_RECEBIDO, "wb") as arquivo_recebido:
-    ##Loop para receber os pacotes do cliente até que o tamanho esperado seja alcançado
-    while total_bytes < tamanho_esperado:
-        ##Recebe pacotes de até 1024 bytes do cliente
-        pacote, endereco_cliente = servidor.recvfrom(1024)
-        ##Escreve os dados recebidos no arquivo
-        arquivo_recebido.write(pacote) 
-        total_bytes += len(pacote) ##atualiza o total de bytes recebidos
-        print(f"Recebido pacote de {len(pacote)} bytes de {endereco_cliente}.")
-    print(f"Arquivo recebido salvo como {ARQUIVO_RECEBIDO} ({total_bytes} bytes).")
+    async def devolver(self):
+        try:
+            pacotes_enviados = 0 ##Contadores
+            total_enviado = 0
+            da_memoria = 0
+            pacer = TokenBucket(TAXA_ENVIO, RAJADA) ##Espaça os envios para não estourar o buffer do cliente
 
+            ##Envia a confirmação do tamanho do arquivo de volta para o cliente
+            log_event(log, INFO, "confirmacao", "[%(cliente)s] Enviando confirmação de tamanho (%(bytes)d bytes) de volta para o cliente...",
+                      cliente=self.endereco_cliente, bytes=self.total_bytes)
+            await self.enviar(str(self.total_bytes).encode())
 
-pacotes_enviados = 0 ##Contadores
-total_enviado = 0
+            ##Envia o arquivo de volta para o cliente em pacotes do tamanho dos dele: da cache, se o pacote
+            ##ainda está nela, ou uma fatia do arquivo mapeado em memória (ou lida com readinto, se não der para mapear)
+            with open(self.ARQUIVO_RECEBIDO, "rb") as arquivo_retorno:
+                mapa = map_file(arquivo_retorno)
+                fonte = memoryview(mapa) if mapa is not None else None
+                bloco = memoryview(bytearray(self.bloco))
+                try:
+                    while True:
+                        dados = None
+                        if cache is not None and total_enviado < self.total_bytes:
+                            dados = cache.get(self.ARQUIVO_RECEBIDO, total_enviado,
+                                              min(self.bloco, self.total_bytes - total_enviado))
+                        if dados is not None:
+                            da_memoria += 1
+                        elif fonte is not None:
+                            dados = fonte[total_enviado:total_enviado + self.bloco]
+                        else:
+                            arquivo_retorno.seek(total_enviado)
+                            dados = bloco[:arquivo_retorno.readinto(bloco)]
+                        ##Pedaço vazio significa que chegou ao fim do arquivo e então sai do loop
+                        if not dados:
+                            break
+                        ##Espera o pacer sem bloquear as outras sessões
+                        espera = pacer.delay(len(dados))
+                        while espera:
+                            await asyncio.sleep(espera)
+                            espera = pacer.delay(len(dados))
+                        await self.enviar(dados) ##Envia os dados lidos para o endereço do cliente
+                        pacotes_enviados += 1 ##atualiza contadores
+                        total_enviado += len(dados)
+                    del dados
+                finally:
+                    if fonte is not None:
+                        fonte.release() ##o mmap só fecha depois que nenhuma fatia aponta para ele
+                        mapa.close()
+            log_event(log, INFO, "eco", "[%(cliente)s] Devolvidos %(pacotes)d pacotes (%(bytes)d bytes, %(memoria)d da memória).",
+                      cliente=self.endereco_cliente, pacotes=pacotes_enviados, bytes=total_enviado, memoria=da_memoria)
+        finally:
+            self.encerrar()
 
-##Envia a confirmação do tamanho do arquivo de volta para o cliente
-print(f"Enviando confirmação de tamanho ({total_bytes} bytes) de volta para o cliente...")
-servidor.sendto(str(total_bytes).encode(), endereco_cliente)
+    def encerrar(self):
+        self.ocioso.cancel()
+        if self.arquivo_recebido is not None:
+            self.arquivo_recebido.close()
+            self.arquivo_recebido = None
+        arquivos_em_uso.discard(self.ARQUIVO_RECEBIDO)
+        if sessoes.get(self.endereco_cliente) is self:
+            del sessoes[self.endereco_cliente]
 
-##Envia o arquivo de volta para o cliente em pacotes de 1024 bytes
-with open(ARQUIVO_RECEBIDO, "rb") as arquivo_retorno:
-    ##Loop para ler o arquivo em pedaços de 1024 bytes e enviar cada pedaço ao cliente
+
+def ler(sock, buffer):
+    """Lê todos os datagramas na fila do socket e entrega cada um à sessão do endereço de origem."""
+    view = memoryview(buffer)
     while True:
-        ##Lê até 1024 bytes do arquivo
-        dados = arquivo_retorno.read(1024)
-        ##Se read() retornar bytes vazios, significa que chegou ao fim do arquivo e então sai do loop
-        if not dados:
-            break
-        servidor.sendto(dados, endereco_cliente) ##Envia os dados lidos para o endereço do cliente
-        pacotes_enviados += 1 ##atualiza contadores
-        total_enviado += len(dados)
-        time.sleep(0.001) ## adicionado para evitar perda de pacotes, pela rapidez do envio
-
-print(f"Enviando {pacotes_enviados} pacotes ({total_enviado} bytes) de volta para o cliente...")
-print("Envio de confirmação concluído.")
-
-#Fecha o socket do servidor
-servidor.close()
\ No newline at end of file
+        try:
+            tamanho, endereco_cliente = sock.recvfrom_into(buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        sessao = sessoes.get(endereco_cliente)
+        if sessao is None:
+            sessao = sessoes[endereco_cliente] = Sessao(sock, endereco_cliente)
+        sessao.datagram_received(view[:tamanho])
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    ##Bind o socket a todas as interfaces de rede na porta 5000
+    servidor = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_RECEPCAO)
+    servidor.bind(("0.0.0.0", PORTA))
+    servidor.setblocking(False)
+    ##O laço avisa quando há datagramas; eles são lidos num buffer alocado uma vez só
+    loop.add_reader(servidor.fileno(), ler, servidor, bytearray(TAMANHO_MAXIMO))
+    log_event(log, INFO, "inicio", "Servidor UDP aguardando conexões na porta %(porta)d...", porta=PORTA)
+    try:
+        await asyncio.Future() ##Servidor de longa duração: atende clientes até ser interrompido
+    finally:
+        #Fecha o socket do servidor
+        loop.remove_reader(servidor.fileno())
+        servidor.close()
+
+configure(NIVEL_LOG, FORMATO_LOG)
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print("Servidor encerrado.")
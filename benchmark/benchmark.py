@@ -0,0 +1,361 @@
+"""
+Benchmark das transferências UDP e RDT_3.0 em loopback.
+
+Roda os próprios scripts de cada pasta (client.py e server.py), sem
+modificá-los: cada execução copia os scripts para uma pasta temporária,
+troca as constantes do topo (arquivo, porta, bloco, perda, modo...) e roda
+servidor e cliente como processos separados. Cada combinação de cenário,
+tamanho de arquivo, tamanho de bloco e taxa de perda é repetida algumas
+vezes, e o resultado vai para um JSON que pode ser comparado entre commits.
+
+Com --perfis, a perda deixa de ser simulada dentro dos scripts (PROB_PERDA
+fica 0) e o cliente fala com o servidor através de proxy/proxy.py, que
+aplica o perfil de rede (perdas em rajadas, atraso, reordenação, limite de
+banda...; ver rdt/impairment.py). A repetição i de toda combinação usa a
+semente SEMENTE + i, então todos os cenários passam exatamente pelas mesmas
+condições de rede.
+
+Para cada combinação são medidos:
+ - tempo de conclusão do cliente (envio + retorno), com percentis p50/p90/p99;
+ - goodput: tamanho do arquivo / tempo de conclusão mediano, em MB/s;
+ - retransmissões do cliente e do servidor (RDT_3.0);
+ - tempo de CPU (usuário + sistema) e pico de memória (RSS) de cada processo;
+ - se os arquivos recebido e devolvido são iguais ao original.
+
+Uso:
+    python3 benchmark/benchmark.py                     # matriz padrão
+    python3 benchmark/benchmark.py --tamanhos 1048576 --perdas 0 0.1 --repeticoes 5
+    python3 benchmark/benchmark.py --cenarios RDT_3.0-SR --saida antes.json
+    python3 benchmark/benchmark.py --perfis limpo rajadas wan --tamanhos 1048576
+
+CPU e RSS vêm de os.wait4, então só são medidos em sistemas Unix.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+from rdt.pmtu import BLOCO_BASE, BLOCO_MAXIMO
+
+##Matriz padrão
+TAMANHOS = [64 * 1024, 1024 * 1024, 4 * 1024 * 1024] # bytes
+PERDAS = [0.0, 0.05, 0.2] # probabilidade de perda simulada (só o RDT_3.0 simula perda)
+REPETICOES = 3
+TEMPO_LIMITE = 120.0 # segundos por execução; passou disso, a execução conta como falha
+SEMENTE = 1234 # os arquivos de teste são bytes aleatórios, sempre os mesmos; também é a semente do proxy
+
+##Cada cenário diz qual pasta rodar, os tamanhos de bloco a testar e como trocar as constantes.
+##`cliente`/`servidor` recebem (arquivo, porta, bloco, perda) e devolvem {CONSTANTE: valor em Python}.
+##Modos novos entram aqui.
+CENARIOS = {
+    "UDP": {
+        "pasta": "UDP",
+        "blocos": [1024, 8192, 65000],
+        "perda": False, # o UDP puro não simula perda (e, sem retransmissão, não passa pelo proxy)
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "TAMANHO_PACOTE": bloco,
+            "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta},
+    },
+    "RDT_3.0-SR": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_BASE, BLOCO_MAXIMO],
+        "perda": True,
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_SR",
+            "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda},
+    },
+    "RDT_3.0-GBN": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_BASE, BLOCO_MAXIMO],
+        "perda": True,
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_GBN",
+            "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda},
+    },
+    "RDT_3.0-SR-FEC": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_BASE, BLOCO_MAXIMO],
+        "perda": True,
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_SR",
+            "FEC": 16, "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda},
+    },
+    "RDT_3.0-SR-zlib": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_MAXIMO],
+        "perda": True,
+        ##Os arquivos de teste são aleatórios: mede o custo de detectar que não comprimem
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_SR",
+            "COMPRESSAO": 6, "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda},
+    },
+    "RDT_3.0-SR-4fluxos": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_MAXIMO],
+        "perda": True,
+        ##Quatro faixas em quatro processos no cliente e quatro processos no servidor (rdt/parallel.py)
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_SR",
+            "FLUXOS": 4, "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda, "PROCESSOS": 4,
+                                                          "PORTA_METRICAS": None},
+    },
+    "RDT_3.0-SR-resumo": {
+        "pasta": "RDT_3.0",
+        "blocos": [BLOCO_MAXIMO],
+        "perda": True,
+        "eco": False, # o servidor devolve só o resumo (rdt/verify.py)
+        "cliente": lambda arquivo, porta, bloco, perda: {
+            "caminho_arquivo": repr(arquivo), "BLOCO": bloco, "PROB_PERDA": perda, "MODO": "MODO_SR",
+            "VERIFICACAO": "VERIFICACAO_RESUMO", "end_servidor": repr(("127.0.0.1", porta))},
+        "servidor": lambda arquivo, porta, bloco, perda: {"PORTA": porta, "PROB_PERDA": perda},
+    },
+}
+
+_RETRANSMISSOES = re.compile(r"(\d+) retransmiss")
+
+
+def porta_livre():
+    """Porta UDP livre no loopback (pode ser tomada por outro processo depois, mas é improvável)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def trocar_constantes(origem, destino, valores):
+    """Copia o script `origem` para `destino` trocando as atribuições `NOME = ...` do topo."""
+    with open(origem, encoding="utf-8") as f:
+        codigo = f.read()
+    for nome, valor in valores.items():
+        codigo, trocas = re.subn(rf"^{nome} *=.*$", f"{nome} = {valor}", codigo, count=1, flags=re.MULTILINE)
+        if not trocas:
+            raise ValueError(f"{origem}: constante {nome} não encontrada")
+    with open(destino, "w", encoding="utf-8") as f:
+        f.write(codigo)
+
+def gerar_arquivo(caminho, tamanho):
+    with open(caminho, "wb") as f:
+        f.write(random.Random(SEMENTE + tamanho).randbytes(tamanho))
+
+def esperar_processo(proc, limite):
+    """
+    Espera `proc` terminar até o instante `limite` (time.monotonic). Retorna
+    (concluiu, cpu_segundos, rss_pico_kb); sem os.wait4, CPU e RSS são None.
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            proc.wait(max(limite - time.monotonic(), 0))
+            return proc.returncode == 0, None, None
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            return False, None, None
+    concluiu = True
+    while True:
+        pid, status, uso = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.monotonic() >= limite:
+            proc.kill()
+            concluiu = False
+            pid, status, uso = os.wait4(proc.pid, 0)
+            break
+        time.sleep(0.005)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    ##ru_maxrss é em KB no Linux e em bytes no macOS
+    rss = uso.ru_maxrss // 1024 if sys.platform == "darwin" else uso.ru_maxrss
+    return concluiu and proc.returncode == 0, uso.ru_utime + uso.ru_stime, rss
+
+def esperar_linha(proc, log, texto, nome):
+    """Espera o processo `proc` escrever `texto` no `log` (ex.: o servidor abriu o socket)."""
+    limite = time.monotonic() + 10
+    while texto not in ler(log.name):
+        if proc.poll() is not None or time.monotonic() > limite:
+            raise RuntimeError(f"{nome} não subiu:\n" + ler(log.name))
+        time.sleep(0.01)
+
+def encerrar(proc):
+    """Encerra um processo de longa duração (servidor, proxy); devolve (cpu, rss) como esperar_processo."""
+    if proc.returncode is not None:
+        return None, None
+    proc.terminate()
+    _, cpu, rss = esperar_processo(proc, time.monotonic() + 5)
+    return cpu, rss
+
+def executar(cenario, pasta_trabalho, arquivo, tamanho, bloco, perda, perfil=None, semente=SEMENTE):
+    """
+    Roda uma transferência (servidor novo + cliente) e devolve as medidas.
+    Com `perfil`, o cliente passa pelo proxy, com a semente `semente`.
+    """
+    config = CENARIOS[cenario]
+    if os.path.exists(pasta_trabalho):
+        shutil.rmtree(pasta_trabalho)
+    os.makedirs(os.path.join(pasta_trabalho, "armazenamento_server"))
+    os.makedirs(os.path.join(pasta_trabalho, "armazenamento_cliente"))
+    shutil.copy(arquivo, pasta_trabalho)
+    nome = os.path.basename(arquivo)
+    porta = porta_cliente = porta_livre()
+    if perfil is not None:
+        porta_cliente = porta_livre()
+    pasta_scripts = os.path.join(RAIZ, config["pasta"])
+    trocar_constantes(os.path.join(pasta_scripts, "server.py"), os.path.join(pasta_trabalho, "server.py"),
+                      config["servidor"](nome, porta, bloco, perda))
+    trocar_constantes(os.path.join(pasta_scripts, "client.py"), os.path.join(pasta_trabalho, "client.py"),
+                      config["cliente"](nome, porta_cliente, bloco, perda))
+
+    ambiente = dict(os.environ, PYTHONPATH=os.path.abspath(RAIZ))
+    log_servidor = open(os.path.join(pasta_trabalho, "server.log"), "w+")
+    log_cliente = open(os.path.join(pasta_trabalho, "client.log"), "w+")
+    log_proxy = open(os.path.join(pasta_trabalho, "proxy.log"), "w+")
+    servidor = subprocess.Popen([sys.executable, "-u", "server.py"], cwd=pasta_trabalho, env=ambiente,
+                                stdout=log_servidor, stderr=subprocess.STDOUT)
+    proxy = None
+    try:
+        esperar_linha(servidor, log_servidor, "aguardando", f"servidor de {cenario}")
+        if perfil is not None:
+            proxy = subprocess.Popen([sys.executable, "-u", os.path.join(RAIZ, "proxy", "proxy.py"),
+                                      "--porta", str(porta_cliente), "--destino", f"127.0.0.1:{porta}",
+                                      "--perfil", perfil, "--semente", str(semente)],
+                                     env=ambiente, stdout=log_proxy, stderr=subprocess.STDOUT)
+            esperar_linha(proxy, log_proxy, "aguardando", "proxy")
+
+        inicio = time.monotonic()
+        cliente = subprocess.Popen([sys.executable, "-u", "client.py"], cwd=pasta_trabalho, env=ambiente,
+                                   stdout=log_cliente, stderr=subprocess.STDOUT)
+        concluiu, cpu_cliente, rss_cliente = esperar_processo(cliente, inicio + TEMPO_LIMITE)
+        tempo = time.monotonic() - inicio
+    finally:
+        ##O servidor é de longa duração: depois de uma pequena folga para os últimos pacotes, é encerrado
+        time.sleep(0.05)
+        cpu_servidor, rss_servidor = encerrar(servidor)
+        if proxy is not None:
+            encerrar(proxy)
+        log_servidor.close()
+        log_cliente.close()
+        log_proxy.close()
+
+    recebido = os.path.join(pasta_trabalho, "armazenamento_server", f"recebido_{nome}")
+    devolvido = os.path.join(pasta_trabalho, "armazenamento_cliente", f"devolvido_{nome}")
+    integro = iguais(arquivo, recebido) and (not config.get("eco", True) or iguais(arquivo, devolvido))
+    retransmissoes = [int(n) for caminho in (log_cliente.name, log_servidor.name)
+                      for n in _RETRANSMISSOES.findall(ler(caminho))]
+    ##O proxy imprime, ao ser encerrado, o que fez em cada sentido (uma linha JSON)
+    rede = None
+    if proxy is not None:
+        linhas = [linha for linha in ler(log_proxy.name).splitlines() if linha.startswith("{")]
+        rede = json.loads(linhas[-1]) if linhas else None
+    return {"concluiu": concluiu, "integro": integro, "tempo": tempo,
+            "retransmissoes": sum(retransmissoes) if retransmissoes else None,
+            "cpu_cliente": cpu_cliente, "cpu_servidor": cpu_servidor,
+            "rss_cliente_kb": rss_cliente, "rss_servidor_kb": rss_servidor, "rede": rede}
+
+def ler(caminho):
+    with open(caminho, errors="replace") as f:
+        return f.read()
+
+def iguais(a, b):
+    if not os.path.exists(b) or os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            bloco_a, bloco_b = fa.read(1 << 20), fb.read(1 << 20)
+            if bloco_a != bloco_b:
+                return False
+            if not bloco_a:
+                return True
+
+def percentil(valores, p):
+    """Percentil pelo posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return None
+    return valores[min(max(math.ceil(p * len(valores) / 100) - 1, 0), len(valores) - 1)]
+
+def resumir(execucoes, tamanho):
+    """Agrega as repetições de uma combinação."""
+    tempos = sorted(e["tempo"] for e in execucoes if e["concluiu"] and e["integro"])
+    def media(chave):
+        valores = [e[chave] for e in execucoes if e[chave] is not None]
+        return sum(valores) / len(valores) if valores else None
+    def maximo(chave):
+        valores = [e[chave] for e in execucoes if e[chave] is not None]
+        return max(valores) if valores else None
+    p50 = percentil(tempos, 50)
+    return {"repeticoes": len(execucoes), "falhas": len(execucoes) - len(tempos),
+            "tempo_p50": p50, "tempo_p90": percentil(tempos, 90), "tempo_p99": percentil(tempos, 99),
+            "goodput_mb_s": tamanho / p50 / 1e6 if p50 else None,
+            "retransmissoes_media": media("retransmissoes"),
+            "cpu_cliente_s": media("cpu_cliente"), "cpu_servidor_s": media("cpu_servidor"),
+            "rss_cliente_kb": maximo("rss_cliente_kb"), "rss_servidor_kb": maximo("rss_servidor_kb"),
+            "execucoes": execucoes}
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=RAIZ, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das transferências UDP e RDT_3.0 em loopback.")
+    parser.add_argument("--cenarios", nargs="+", choices=sorted(CENARIOS), default=sorted(CENARIOS))
+    parser.add_argument("--tamanhos", nargs="+", type=int, default=TAMANHOS, help="tamanhos de arquivo, em bytes")
+    parser.add_argument("--blocos", nargs="+", type=int, help="tamanhos de bloco (padrão: os de cada cenário)")
+    parser.add_argument("--perdas", nargs="+", type=float, default=PERDAS)
+    parser.add_argument("--perfis", nargs="+", help="perfis do proxy (rdt/impairment.py) no lugar de --perdas")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--saida", default="benchmark.json", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as temporaria:
+        for tamanho in args.tamanhos:
+            arquivo = os.path.join(temporaria, f"arquivo_{tamanho}.bin")
+            gerar_arquivo(arquivo, tamanho)
+            for cenario in args.cenarios:
+                config = CENARIOS[cenario]
+                ##Cada condição de rede é (perda simulada nos scripts, perfil do proxy)
+                if args.perfis:
+                    condicoes = [(0.0, perfil) for perfil in args.perfis] if config["perda"] else [(0.0, None)]
+                else:
+                    condicoes = [(perda, None) for perda in (args.perdas if config["perda"] else [0.0])]
+                for bloco in args.blocos or config["blocos"]:
+                    for perda, perfil in condicoes:
+                        execucoes = [executar(cenario, os.path.join(temporaria, "execucao"), arquivo,
+                                              tamanho, bloco, perda, perfil, SEMENTE + i)
+                                     for i in range(args.repeticoes)]
+                        resultado = {"cenario": cenario, "tamanho": tamanho, "bloco": bloco, "perda": perda,
+                                     "perfil": perfil}
+                        resultado.update(resumir(execucoes, tamanho))
+                        resultados.append(resultado)
+                        goodput = resultado["goodput_mb_s"]
+                        rede = f"perfil {perfil}" if perfil else f"perda {perda:4.2f}"
+                        print(f"{cenario:18} {tamanho:>9} B  bloco {bloco:>5}  {rede:14}  "
+                              f"p50 {resultado['tempo_p50'] or float('nan'):7.3f}s  "
+                              f"{goodput or float('nan'):8.2f} MB/s  falhas {resultado['falhas']}")
+
+    with open(args.saida, "w") as f:
+        json.dump({"commit": commit_atual(), "python": platform.python_version(),
+                   "plataforma": platform.platform(), "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "resultados": resultados}, f, indent=2)
+    print(f"Resultados salvos em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+## Permite importar o pacote rdt, que fica na raiz do projeto
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rdt.impairment import ImpairmentProxy, PERFIS
+
+##Proxy que degrada a rede entre cliente e servidor, de forma reproduzível (ver rdt/impairment.py).
+##Ex.: servidor na porta 5000, cliente apontando para a 6000:
+##    python3 proxy.py --porta 6000 --destino 127.0.0.1:5000 --perfil rajadas --semente 7
+##Com os mesmos perfil e semente, todos os modos passam pelas mesmas condições.
+##Ao encerrar (Ctrl+C), imprime o que aconteceu em cada sentido.
+PORTA = 6000
+DESTINO = "127.0.0.1:5000"
+PERFIL = "limpo" ## nome de um perfil pronto ou caminho de um JSON
+SEMENTE = 0
+
+parser = argparse.ArgumentParser(description="Proxy UDP com perdas, atrasos e limite de banda reproduzíveis.")
+parser.add_argument("--porta", type=int, default=PORTA, help="porta em que os clientes se conectam")
+parser.add_argument("--destino", default=DESTINO, help="endereço do servidor, host:porta")
+parser.add_argument("--perfil", default=PERFIL, help=f"um de {', '.join(PERFIS)} ou um arquivo JSON")
+parser.add_argument("--semente", type=int, default=SEMENTE)
+args = parser.parse_args()
+host, porta = args.destino.rsplit(":", 1)
+
+async def main():
+    proxy = ImpairmentProxy(args.porta, (host, int(porta)), args.perfil, args.semente)
+    parar = asyncio.Event()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sinal, parar.set)
+        except NotImplementedError:
+            pass ## Windows: só Ctrl+C, pelo KeyboardInterrupt
+    print(f"Proxy na porta {args.porta} -> {args.destino}, perfil {args.perfil}, semente {args.semente}: aguardando pacotes...")
+    try:
+        await parar.wait()
+    finally:
+        print(json.dumps(proxy.estatisticas))
+        proxy.close()
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    pass
+print("Proxy encerrado.")
@@ -0,0 +1,7 @@
+"""
+Pacote rdt - camada de transmissão confiável compartilhada pelos projetos.
+
+Os scripts de RDT_3.0/ importam daqui a lógica de transmissão, para que
+cliente e servidor usem exatamente o mesmo protocolo em vez de manter uma
+cópia das funções auxiliares em cada arquivo.
+"""
@@ -0,0 +1,118 @@
+"""
+Linha de comando do pacote rdt, uma camada fina sobre rdt/session.py
+(cliente) e rdt/server.py (servidor). Da raiz do projeto:
+
+    python3 -m rdt servir --porta 5000 --armazenamento armazenamento_server
+    python3 -m rdt enviar 127.0.0.1:5000 mapa.jpg texto.txt --retorno devolvidos
+    python3 -m rdt enviar 127.0.0.1:5000 fotos --resumo
+
+Todos os arquivos de um `enviar` usam a mesma TransferSession: o mesmo
+socket, o RTT medido, a janela de congestionamento e o bloco sondado passam
+de um arquivo para o próximo. Diretórios vão como um lote (rdt/batch.py).
+"""
+
+import argparse
+import os
+import sys
+
+from rdt.session import TransferSession, TAMANHO_JANELA
+from rdt.server import serve_forever, TAMANHO_MAXIMO
+from rdt.window import MODO_GBN, MODO_SR, TIMEOUT
+from rdt.pmtu import BLOCO_MAXIMO
+from rdt.cache import MEMORIA
+from rdt.verify import VERIFICACAO_ECO, VERIFICACAO_RESUMO
+from rdt.log import configure
+
+
+def _endereco(texto):
+    host, _, porta = texto.rpartition(":")
+    try:
+        return (host or "127.0.0.1", int(porta))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"endereço inválido: {texto} (use host:porta)")
+
+def enviar(args):
+    verificacao = VERIFICACAO_RESUMO if args.resumo else VERIFICACAO_ECO
+    if args.retorno is not None:
+        os.makedirs(args.retorno, exist_ok=True)
+    falhas = 0
+    with TransferSession(args.destino, modo=args.modo, tamanho_janela=args.janela, bloco=args.bloco, fec=args.fec,
+                         compressao=args.compressao, verificacao=verificacao, rto_inicial=args.timeout,
+                         prob_perda=args.perda) as sessao:
+        for caminho in args.arquivos:
+            try:
+                if os.path.isdir(caminho):
+                    resultado = sessao.send_batch(caminho, retorno=args.retorno)
+                    ruins = [arquivo for arquivo in resultado["arquivos"] if not arquivo["ok"]]
+                    for arquivo in ruins:
+                        print(f"  {arquivo['nome']}: {arquivo['erro']}")
+                    ok = not ruins
+                    print(f"{caminho}: {len(resultado['arquivos']) - len(ruins)} de {len(resultado['arquivos'])} "
+                          f"arquivos íntegros, {resultado['pacotes']} pacotes, {resultado['retransmissoes']} "
+                          f"retransmissões em {resultado['segundos']:.2f}s.")
+                else:
+                    retorno = None
+                    if args.retorno is not None:
+                        retorno = os.path.join(args.retorno, "devolvido_" + os.path.basename(caminho))
+                    resultado = sessao.send_file(caminho, retorno=retorno, delta=args.delta)
+                    ok = resultado["ok"]
+                    print(f"{caminho}: {'ok' if ok else 'diferente'}, {resultado['bytes']} bytes em "
+                          f"{resultado['pacotes']} pacotes, {resultado['retransmissoes']} retransmissões em "
+                          f"{resultado['segundos']:.2f}s (RTT {(sessao.rto.srtt or 0) * 1000:.1f} ms, "
+                          f"cwnd {sessao.cc.janela}).")
+            except (OSError, ValueError) as erro:
+                ##ConnectionRefusedError (o servidor recusou) também é OSError
+                print(f"{caminho}: {erro}")
+                ok = False
+            falhas += not ok
+    return 1 if falhas else 0
+
+def servir(args):
+    os.makedirs(args.armazenamento, exist_ok=True)
+    try:
+        serve_forever(args.host, args.porta, args.armazenamento, rto_inicial=args.timeout, prob_perda=args.perda,
+                      porta_metricas=args.metricas, processos=args.processos, memoria_cache=args.memoria_cache,
+                      tamanho_maximo=args.tamanho_maximo)
+    except KeyboardInterrupt:
+        print("Servidor encerrado.")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m rdt", description="Transferência de arquivos com o RDT 3.0.")
+    parser.add_argument("--nivel-log", default="INFO", help="DEBUG registra cada pacote (padrão: INFO)")
+    parser.add_argument("--formato-log", default="texto", choices=("texto", "json"))
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="RTO inicial, em segundos")
+    parser.add_argument("--perda", type=float, default=0.0, help="probabilidade de perda simulada")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    cliente = comandos.add_parser("enviar", help="envia arquivos (e diretórios, como lotes) numa só sessão")
+    cliente.add_argument("destino", type=_endereco, help="host:porta do servidor")
+    cliente.add_argument("arquivos", nargs="+")
+    cliente.add_argument("--retorno", help="diretório onde gravar o eco (sem ele, o eco é descartado)")
+    cliente.add_argument("--resumo", action="store_true", help="o servidor devolve só os hashes, não o arquivo")
+    cliente.add_argument("--delta", action="store_true", help="envia só as diferenças para a versão do servidor")
+    cliente.add_argument("--modo", default=MODO_SR, choices=(MODO_SR, MODO_GBN))
+    cliente.add_argument("--janela", type=int, default=TAMANHO_JANELA, help="máximo de pacotes em trânsito")
+    cliente.add_argument("--bloco", type=int, default=BLOCO_MAXIMO, help="maior payload proposto, em bytes")
+    cliente.add_argument("--fec", type=int, default=0, help="blocos por grupo de correção de erros (SR)")
+    cliente.add_argument("--compressao", type=int, default=0, help="nível do zlib (1 a 9)")
+    cliente.set_defaults(funcao=enviar)
+
+    servidor = comandos.add_parser("servir", help="atende transferências até ser interrompido")
+    servidor.add_argument("--host", default="0.0.0.0")
+    servidor.add_argument("--porta", type=int, default=5000)
+    servidor.add_argument("--armazenamento", default="armazenamento_server")
+    servidor.add_argument("--processos", type=int, default=1, help="processos atendendo a porta (0: um por núcleo)")
+    servidor.add_argument("--metricas", type=int, help="porta das métricas (Prometheus e JSON)")
+    servidor.add_argument("--memoria-cache", type=int, default=MEMORIA, help="bytes da cache do eco (0 desliga)")
+    servidor.add_argument("--tamanho-maximo", type=int, default=TAMANHO_MAXIMO,
+                          help="maior arquivo aceito em fluxos paralelos, em bytes (reservado no disco)")
+    servidor.set_defaults(funcao=servir)
+
+    args = parser.parse_args(argv)
+    configure(args.nivel_log, args.formato_log)
+    return args.funcao(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
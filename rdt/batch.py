@@ -0,0 +1,285 @@
+"""
+Envio de vários arquivos (um diretório ou uma lista) numa única sessão.
+
+Uma sessão RDT leva um arquivo: para milhares de arquivos pequenos, o custo
+é dominado pelo que se repete a cada um (processo, sondagem, SYN, fim da
+janela, eco), não pelos bytes. Com send_batch, todos os arquivos vão num só
+fluxo de bytes, na mesma sessão:
+
+    {"arquivos": [{"nome": "pasta/a.txt", "tamanho": 120}, ...]}\\n
+    <conteúdo de a.txt><conteúdo do próximo>...
+
+A primeira linha (o manifesto) leva os nomes e tamanhos de todos os
+arquivos de uma vez, e os conteúdos vêm um atrás do outro, sem separador:
+vários arquivos pequenos cabem no mesmo pacote. O SYN leva `lote` (quantos
+arquivos), e o servidor (rdt/server.py) grava o fluxo num arquivo
+temporário e depois o separa (unpack), gravando cada arquivo com o prefixo
+`recebido_` no primeiro componente do nome (`recebido_pasta/a.txt`).
+
+A volta também é por arquivo: no eco, o servidor devolve um lote com os
+arquivos como ficaram gravados, que o cliente separa com o prefixo
+`devolvido_`; no modo resumo (rdt/verify.py), só um relatório com o hash de
+cada arquivo. Nos dois casos o cliente compara cada arquivo com o hash
+calculado durante o envio e diz quais chegaram íntegros. Arquivos que o
+servidor não conseguiu gravar vêm no manifesto da volta com `erro`.
+
+Um lote não é retomado depois de uma queda (não há diário), e não é
+combinado com fluxos paralelos nem com o reenvio por diferenças.
+"""
+
+import bisect
+import hashlib
+import io
+import json
+import os
+
+from rdt.buffers import map_file
+from rdt.window import send_window, recv_window
+from rdt.verify import recv_report, VERIFICACAO_ECO, VERIFICACAO_RESUMO, ALGORITMO
+
+PREFIXO_RECEBIDO = "recebido_"
+PREFIXO_DEVOLVIDO = "devolvido_"
+
+
+def list_files(origem):
+    """
+    Arquivos de `origem` (um diretório, percorrido em ordem, ou uma lista de
+    caminhos), como [(caminho, nome)]. No diretório, o nome é o caminho
+    relativo a ele, começando pelo nome do próprio diretório.
+    Levanta ValueError se dois arquivos ficarem com o mesmo nome.
+    """
+    if isinstance(origem, (str, os.PathLike)):
+        raiz = os.path.abspath(origem)
+        base = os.path.basename(raiz)
+        arquivos = []
+        for pasta, subpastas, nomes in os.walk(raiz):
+            subpastas.sort()
+            relativa = os.path.relpath(pasta, raiz)
+            for nome in sorted(nomes):
+                caminho = os.path.join(pasta, nome)
+                if os.path.isfile(caminho):
+                    partes = [base] + ([] if relativa == os.curdir else relativa.split(os.sep)) + [nome]
+                    arquivos.append((caminho, "/".join(partes)))
+    else:
+        arquivos = [(caminho, os.path.basename(caminho)) for caminho in origem]
+    nomes = set()
+    for _, nome in arquivos:
+        if nome in nomes:
+            raise ValueError(f"dois arquivos com o nome '{nome}' no lote")
+        nomes.add(nome)
+    return arquivos
+
+def destination(raiz, nome, prefixo):
+    """
+    Onde gravar o arquivo `nome` do lote dentro de `raiz`, com `prefixo` no
+    primeiro componente. Retorna None se o nome sair de `raiz` (absoluto,
+    `..`) ou for inválido.
+    """
+    partes = str(nome).split("/")
+    for parte in partes:
+        if parte in ("", os.curdir, os.pardir) or os.sep in parte or (os.altsep and os.altsep in parte):
+            return None
+    return os.path.join(raiz, prefixo + partes[0], *partes[1:])
+
+
+class BatchReader(io.RawIOBase):
+    """
+    O fluxo do lote (manifesto + conteúdos) como um arquivo só de leitura,
+    para send_window/WindowSender. `arquivos` é [(caminho, nome)]; `erros`,
+    [(nome, motivo)] de arquivos que vão só no manifesto. Os arquivos são
+    abertos um de cada vez, quando a leitura chega neles. Com `algoritmo`,
+    o hash de cada arquivo é calculado enquanto ele é lido em ordem.
+    """
+
+    def __init__(self, arquivos, erros=(), algoritmo=ALGORITMO):
+        super().__init__()
+        self.arquivos = list(arquivos)
+        entradas = []
+        for caminho, nome in self.arquivos:
+            entradas.append({"nome": nome, "tamanho": os.path.getsize(caminho)})
+        entradas += [{"nome": nome, "tamanho": 0, "erro": motivo} for nome, motivo in erros]
+        self.entradas = entradas
+        self._manifesto = (json.dumps({"arquivos": entradas}) + "\n").encode()
+        self._inicios = [] # onde cada arquivo começa no fluxo
+        posicao = len(self._manifesto)
+        for entrada in entradas[:len(self.arquivos)]:
+            self._inicios.append(posicao)
+            posicao += entrada["tamanho"]
+        self.tamanho = posicao
+        self.algoritmo = algoritmo
+        self.resumos = [hashlib.new(algoritmo) for _ in self.arquivos] if algoritmo else None
+        self.mudaram = set() # índices dos arquivos que encolheram durante o envio
+        self._posicao = 0
+        self._resumido = len(self._manifesto) # até onde o fluxo já foi somado aos hashes
+        self._aberto = None # (índice, arquivo aberto)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, posicao, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            posicao += self._posicao
+        elif whence == io.SEEK_END:
+            posicao += self.tamanho
+        self._posicao = posicao
+        return posicao
+
+    def tell(self):
+        return self._posicao
+
+    def _arquivo(self, indice):
+        if self._aberto is None or self._aberto[0] != indice:
+            if self._aberto is not None:
+                self._aberto[1].close()
+            self._aberto = (indice, open(self.arquivos[indice][0], "rb"))
+        return self._aberto[1]
+
+    def readinto(self, buffer):
+        ##Preenche o buffer inteiro, atravessando quantos arquivos couberem
+        buffer = memoryview(buffer).cast("B")
+        lido = 0
+        while lido < len(buffer) and self._posicao < self.tamanho:
+            destino = buffer[lido:]
+            if self._posicao < len(self._manifesto):
+                parte = self._manifesto[self._posicao:self._posicao + len(destino)]
+                destino[:len(parte)] = parte
+                n = len(parte)
+            else:
+                indice = bisect.bisect_right(self._inicios, self._posicao) - 1
+                dentro = self._posicao - self._inicios[indice]
+                restante = self.entradas[indice]["tamanho"] - dentro
+                destino = destino[:restante]
+                arquivo = self._arquivo(indice)
+                arquivo.seek(dentro)
+                n = arquivo.readinto(destino)
+                if n < len(destino):
+                    ##O arquivo encolheu depois do manifesto: completa com zeros, e o hash não vai bater
+                    self.mudaram.add(indice)
+                    destino[n:] = bytes(len(destino) - n)
+                    n = len(destino)
+                if self.resumos is not None and self._posicao <= self._resumido < self._posicao + n:
+                    ##Uma releitura pode começar antes e passar do que já foi somado: soma só o que é novo
+                    self.resumos[indice].update(destino[self._resumido - self._posicao:n])
+                    self._resumido = self._posicao + n
+            self._posicao += n
+            lido += n
+        return lido
+
+    def close(self):
+        if self._aberto is not None:
+            self._aberto[1].close()
+            self._aberto = None
+        super().close()
+
+
+def _gravar(entrada, conteudo, raiz, prefixo, algoritmo):
+    ##Grava um arquivo do lote; o resultado vai para o manifesto ou o relatório da volta
+    nome, tamanho = str(entrada.get("nome")), int(entrada.get("tamanho", 0))
+    resultado = {"nome": nome, "tamanho": tamanho}
+    caminho = destination(raiz, nome, prefixo)
+    if "erro" in entrada:
+        resultado["erro"] = str(entrada["erro"])
+    elif len(conteudo) < tamanho:
+        resultado["erro"] = "lote terminou antes do arquivo"
+    elif caminho is None:
+        resultado["erro"] = "nome inválido"
+    else:
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, "wb") as saida:
+                saida.write(conteudo)
+        except OSError as exc:
+            resultado["erro"] = exc.strerror or str(exc)
+        else:
+            resultado["caminho"] = caminho
+            if algoritmo:
+                resultado["resumo"] = hashlib.new(algoritmo, conteudo).hexdigest()
+    return resultado
+
+def unpack(lote, raiz, prefixo, algoritmo=None):
+    """
+    Separa o lote gravado em `lote` (caminho) nos seus arquivos, dentro de
+    `raiz`, com `prefixo` no primeiro componente de cada nome. Retorna um
+    dict por arquivo do manifesto: nome, tamanho e `caminho` onde foi
+    gravado, com `resumo` se `algoritmo` foi dado, ou `erro`.
+    Levanta ValueError se o lote não tem um manifesto válido.
+    """
+    with open(lote, "rb") as arquivo:
+        mapa = map_file(arquivo)
+        fonte = mapa if mapa is not None else arquivo.read() ## lote vazio não pode ser mapeado
+        dados = memoryview(fonte)
+        try:
+            fim = fonte.find(b"\n")
+            if fim < 0:
+                raise ValueError("lote sem manifesto")
+            try:
+                entradas = json.loads(bytes(dados[:fim]))["arquivos"]
+            except (ValueError, KeyError, TypeError) as exc:
+                raise ValueError(f"manifesto inválido: {exc}")
+            posicao = fim + 1
+            resultados = []
+            for entrada in entradas:
+                tamanho = int(entrada.get("tamanho", 0))
+                with dados[posicao:posicao + tamanho] as conteudo: ## o mapa só fecha sem fatias abertas
+                    resultados.append(_gravar(entrada, conteudo, raiz, prefixo, algoritmo))
+                posicao += tamanho
+            return resultados
+        finally:
+            dados.release()
+            if mapa is not None:
+                mapa.close()
+
+
+def send_batch(sock, destino, origem, metadados=None, sessao=0, rto=None, prob_perda=0.0,
+               verificacao=VERIFICACAO_ECO, retorno=None, **opcoes):
+    """
+    Envia todos os arquivos de `origem` (diretório ou lista de caminhos) a
+    `destino` numa só sessão, e recebe a volta. No eco, os arquivos
+    devolvidos são gravados em `retorno` (diretório), com o prefixo
+    `devolvido_`; com `verificacao` VERIFICACAO_RESUMO, só os hashes voltam.
+    `opcoes` vão para send_window (modo, tamanho_janela, bloco, fec...).
+    Retorna (pacotes_enviados, total_enviado, retransmissoes, arquivos), com
+    um dict por arquivo: nome, tamanho, `ok` (chegou íntegro) e `erro`, e
+    `devolvido` (caminho) no eco.
+    Levanta ConnectionRefusedError se o servidor recusar a transferência.
+    """
+    arquivos = list_files(origem)
+    nome = os.path.basename(os.path.abspath(origem)) if isinstance(origem, (str, os.PathLike)) else "lote"
+    with BatchReader(arquivos) as lote:
+        envio = dict(metadados or {}, nome=nome, tamanho=lote.tamanho, lote=len(arquivos))
+        if verificacao == VERIFICACAO_RESUMO:
+            envio.update(verificacao=VERIFICACAO_RESUMO, algoritmo=lote.algoritmo)
+        resultado = send_window(sock, destino, lote, envio, sessao, rto=rto, prob_perda=prob_perda, **opcoes)
+    locais = {entrada["nome"]: (entrada["tamanho"], resumo.hexdigest(), indice in lote.mudaram)
+              for indice, (entrada, resumo) in enumerate(zip(lote.entradas, lote.resumos))}
+
+    if verificacao == VERIFICACAO_RESUMO:
+        remotos = recv_report(sock, sessao, rto, prob_perda).get("arquivos", [])
+    else:
+        os.makedirs(retorno or os.curdir, exist_ok=True)
+        temporario = os.path.join(retorno or os.curdir, f".lote_{sessao}")
+        try:
+            with open(temporario, "wb") as volta:
+                recv_window(sock, volta, sessao, rto=rto, prob_perda=prob_perda)
+            remotos = unpack(temporario, retorno or os.curdir, PREFIXO_DEVOLVIDO, lote.algoritmo)
+        finally:
+            os.remove(temporario)
+
+    remotos = {str(remoto.get("nome")): remoto for remoto in remotos}
+    resultados = []
+    for _, nome_arquivo in arquivos:
+        tamanho, resumo, mudou = locais[nome_arquivo]
+        remoto = remotos.get(nome_arquivo, {"erro": "não voltou do servidor"})
+        erro = remoto.get("erro")
+        if erro is None and mudou:
+            erro = "mudou durante o envio"
+        elif erro is None and (remoto.get("resumo") != resumo or remoto.get("tamanho") != tamanho):
+            erro = "conteúdo diferente"
+        arquivo = {"nome": nome_arquivo, "tamanho": tamanho, "ok": erro is None, "erro": erro}
+        if "caminho" in remoto and verificacao != VERIFICACAO_RESUMO:
+            arquivo["devolvido"] = remoto["caminho"]
+        resultados.append(arquivo)
+    return resultado + (resultados,)
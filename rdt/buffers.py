@@ -0,0 +1,52 @@
+"""
+Buffers reaproveitáveis para os laços de envio e recepção.
+
+Nos laços quentes nenhum pacote deve alocar um bytes novo:
+ - o arquivo de origem é lido por `mmap` (map_file), e o payload de cada
+   pacote é uma fatia (memoryview) do mapa, sem cópia;
+ - quando não dá para mapear (arquivo vazio, objeto sem descritor), os blocos
+   são lidos com `readinto` em buffers fixos de um SlotRing;
+ - o cabeçalho de cada pacote em trânsito fica num slot de um SlotRing e vai
+   junto com o payload por `sendmsg` (scatter-gather), sem concatenar;
+ - a recepção usa `recvfrom_into` num único bytearray; o payload é gravado
+   no arquivo antes do próximo recvfrom_into sobrescrever o buffer.
+"""
+
+import io
+import mmap
+
+
+class SlotRing:
+    """
+    `quantidade` buffers de `tamanho` bytes alocados uma vez, numa única área.
+    O buffer da sequência `seq` é slot(seq); como o remetente nunca tem mais
+    pacotes pendentes do que a janela, `quantidade` = janela basta para que dois
+    pacotes em trânsito nunca dividam o mesmo slot.
+    """
+
+    def __init__(self, quantidade, tamanho):
+        self.tamanho = tamanho
+        self._area = bytearray(quantidade * tamanho)
+        view = memoryview(self._area)
+        self._slots = [view[i * tamanho:(i + 1) * tamanho] for i in range(quantidade)]
+
+    def slot(self, seq):
+        return self._slots[seq % len(self._slots)]
+
+
+def map_file(arquivo):
+    """
+    Mapeia o arquivo aberto inteiro em memória (somente leitura).
+    Retorna o mmap, ou None se não for possível (arquivo vazio, objeto sem
+    descritor de arquivo...), e aí quem chamou deve usar readinto.
+    """
+    try:
+        return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+def send_parts(sock, partes, destino):
+    """Envia as `partes` (cabeçalho, payload...) como um só datagrama, sem juntá-las."""
+    if hasattr(sock, "sendmsg"):
+        return sock.sendmsg(partes, (), 0, destino)
+    return sock.sendto(b"".join(partes), destino) ## Windows não tem sendmsg
@@ -0,0 +1,151 @@
+"""
+Cache em memória dos blocos recebidos pelo servidor.
+
+Depois de receber um arquivo, o servidor devolve o mesmo arquivo no eco; sem
+cache, isso é uma segunda passada pelo arquivo logo depois de gravá-lo.
+Com ChunkCache, cada bloco gravado também fica na memória, indexado pelo
+arquivo e pela posição, e o eco (CachedFile) lê de lá. O que não está na
+cache é lido do disco e guardado, se ainda houver espaço livre, então um
+arquivo devolvido várias vezes fica na memória.
+
+A cache tem um limite em bytes: passando dele, os blocos usados há mais
+tempo saem (LRU), e o resto do arquivo vem do disco. Ela só vê o que o
+próprio processo grava: quem regrava um arquivo por outro caminho (reparo,
+delta, outro processo) chama invalidate antes. Acertos, faltas e blocos
+descartados vão para as métricas (rdt/metrics.py).
+"""
+
+import io
+import os
+from collections import OrderedDict
+
+from rdt.metrics import REGISTRO
+
+MEMORIA = 64 * 1024 * 1024 # limite padrão, em bytes
+
+_ACERTOS = REGISTRO.counter("rdt_cache_acertos_total", "Blocos do eco lidos da cache em memória")
+_FALTAS = REGISTRO.counter("rdt_cache_faltas_total", "Blocos do eco que não estavam na cache (lidos do disco)")
+_DESCARTADOS = REGISTRO.counter("rdt_cache_descartados_total", "Blocos tirados da cache para respeitar o limite de memória")
+
+
+class ChunkCache:
+    """Blocos de arquivos em memória, com limite em bytes e descarte LRU."""
+
+    def __init__(self, memoria=MEMORIA):
+        self.memoria = memoria
+        self.ocupado = 0 # bytes guardados
+        self.acertos = 0
+        self.faltas = 0
+        self.descartados = 0
+        self._blocos = OrderedDict() # (arquivo, posição) -> bytes, do usado há mais tempo ao mais recente
+        self._posicoes = {} # arquivo -> posições guardadas dele
+        REGISTRO.gauge("rdt_cache_bytes", "Bytes guardados na cache de blocos", lambda: self.ocupado)
+
+    def get(self, arquivo, posicao, tamanho):
+        """Os `tamanho` bytes de `arquivo` a partir de `posicao`, ou None se não estão na cache."""
+        dados = self._blocos.get((arquivo, posicao))
+        if dados is None or len(dados) < tamanho:
+            self.faltas += 1
+            _FALTAS.inc()
+            return None
+        self._blocos.move_to_end((arquivo, posicao))
+        self.acertos += 1
+        _ACERTOS.inc()
+        return memoryview(dados)[:tamanho]
+
+    def put(self, arquivo, posicao, dados, descartar=True):
+        """
+        Guarda uma cópia de `dados`, que começam em `posicao` de `arquivo`.
+        Com `descartar` False, só guarda se couber sem tirar nenhum bloco.
+        """
+        if len(dados) > (self.memoria if descartar else self.memoria - self.ocupado):
+            return
+        chave = (arquivo, posicao)
+        antigo = self._blocos.pop(chave, None)
+        if antigo is not None:
+            self.ocupado -= len(antigo)
+        self._blocos[chave] = bytes(dados)
+        self._posicoes.setdefault(arquivo, set()).add(posicao)
+        self.ocupado += len(dados)
+        while self.ocupado > self.memoria:
+            (arquivo, posicao), antigo = self._blocos.popitem(last=False)
+            self._esquecer(arquivo, posicao)
+            self.ocupado -= len(antigo)
+            self.descartados += 1
+            _DESCARTADOS.inc()
+
+    def invalidate(self, arquivo):
+        """Esquece todos os blocos de `arquivo` (ele vai ser regravado)."""
+        for posicao in self._posicoes.pop(arquivo, ()):
+            self.ocupado -= len(self._blocos.pop((arquivo, posicao)))
+
+    def _esquecer(self, arquivo, posicao):
+        posicoes = self._posicoes[arquivo]
+        posicoes.discard(posicao)
+        if not posicoes:
+            del self._posicoes[arquivo]
+
+    @property
+    def estatisticas(self):
+        consultas = self.acertos + self.faltas
+        return {"acertos": self.acertos, "faltas": self.faltas, "descartados": self.descartados,
+                "ocupado": self.ocupado, "memoria": self.memoria,
+                "taxa_acerto": self.acertos / consultas if consultas else None}
+
+
+class CachedFile(io.RawIOBase):
+    """
+    `caminho` aberto só para leitura, servido por `cache`: cada readinto
+    tenta a cache na posição atual e, se não acha, lê do disco e guarda.
+    Não tem fileno, então o remetente (rdt/window.py) não tenta mapeá-lo
+    e lê bloco a bloco.
+    """
+
+    def __init__(self, caminho, cache):
+        super().__init__()
+        self.caminho = caminho
+        self.cache = cache
+        self._arquivo = open(caminho, "rb")
+        self._posicao = 0
+        self.acertos = 0
+        self.faltas = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, posicao, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            posicao += self._posicao
+        elif whence == io.SEEK_END:
+            posicao += os.fstat(self._arquivo.fileno()).st_size
+        self._posicao = posicao
+        return posicao
+
+    def tell(self):
+        return self._posicao
+
+    def readinto(self, buffer):
+        if not len(buffer):
+            return 0
+        dados = self.cache.get(self.caminho, self._posicao, len(buffer))
+        if dados is not None:
+            tamanho = len(dados)
+            buffer[:tamanho] = dados
+            self.acertos += 1
+        else:
+            self._arquivo.seek(self._posicao)
+            tamanho = self._arquivo.readinto(buffer)
+            if tamanho:
+                ##Só entra no espaço livre: lendo do disco um arquivo maior que a cache,
+                ##cada bloco tiraria outro que o mesmo eco ainda vai ler
+                self.cache.put(self.caminho, self._posicao, memoryview(buffer)[:tamanho], descartar=False)
+            self.faltas += 1
+        self._posicao += tamanho
+        return tamanho
+
+    def close(self):
+        self._arquivo.close()
+        super().close()
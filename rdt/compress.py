@@ -0,0 +1,67 @@
+"""
+Compressão por bloco, com detecção de conteúdo que não comprime.
+
+Com `compressao` no SYN (o nível do zlib, de 1 a 9), o remetente comprime o
+payload de cada pacote de dados e o marca com FLAG_ZLIB; o receptor
+descomprime antes de gravar. Cada bloco é comprimido sozinho: um fluxo único
+de compressão exigiria que os blocos chegassem e fossem lidos em ordem, e o
+SR, o FEC e a retomada dependem de cada bloco ser independente. O bloco
+continua ocupando `bloco` bytes no arquivo; o que diminui é o pacote.
+
+Conteúdo já comprimido (JPEG, ZIP, a maior parte de um PDF) custaria CPU
+sem ganho nenhum. Antes de comprimir um bloco, BlockCompressor comprime só
+AMOSTRA bytes no nível mais rápido; se nem isso encolhe para LIMIAR do
+tamanho, o bloco vai como está. Cada bloco incompressível seguido dobra
+quantos blocos seguintes vão direto, sem nem a amostra (até PULAR_MAXIMO),
+e um bloco que comprime volta a testar todos. Um pacote comprimido que não
+ficou menor que LIMIAR do original também vai sem compressão.
+
+Só o zlib da biblioteca padrão: o formato de cada payload é indicado pela
+flag, então outro algoritmo pode entrar depois com outra flag.
+"""
+
+import zlib
+
+NIVEL = 6 # nível padrão do zlib (1: mais rápido, 9: menor)
+AMOSTRA = 4096 # bytes comprimidos para testar se o bloco vale a pena
+LIMIAR = 0.9 # comprime só se o resultado ficar abaixo desta fração do original
+PULAR_MAXIMO = 64 # maior sequência de blocos enviados sem testar, depois de blocos incompressíveis
+
+
+class BlockCompressor:
+    """Comprime blocos independentes, pulando os que não comprimem."""
+
+    def __init__(self, nivel=NIVEL):
+        self.nivel = nivel
+        self._pular = 0 # blocos que ainda vão sem teste
+        self._intervalo = 1 # quantos blocos pular depois do próximo bloco incompressível
+
+    def compress(self, dados):
+        """Retorna (payload, comprimido): os dados comprimidos, ou os próprios `dados`."""
+        if self._pular:
+            self._pular -= 1
+            return dados, False
+        if len(dados) <= AMOSTRA or len(zlib.compress(dados[:AMOSTRA], 1)) < LIMIAR * AMOSTRA:
+            comprimidos = zlib.compress(dados, self.nivel)
+            if len(comprimidos) < LIMIAR * len(dados):
+                self._intervalo = 1
+                return comprimidos, True
+        self._pular = self._intervalo
+        self._intervalo = min(self._intervalo * 2, PULAR_MAXIMO)
+        return dados, False
+
+
+def decompress(dados, limite):
+    """
+    Descomprime um payload que deve ter no máximo `limite` bytes. Retorna
+    None se ele for inválido ou passar do limite (um pacote não pode
+    escrever além do próprio bloco).
+    """
+    descompressor = zlib.decompressobj()
+    try:
+        saida = descompressor.decompress(dados, limite)
+    except zlib.error:
+        return None
+    if descompressor.unconsumed_tail or not descompressor.eof:
+        return None
+    return saida
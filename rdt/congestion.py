@@ -0,0 +1,75 @@
+"""
+Controle de congestionamento AIMD (no estilo do TCP Reno) para o RDT 3.0.
+
+A janela de congestionamento (cwnd, em pacotes) começa pequena e:
+ - cresce 1 pacote por ACK enquanto estiver abaixo de ssthresh (slow start);
+ - cresce ~1 pacote por RTT depois disso (aumento aditivo);
+ - cai pela metade quando uma perda é detectada (diminuição multiplicativa),
+   no máximo uma vez por janela de dados;
+ - volta para 1 pacote quando há timeouts seguidos, que indicam o caminho
+   travado.
+
+A janela efetiva do remetente é o mínimo entre cwnd, a janela anunciada pelo
+receptor e o TAMANHO_JANELA configurado nos scripts.
+
+Transferências seguidas pelo mesmo caminho (rdt/session.py, ou o servidor
+devolvendo vários arquivos ao mesmo cliente) podem usar o mesmo objeto: a
+próxima começa com a cwnd e o ssthresh em que a anterior terminou, sem
+repetir o slow start.
+"""
+
+CWND_INICIAL = 4
+CWND_MINIMA = 1
+SSTHRESH_INICIAL = 64
+
+
+class CongestionControl:
+    """Mantém cwnd/ssthresh de um remetente."""
+
+    def __init__(self, janela_max, cwnd_inicial=CWND_INICIAL, ssthresh=SSTHRESH_INICIAL):
+        self.janela_max = janela_max
+        self.cwnd = float(min(cwnd_inicial, janela_max))
+        self.ssthresh = float(ssthresh)
+        self._recuperacao_ate = -1 # perdas de seq abaixo disso já foram contadas
+
+    @property
+    def janela(self):
+        """cwnd arredondada para um número inteiro de pacotes."""
+        return max(int(self.cwnd), CWND_MINIMA)
+
+    @property
+    def slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    def restart(self, janela_max):
+        """
+        Começa uma nova transferência pelo mesmo caminho, mantendo cwnd e
+        ssthresh (como o Linux com tcp_slow_start_after_idle = 0). As
+        sequências recomeçam do 0, e a janela máxima pode ser outra.
+        """
+        self.janela_max = janela_max
+        self.cwnd = min(self.cwnd, janela_max)
+        self._recuperacao_ate = -1
+
+    def on_ack(self, novos):
+        """`novos` pacotes foram confirmados pela primeira vez."""
+        for _ in range(novos):
+            if self.slow_start:
+                self.cwnd += 1
+            else:
+                self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.janela_max)
+
+    def on_loss(self, seq, next_seq):
+        """Perda do pacote `seq`; reduz a janela uma vez por janela de dados."""
+        if seq < self._recuperacao_ate:
+            return
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = self.ssthresh
+        self._recuperacao_ate = next_seq
+
+    def on_timeout(self, next_seq):
+        """Timeouts seguidos sem nenhum ACK: recomeça do slow start."""
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = CWND_MINIMA
+        self._recuperacao_ate = next_seq
@@ -0,0 +1,287 @@
+"""
+Reenvio por diferenças (delta), no estilo do rsync.
+
+Quando o cliente envia de novo um arquivo que o servidor já tem em
+`recebido_<nome>`, quase sempre só uma parte mudou. Com send_delta, o
+cliente primeiro abre uma sessão que não envia nada (`"delta":
+"assinaturas"` no SYN, com o tamanho de bloco proposto) e o servidor
+responde, no lugar do eco, com a assinatura de cada bloco completo da cópia
+dele: um checksum fraco (Adler-32) e um forte (BLAKE2b de 16 bytes). O
+cliente procura esses blocos no arquivo novo, em qualquer posição, e monta
+uma lista de instruções: copiar um trecho do arquivo antigo ou inserir bytes
+literais. As instruções vão como um upload comum, numa sessão com `"delta":
+"instrucoes"` e `base` (tamanho e data de modificação do arquivo assinado);
+o servidor monta o arquivo novo ao lado do antigo e troca um pelo outro.
+
+A busca é a do rsync: o Adler-32 de uma janela é atualizado byte a byte,
+e só as janelas com o checksum fraco de algum bloco são confirmadas pelo
+forte. Onde os arquivos coincidem, o cliente só calcula o hash forte de cada
+bloco (em C); a busca byte a byte, em Python, só roda depois de um bloco que
+não bate, e cobre no máximo BUSCA blocos. Se não acha nada, os blocos
+seguintes só testam o hash forte, em número que dobra a cada busca sem
+resultado (até PULAR_MAXIMO), como na detecção de conteúdo incompressível
+de rdt/compress.py: um arquivo todo diferente não é percorrido byte a byte.
+
+O que o servidor devolve depois não muda: o eco do arquivo inteiro ou, no
+modo resumo (rdt/verify.py), o relatório do arquivo reconstruído.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import struct
+import tempfile
+import zlib
+from rdt.buffers import map_file, send_parts
+from rdt.pmtu import BLOCO_BASE
+from rdt.window import WindowSender, run_sender, recv_window, new_session_id, BUFFER_SIZE
+from rdt.log import get_logger, log_event, INFO
+
+DELTA_ASSINATURAS = "assinaturas" # sessão que só pede as assinaturas do arquivo do servidor
+DELTA_INSTRUCOES = "instrucoes" # upload das instruções que montam o arquivo novo
+BLOCO_MINIMO = 1024
+BLOCO_MAXIMO = 64 * 1024
+BUSCA = 4 # blocos percorridos byte a byte procurando um bloco conhecido, depois de um que não bate
+PULAR_MAXIMO = 64 # maior sequência de blocos testados só pelo hash forte, depois de buscas sem resultado
+LIMIAR = 0.9 # se as instruções passarem dessa fração do arquivo, ele vai inteiro
+PEDACO = 1024 * 1024 # maior leitura ao montar o arquivo
+
+_ENTRADA = struct.Struct("!I16s") # assinatura de um bloco: Adler-32, BLAKE2b
+_INSTRUCAO = struct.Struct("!BQQ") # tipo, origem no arquivo antigo (cópia), tamanho
+COPIA = 0
+LITERAL = 1
+_MODULO = 65521 # módulo do Adler-32
+
+log = get_logger("rdt.delta")
+
+
+def block_size(tamanho):
+    """Bloco das assinaturas para um arquivo de `tamanho` bytes: ~raiz do tamanho, como o rsync."""
+    return min(max(math.isqrt(tamanho) // 1024 * 1024, BLOCO_MINIMO), BLOCO_MAXIMO)
+
+def base_id(caminho):
+    """Identifica a versão do arquivo assinado: se mudar, as assinaturas não valem mais."""
+    info = os.stat(caminho)
+    return f"{info.st_size}-{info.st_mtime_ns}"
+
+def _forte(dados):
+    return hashlib.blake2b(dados, digest_size=16).digest()
+
+
+def signatures(caminho, bloco):
+    """
+    Assinaturas dos blocos completos de `caminho` (vazias se ele não existe),
+    no formato da resposta: uma linha JSON com bloco e base, e uma entrada
+    _ENTRADA por bloco.
+    """
+    bloco = min(max(int(bloco), BLOCO_MINIMO), BLOCO_MAXIMO)
+    saida = io.BytesIO()
+    cabecalho = {"bloco": bloco, "base": None}
+    if os.path.exists(caminho):
+        cabecalho["base"] = base_id(caminho)
+        with open(caminho, "rb") as arquivo:
+            saida.write(json.dumps(cabecalho).encode() + b"\n")
+            while len(dados := arquivo.read(bloco)) == bloco:
+                saida.write(_ENTRADA.pack(zlib.adler32(dados), _forte(dados)))
+    else:
+        saida.write(json.dumps(cabecalho).encode() + b"\n")
+    return saida.getvalue()
+
+def parse_signatures(dados):
+    """Lê a resposta de signatures(): {"bloco", "base", "blocos": [(fraco, forte)]}."""
+    linha, _, entradas = bytes(dados).partition(b"\n")
+    assinaturas = json.loads(linha)
+    assinaturas["blocos"] = list(_ENTRADA.iter_unpack(entradas[:len(entradas) // _ENTRADA.size * _ENTRADA.size]))
+    return assinaturas
+
+
+def _procurar(dados, inicio, fim, bloco, fracos, fortes):
+    ##Primeira posição k em [inicio, fim) em que dados[k:k + bloco] é um bloco conhecido: (k, índice) ou None.
+    ##O Adler-32 da janela anda um byte por vez (A e B são as duas metades do checksum)
+    trecho = bytes(dados[inicio:fim + bloco - 1])
+    adler = zlib.adler32(trecho[:bloco])
+    a, b = adler & 0xffff, adler >> 16
+    for k in range(fim - inicio):
+        if (b << 16 | a) in fracos:
+            indice = fortes.get(_forte(trecho[k:k + bloco]))
+            if indice is not None:
+                return inicio + k, indice
+        if k + bloco < len(trecho):
+            sai, entra = trecho[k], trecho[k + bloco]
+            a = (a - sai + entra) % _MODULO
+            b = (b - bloco * sai + a - 1) % _MODULO
+    return None
+
+def make_delta(dados, assinaturas, saida):
+    """
+    Escreve em `saida` as instruções que montam `dados` (bytes, memoryview
+    ou mmap) a partir do arquivo descrito por `assinaturas`. Retorna
+    quantos bytes são copiados do arquivo antigo.
+    """
+    bloco = assinaturas["bloco"]
+    fortes = {}
+    for indice, (_, forte) in enumerate(assinaturas["blocos"]):
+        fortes.setdefault(forte, indice)
+    fracos = {fraco for fraco, _ in assinaturas["blocos"]}
+    tamanho = len(dados)
+    copia = None # [origem, tamanho] da cópia ainda não escrita, para juntar blocos seguidos
+    literal = 0 # início dos bytes ainda não cobertos por nenhuma instrução
+    copiados = 0
+    pos = 0
+    pular = 0 # blocos que ainda só testam o hash forte, sem busca byte a byte
+    intervalo = 1 # quantos blocos pular depois da próxima busca sem resultado
+
+    def emitir_copia():
+        if copia is not None:
+            saida.write(_INSTRUCAO.pack(COPIA, copia[0], copia[1]))
+
+    while pos + bloco <= tamanho:
+        indice = fortes.get(_forte(dados[pos:pos + bloco]))
+        if indice is None:
+            if pular:
+                pular -= 1
+                pos += bloco
+                continue
+            ##Procura um bloco conhecido em qualquer posição dos próximos BUSCA blocos
+            fim = min(pos + 1 + BUSCA * bloco, tamanho - bloco + 1)
+            achado = _procurar(dados, pos + 1, fim, bloco, fracos, fortes) if pos + 1 < fim else None
+            if achado is None:
+                pos = fim
+                pular = intervalo
+                intervalo = min(intervalo * 2, PULAR_MAXIMO)
+                continue
+            pos, indice = achado
+        intervalo = 1
+        if literal < pos:
+            emitir_copia()
+            copia = None
+            saida.write(_INSTRUCAO.pack(LITERAL, 0, pos - literal))
+            saida.write(dados[literal:pos])
+        origem = indice * bloco
+        if copia is not None and copia[0] + copia[1] == origem:
+            copia[1] += bloco
+        else:
+            emitir_copia()
+            copia = [origem, bloco]
+        copiados += bloco
+        pos += bloco
+        literal = pos
+    emitir_copia()
+    if literal < tamanho:
+        saida.write(_INSTRUCAO.pack(LITERAL, 0, tamanho - literal))
+        saida.write(dados[literal:tamanho])
+    return copiados
+
+def apply_delta(base, instrucoes, saida, resumo=None):
+    """
+    Monta em `saida` o arquivo descrito por `instrucoes`, copiando trechos de
+    `base` (o arquivo antigo, aberto para leitura). Com `resumo`
+    (rdt/verify.py), soma a ele o arquivo montado. Retorna o tamanho do
+    arquivo montado. Levanta ValueError se as instruções forem inválidas.
+    """
+    tamanho_base = os.fstat(base.fileno()).st_size
+    total = 0
+    while cabecalho := instrucoes.read(_INSTRUCAO.size):
+        if len(cabecalho) < _INSTRUCAO.size:
+            raise ValueError("instrução incompleta")
+        tipo, origem, tamanho = _INSTRUCAO.unpack(cabecalho)
+        if tipo == COPIA:
+            if origem + tamanho > tamanho_base:
+                raise ValueError("cópia além do fim do arquivo antigo")
+            base.seek(origem)
+            fonte = base
+        elif tipo == LITERAL:
+            fonte = instrucoes
+        else:
+            raise ValueError(f"instrução desconhecida: {tipo}")
+        while tamanho:
+            dados = fonte.read(min(tamanho, PEDACO))
+            if not dados:
+                raise ValueError("dados literais incompletos")
+            saida.write(dados)
+            if resumo is not None:
+                resumo.update(dados)
+            tamanho -= len(dados)
+            total += len(dados)
+    return total
+
+
+def _mapear(arquivo, inicio, tamanho):
+    ##O trecho a enviar, sem copiar o arquivo para a memória quando dá para mapear
+    mapa = map_file(arquivo)
+    if mapa is not None:
+        return memoryview(mapa)[inicio:inicio + tamanho]
+    arquivo.seek(inicio)
+    return arquivo.read(tamanho)
+
+def _sender(sock, destino, rto, prob_perda, opcoes):
+    ##Como send_window, mas só a primeira sessão sonda o caminho: as outras propõem o bloco que passou
+    opcoes = dict(opcoes)
+    if opcoes.get("sondar") is None:
+        opcoes["sondar"] = opcoes.get("bloco", BUFFER_SIZE) > BLOCO_BASE
+
+    def enviar(arquivo, metadados, sessao, resumo=None):
+        remetente = WindowSender(arquivo, lambda *partes: send_parts(sock, partes, destino), metadados, sessao,
+                                 rto=rto, prob_perda=prob_perda, resumo=resumo, **opcoes)
+        resultado = run_sender(sock, remetente)
+        if remetente.conectado:
+            opcoes.update(bloco=remetente.bloco_sondado, sondar=False)
+        return resultado
+    return enviar
+
+def send_delta(sock, destino, arquivo, metadados, sessao=0, rto=None, prob_perda=0.0, resumo=None, enviar=None,
+               **opcoes):
+    """
+    Como send_window, mas, se o servidor já tem uma versão de
+    `metadados["nome"]`, envia só as instruções que montam o arquivo a partir
+    dela. Quando não compensa (o servidor não tem o arquivo, ou quase tudo
+    mudou) ou o arquivo do servidor mudou entre as duas sessões, envia o
+    arquivo inteiro. Retorna (pacotes_enviados, total_enviado, retransmissoes),
+    com os bytes do que de fato foi enviado.
+    Cada sessão sai por `enviar(arquivo, metadados, sessao, resumo)` (ex.:
+    TransferSession, que guarda o bloco sondado); sem ela, como send_window
+    com `opcoes`, e só a primeira sessão sonda o caminho.
+    Levanta ConnectionRefusedError se o servidor recusar a transferência.
+    """
+    if enviar is None:
+        enviar = _sender(sock, destino, rto, prob_perda, opcoes)
+    inicio = arquivo.tell()
+    tamanho = int(metadados["tamanho"])
+    pedido = {"nome": metadados["nome"], "tamanho": 0, "delta": DELTA_ASSINATURAS, "bloco_delta": block_size(tamanho)}
+    sessao_assinaturas = new_session_id()
+    enviar(io.BytesIO(), pedido, sessao_assinaturas)
+    resposta = io.BytesIO()
+    recv_window(sock, resposta, sessao_assinaturas, rto=rto, prob_perda=prob_perda)
+    assinaturas = parse_signatures(resposta.getvalue())
+
+    if assinaturas["blocos"]:
+        with tempfile.TemporaryFile() as instrucoes:
+            dados = _mapear(arquivo, inicio, tamanho)
+            try:
+                copiados = make_delta(dados, assinaturas, instrucoes)
+            finally:
+                if isinstance(dados, memoryview):
+                    dados.release()
+            tamanho_delta = instrucoes.tell()
+            log_event(log, INFO, "delta", "Delta de '%(nome)s': %(copiados)d de %(tamanho)d bytes já estão no servidor; instruções com %(delta)d bytes.",
+                      nome=metadados["nome"], copiados=copiados, tamanho=tamanho, delta=tamanho_delta)
+            if tamanho_delta < LIMIAR * tamanho:
+                instrucoes.seek(0)
+                envio = dict(metadados, tamanho=tamanho_delta, delta=DELTA_INSTRUCOES, base=assinaturas["base"],
+                             final=tamanho)
+                try:
+                    resultado = enviar(instrucoes, envio, sessao)
+                except ConnectionRefusedError as erro:
+                    ##Ex.: o arquivo do servidor mudou desde as assinaturas; vai inteiro
+                    log_event(log, INFO, "delta", "Delta recusado (%(erro)s). Enviando o arquivo inteiro.",
+                              erro=str(erro))
+                else:
+                    if resumo is not None:
+                        ##O resumo é do arquivo, não das instruções
+                        arquivo.seek(inicio)
+                        resumo.update_from_file(arquivo, tamanho)
+                    return resultado
+    arquivo.seek(inicio)
+    return enviar(arquivo, metadados, sessao, resumo)
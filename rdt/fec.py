@@ -0,0 +1,172 @@
+"""
+Correção de erros antecipada (FEC) para caminhos com perda.
+
+Sem FEC, cada bloco perdido custa pelo menos um timeout mais a volta da
+retransmissão; num caminho longo e com perda, é isso que atrasa o fim da
+transferência. Com FEC (só no modo SR), o remetente junta os blocos que
+envia em grupos de até K (`fec` no SYN) e, ao fechar cada grupo, envia M
+pacotes de reparo (TIPO_REPARO). Com quaisquer K dos K + M pacotes, o
+receptor reconstrói os blocos que faltam, sem esperar retransmissão.
+
+O código é sistemático (os blocos vão como estão) e MDS: cada reparo j é a
+soma, em GF(2^8), de cada bloco i multiplicado por um coeficiente de uma
+matriz de Cauchy, então qualquer conjunto de até M blocos perdidos pode ser
+recuperado. As colunas são escaladas para que o reparo 0 seja só o XOR dos
+blocos (paridade simples, o caso mais comum). As contas por byte não são
+feitas em Python: multiplicar um bloco por uma constante é um
+`bytes.translate` com a tabela da constante, e somar blocos é um XOR de
+inteiros grandes (int.from_bytes).
+
+Um grupo fecha quando chega a K blocos, no fim do arquivo ou depois de
+ESPERA_GRUPO * RTT (a janela pode não deixar sair K blocos antes de o
+primeiro expirar). Depois dos reparos, os blocos do grupo só são
+retransmitidos se continuarem sem ACK por mais um RTO. M é escolhido para
+cada grupo por RedundancyControl, a partir da perda observada: o menor M
+que deixa a chance de o grupo não se recuperar sozinho abaixo de ALVO. Sem
+perda, M cai para 0 e o FEC não custa nada no fio.
+
+No fio, um reparo leva no cabeçalho seq = primeiro bloco do grupo, ack = j
+e janela = quantos blocos o grupo tem; o payload tem o tamanho do maior
+bloco (os menores contam como completados com zeros). Blocos reconstruídos
+são confirmados com FLAG_FEC, que o remetente conta como perda.
+"""
+
+import math
+
+GRUPO = 16 # K padrão: blocos por grupo
+GRUPO_MAXIMO = 128 # maior K que o receptor aceita
+REPAROS_MAXIMO = 8 # maior M por grupo
+PERDA_INICIAL = 0.02 # estimativa antes de qualquer ACK
+PESO = 1 / 32 # peso de cada pacote na média móvel da perda
+ALVO = 0.01 # chance aceitável de um grupo precisar de retransmissão
+ESPERA_GRUPO = 0.25 # grupo incompleto fecha depois de ESPERA_GRUPO * SRTT
+
+##Tabelas de GF(2^8) com o polinômio x^8 + x^4 + x^3 + x^2 + 1 (0x11d), o mesmo do Reed-Solomon usual
+_EXP = [0] * 510
+_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _EXP[_i] = _EXP[_i + 255] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+del _x, _i
+
+_TABELAS = {} # constante -> tabela de bytes.translate que multiplica cada byte por ela
+
+
+def _mul(a, b):
+    if not a or not b:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def _inv(a):
+    return _EXP[255 - _LOG[a]]
+
+def _tabela(c):
+    tabela = _TABELAS.get(c)
+    if tabela is None:
+        tabela = _TABELAS[c] = bytes(_mul(c, x) for x in range(256))
+    return tabela
+
+def coefficient(j, i):
+    """
+    Coeficiente do bloco `i` no reparo `j`: Cauchy 1 / (x_j + y_i), com
+    x_j = j e y_i = 128 + i, escalado pela coluna para o reparo 0 ser o XOR.
+    """
+    y = GRUPO_MAXIMO + i
+    return _mul(_inv(j ^ y), y)
+
+def _termo(c, dados):
+    ##c * dados, como inteiro (little-endian: um bloco menor equivale a completar com zeros)
+    if c == 1:
+        return int.from_bytes(dados, "little")
+    return int.from_bytes(bytes(dados).translate(_tabela(c)), "little")
+
+
+def encode(blocos, m):
+    """
+    Os `m` reparos de um grupo com `blocos` (bytes ou memoryview), cada um
+    do tamanho do maior bloco. Retorna uma lista de bytes, na ordem de j.
+    """
+    tamanho = max(len(bloco) for bloco in blocos)
+    inteiros = [int.from_bytes(bloco, "little") for bloco in blocos]
+    reparos = []
+    for j in range(m):
+        soma = 0
+        if j == 0:
+            for inteiro in inteiros:
+                soma ^= inteiro
+        else:
+            for i, bloco in enumerate(blocos):
+                soma ^= _termo(coefficient(j, i), bloco)
+        reparos.append(soma.to_bytes(tamanho, "little"))
+    return reparos
+
+def _inverter(matriz):
+    ##Gauss-Jordan em GF(2^8); a matriz é sempre inversível (toda submatriz de Cauchy é)
+    n = len(matriz)
+    a = [linha[:] + [int(i == j) for j in range(n)] for i, linha in enumerate(matriz)]
+    for coluna in range(n):
+        pivo = next(i for i in range(coluna, n) if a[i][coluna])
+        a[coluna], a[pivo] = a[pivo], a[coluna]
+        fator = _inv(a[coluna][coluna])
+        a[coluna] = [_mul(fator, v) for v in a[coluna]]
+        for i in range(n):
+            if i != coluna and a[i][coluna]:
+                f = a[i][coluna]
+                a[i] = [v ^ _mul(f, p) for v, p in zip(a[i], a[coluna])]
+    return [linha[n:] for linha in a]
+
+def decode(presentes, reparos, faltando):
+    """
+    Reconstrói os blocos `faltando` (índices dentro do grupo) a partir dos
+    blocos `presentes` ({índice: dados}) e de pelo menos len(faltando)
+    `reparos` ({j: dados}). Retorna {índice: bytes}, do tamanho dos reparos.
+    """
+    linhas = sorted(reparos)[:len(faltando)]
+    tamanho = len(reparos[linhas[0]])
+    ##Tira dos reparos a parte dos blocos presentes; sobra a soma só dos que faltam
+    sindromes = []
+    for j in linhas:
+        soma = int.from_bytes(reparos[j], "little")
+        for i, dados in presentes.items():
+            soma ^= _termo(coefficient(j, i), dados)
+        sindromes.append(soma.to_bytes(tamanho, "little"))
+    inversa = _inverter([[coefficient(j, i) for i in faltando] for j in linhas])
+    recuperados = {}
+    for k, i in enumerate(faltando):
+        soma = 0
+        for c, sindrome in zip(inversa[k], sindromes):
+            if c:
+                soma ^= _termo(c, sindrome)
+        recuperados[i] = soma.to_bytes(tamanho, "little")
+    return recuperados
+
+
+class RedundancyControl:
+    """
+    Estima a perda de pacotes do caminho (média móvel, um ponto por pacote
+    de dados) e escolhe quantos reparos cada grupo leva.
+    """
+
+    def __init__(self, perda=PERDA_INICIAL, maximo=REPAROS_MAXIMO, alvo=ALVO):
+        self.perda = perda
+        self.maximo = maximo
+        self.alvo = alvo
+
+    def sample(self, perdido):
+        """Um pacote de dados chegou (False) ou se perdeu (True)."""
+        self.perda += PESO * ((1.0 if perdido else 0.0) - self.perda)
+
+    def repairs(self, n):
+        """Menor M (até `maximo`) com P(mais de M perdas entre n + M pacotes) <= alvo."""
+        p = self.perda
+        for m in range(self.maximo + 1):
+            total = n + m
+            ##P(X <= m) para X ~ Binomial(total, p)
+            acumulada = sum(math.comb(total, k) * p ** k * (1 - p) ** (total - k) for k in range(m + 1))
+            if 1 - acumulada <= self.alvo:
+                return m
+        return self.maximo
@@ -0,0 +1,247 @@
+"""
+Proxy UDP que degrada a rede de forma reproduzível.
+
+Substitui o `simulate_loss` dos scripts nos testes de desempenho: em vez de
+cada processo sortear perdas só no envio, com o `random` global, o proxy
+fica entre cliente e servidor (cliente -> proxy -> servidor e de volta) e
+aplica, em cada sentido, as degradações de um perfil:
+
+ - perda independente (`perda`) ou em rajadas, pelo modelo de
+   Gilbert-Elliott (`rajadas`: dois estados, "bom" e "ruim", cada um com sua
+   taxa de perda e probabilidades de troca de estado);
+ - atraso fixo mais variação (`atraso`, `variacao`, `distribuicao`:
+   "uniforme", "normal" ou "exponencial"), em segundos. A variação não
+   inverte a ordem dos pacotes: cada um sai no máximo junto com o anterior;
+ - reordenação (`reordenar`: chance de um pacote ficar `atraso_reordem`
+   segundos a mais na fila e chegar depois dos seguintes);
+ - duplicação (`duplicar`) e corrupção de um bit (`corromper`);
+ - limite de banda (`taxa`, bytes/s) com fila de `fila` bytes, descartando
+   o que não cabe (como um roteador com buffer finito).
+
+Todo sorteio vem de um random.Random com semente própria por sentido, então
+a mesma semente e o mesmo perfil produzem as mesmas decisões para a mesma
+sequência de pacotes. Os perfis prontos estão em PERFIS; um perfil também
+pode ser um arquivo JSON com as mesmas chaves, no nível de cima (valem para
+os dois sentidos) ou dentro de "ida" (cliente -> servidor) e "volta".
+
+Cada cliente ganha um socket próprio do lado do servidor, então o servidor
+continua vendo um endereço diferente por cliente.
+"""
+
+import asyncio
+import json
+import random
+import socket
+
+PERFIL_PADRAO = {
+    "perda": 0.0, "rajadas": None, "atraso": 0.0, "variacao": 0.0, "distribuicao": "uniforme",
+    "reordenar": 0.0, "atraso_reordem": 0.01, "duplicar": 0.0, "corromper": 0.0,
+    "taxa": None, "fila": 256 * 1024,
+}
+
+PERFIS = {
+    "limpo": {},
+    "perda_5": {"perda": 0.05},
+    "perda_20": {"perda": 0.2}, # o mesmo que o antigo PROB_PERDA = 0.2, mas nos dois sentidos
+    ##Perdas em rajadas: ~2% das vezes entra no estado ruim, que dura ~5 pacotes e perde metade deles
+    "rajadas": {"rajadas": {"p": 0.02, "r": 0.2, "perda_bom": 0.0, "perda_ruim": 0.5}},
+    "wifi": {"atraso": 0.003, "variacao": 0.002, "distribuicao": "normal", "duplicar": 0.01,
+             "rajadas": {"p": 0.01, "r": 0.3, "perda_bom": 0.001, "perda_ruim": 0.3}},
+    "wan": {"atraso": 0.04, "variacao": 0.005, "distribuicao": "normal", "perda": 0.01,
+            "reordenar": 0.02, "taxa": 10 * 1024 * 1024, "fila": 512 * 1024},
+    "satelite": {"atraso": 0.3, "variacao": 0.01, "perda": 0.005, "taxa": 2 * 1024 * 1024,
+                 "fila": 1024 * 1024},
+    "caotico": {"atraso": 0.01, "variacao": 0.01, "distribuicao": "exponencial", "perda": 0.05,
+                "reordenar": 0.05, "duplicar": 0.05, "corromper": 0.01},
+}
+
+TAMANHO_MAXIMO = 65535 # maior datagrama que o proxy repassa
+
+
+def load_profile(perfil):
+    """
+    Resolve `perfil` (nome de PERFIS, caminho de um JSON ou dict) em
+    {"ida": {...}, "volta": {...}}, com todas as chaves preenchidas.
+    """
+    if isinstance(perfil, str):
+        if perfil in PERFIS:
+            perfil = PERFIS[perfil]
+        else:
+            with open(perfil) as f:
+                perfil = json.load(f)
+    comum = {chave: valor for chave, valor in perfil.items() if chave not in ("ida", "volta")}
+    ##As chaves de um sentido substituem as do nível de cima só nele
+    for onde, chaves in [("perfil", comum)] + [(sentido, perfil.get(sentido, {})) for sentido in ("ida", "volta")]:
+        desconhecidas = set(chaves) - set(PERFIL_PADRAO)
+        if desconhecidas:
+            raise ValueError(f"chaves de perfil desconhecidas em {onde}: {sorted(desconhecidas)}")
+    return {sentido: {**PERFIL_PADRAO, **comum, **perfil.get(sentido, {})} for sentido in ("ida", "volta")}
+
+
+class GilbertElliott:
+    """
+    Perdas em rajadas: no estado "bom" perde com chance `perda_bom` e passa
+    para o "ruim" com chance `p`; no "ruim" perde com chance `perda_ruim` e
+    volta com chance `r`. A rajada média dura 1/r pacotes.
+    """
+
+    def __init__(self, rng, p, r, perda_bom=0.0, perda_ruim=1.0):
+        self.rng = rng
+        self.p = p
+        self.r = r
+        self.perda_bom = perda_bom
+        self.perda_ruim = perda_ruim
+        self.ruim = False
+
+    def perde(self):
+        if self.ruim:
+            if self.rng.random() < self.r:
+                self.ruim = False
+        elif self.rng.random() < self.p:
+            self.ruim = True
+        return self.rng.random() < (self.perda_ruim if self.ruim else self.perda_bom)
+
+
+class Impairment:
+    """Degradações de um sentido: decide o destino de cada pacote, sem fazer E/S."""
+
+    def __init__(self, config, rng):
+        self.config = config
+        self.rng = rng
+        self.rajadas = GilbertElliott(rng, **config["rajadas"]) if config["rajadas"] else None
+        self._link_livre = 0.0 # com limite de banda: quando o último pacote da fila termina de sair
+        self._ultima_entrega = 0.0 # entrega mais tardia agendada, fora os pacotes reordenados
+        self.estatisticas = {"recebidos": 0, "perdidos": 0, "descartados_fila": 0, "duplicados": 0,
+                             "corrompidos": 0, "reordenados": 0}
+
+    def _perde(self):
+        if self.rajadas is not None:
+            return self.rajadas.perde()
+        return self.rng.random() < self.config["perda"]
+
+    def _atraso(self):
+        config = self.config
+        variacao = config["variacao"]
+        if not variacao:
+            return config["atraso"]
+        if config["distribuicao"] == "normal":
+            extra = self.rng.gauss(0.0, variacao)
+        elif config["distribuicao"] == "exponencial":
+            extra = self.rng.expovariate(1.0 / variacao)
+        else:
+            extra = self.rng.uniform(-variacao, variacao)
+        return max(config["atraso"] + extra, 0.0)
+
+    def plan(self, dados, agora):
+        """
+        Decide o que fazer com um pacote que chegou em `agora`.
+        Retorna uma lista de (instante de entrega, dados); vazia se foi perdido.
+        """
+        config = self.config
+        estatisticas = self.estatisticas
+        estatisticas["recebidos"] += 1
+        if self._perde():
+            estatisticas["perdidos"] += 1
+            return []
+        ##Limite de banda: o pacote espera a fila andar e ocupa o link por tamanho/taxa segundos
+        saida = agora
+        if config["taxa"]:
+            inicio = max(agora, self._link_livre)
+            if (inicio - agora) * config["taxa"] > config["fila"]:
+                estatisticas["descartados_fila"] += 1
+                return []
+            self._link_livre = saida = inicio + len(dados) / config["taxa"]
+        copias = 1
+        if self.rng.random() < config["duplicar"]:
+            copias = 2
+            estatisticas["duplicados"] += 1
+        entregas = []
+        for _ in range(copias):
+            instante = saida + self._atraso()
+            if self.rng.random() < config["reordenar"]:
+                instante += config["atraso_reordem"]
+                estatisticas["reordenados"] += 1
+            else:
+                instante = self._ultima_entrega = max(instante, self._ultima_entrega)
+            copia = dados
+            if dados and self.rng.random() < config["corromper"]:
+                copia = bytearray(dados)
+                copia[self.rng.randrange(len(copia))] ^= 1 << self.rng.randrange(8)
+                estatisticas["corrompidos"] += 1
+            entregas.append((instante, bytes(copia)))
+        return entregas
+
+
+class ImpairmentProxy:
+    """
+    Repassa datagramas entre clientes (que enviam para `porta`) e `destino`,
+    aplicando o perfil `perfil` (ver load_profile) com a semente `semente`.
+    Roda no laço asyncio atual, com sockets não bloqueantes e loop.add_reader.
+    """
+
+    def __init__(self, porta, destino, perfil="limpo", semente=0, host="127.0.0.1"):
+        self.loop = asyncio.get_running_loop()
+        self.destino = destino
+        self.perfil = load_profile(perfil)
+        ##Um gerador por sentido: o que acontece na ida não muda os sorteios da volta
+        self.ida = Impairment(self.perfil["ida"], random.Random(f"{semente}-ida"))
+        self.volta = Impairment(self.perfil["volta"], random.Random(f"{semente}-volta"))
+        self._buffer = bytearray(TAMANHO_MAXIMO)
+        self.clientes = {} # endereço do cliente -> socket do lado do servidor
+        self.sock = self._abrir((host, porta))
+        self.loop.add_reader(self.sock.fileno(), self._ler_clientes)
+
+    def _abrir(self, endereco):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind(endereco)
+        return sock
+
+    def _ler(self, sock):
+        """Datagramas na fila de `sock`, como (bytes, endereço)."""
+        while True:
+            try:
+                tamanho, endereco = sock.recvfrom_into(self._buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue ## ex.: ICMP "porta inalcançável" de um pacote anterior
+            yield self._buffer[:tamanho], endereco
+
+    def _ler_clientes(self):
+        agora = self.loop.time()
+        for dados, cliente in self._ler(self.sock):
+            lado_servidor = self.clientes.get(cliente)
+            if lado_servidor is None:
+                lado_servidor = self.clientes[cliente] = self._abrir(("0.0.0.0", 0))
+                self.loop.add_reader(lado_servidor.fileno(), self._ler_servidor, lado_servidor, cliente)
+            self._agendar(self.ida, lado_servidor, dados, self.destino, agora)
+
+    def _ler_servidor(self, lado_servidor, cliente):
+        agora = self.loop.time()
+        for dados, _ in self._ler(lado_servidor):
+            self._agendar(self.volta, self.sock, dados, cliente, agora)
+
+    def _agendar(self, sentido, sock, dados, destino, agora):
+        for instante, copia in sentido.plan(dados, agora):
+            if instante <= agora:
+                self._enviar(sock, copia, destino)
+            else:
+                self.loop.call_at(instante, self._enviar, sock, copia, destino)
+
+    def _enviar(self, sock, dados, destino):
+        try:
+            sock.sendto(dados, destino)
+        except OSError:
+            pass ## buffer cheio ou socket fechado: para quem está dos lados, é só mais uma perda
+
+    @property
+    def estatisticas(self):
+        return {"ida": dict(self.ida.estatisticas), "volta": dict(self.volta.estatisticas)}
+
+    def close(self):
+        for sock in [self.sock, *self.clientes.values()]:
+            self.loop.remove_reader(sock.fileno())
+            sock.close()
+        self.clientes.clear()
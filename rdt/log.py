@@ -0,0 +1,223 @@
+"""
+Logs com níveis, estruturados e baratos no caminho quente.
+
+Antes, cada pacote e cada ACK virava um print com f-string, formatado e
+escrito no terminal na hora: com arquivos grandes, a transferência passava
+mais tempo escrevendo na tela do que no socket. Agora os módulos usam o
+`logging` da biblioteca padrão, com estas regras:
+
+ - eventos por pacote são DEBUG e eventos de sessão são INFO. Com o nível
+   padrão (INFO), um evento por pacote custa uma comparação de nível: a
+   mensagem nem é formatada;
+ - cada evento leva seus campos (`evento`, `sessao`, `seq`...) num dict, que
+   serve tanto para formatar a mensagem de texto ("%(seq)d") quanto para a
+   saída em JSON (formato "json"), uma linha por evento;
+ - com `assincrono` (padrão), o registro só entra numa fila; uma thread
+   separada formata e escreve em lotes, então nem o DEBUG trava o laço de
+   envio esperando o terminal;
+ - `amostragem` (1 de cada N) e `por_segundo` limitam os eventos abaixo de
+   INFO. O próximo evento que passa avisa quantos foram suprimidos.
+
+Os scripts chamam configure() uma vez, no início; os módulos só pegam o seu
+logger com get_logger() e registram com log_event().
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+NIVEL_PADRAO = "INFO"
+LOTE = 256 # máximo de registros escritos de uma vez pela thread de escrita
+INTERVALO = 0.1 # segundos: um lote incompleto espera no máximo isso para ser escrito
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+_instalados = [] # handlers e threads do último configure(), desfeitos no próximo
+_configuracao = None # argumentos do último configure(), para refazer num processo filho
+
+
+def get_logger(nome):
+    """Logger de um módulo (ex.: "rdt.window", "huntcin.server")."""
+    return logging.getLogger(nome)
+
+def log_event(logger, nivel, evento, mensagem, **campos):
+    """
+    Registra `evento` com `campos` se `nivel` está ligado. `mensagem` usa os
+    campos por nome ("Pacote %(seq)d") e só é formatada por quem escreve.
+    """
+    if logger.isEnabledFor(nivel):
+        campos["evento"] = evento
+        logger.log(nivel, mensagem, campos, extra={"campos": campos})
+
+
+class Sampler(logging.Filter):
+    """
+    Deixa passar 1 de cada `amostragem` registros abaixo de INFO, e no máximo
+    `por_segundo` por segundo (balde de fichas com rajada de um segundo).
+    INFO e acima sempre passam.
+    """
+
+    def __init__(self, amostragem=1, por_segundo=None):
+        super().__init__()
+        self.amostragem = max(int(amostragem), 1)
+        self.por_segundo = por_segundo
+        self.fichas = por_segundo or 0
+        self.atualizado = time.monotonic()
+        self.contador = 0
+        self.suprimidos = 0
+
+    def filter(self, record):
+        if record.levelno < INFO:
+            self.contador += 1
+            if self.contador % self.amostragem:
+                self.suprimidos += 1
+                return False
+            if self.por_segundo:
+                agora = time.monotonic()
+                self.fichas = min(self.fichas + (agora - self.atualizado) * self.por_segundo, self.por_segundo)
+                self.atualizado = agora
+                if self.fichas < 1:
+                    self.suprimidos += 1
+                    return False
+                self.fichas -= 1
+        if self.suprimidos:
+            record.suprimidos, self.suprimidos = self.suprimidos, 0
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """A mensagem como os prints antigos, mais o aviso de eventos suprimidos."""
+
+    def format(self, record):
+        texto = super().format(record)
+        suprimidos = getattr(record, "suprimidos", 0)
+        if suprimidos:
+            texto += f" [+{suprimidos} eventos suprimidos]"
+        return texto
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento: instante, nível, logger, mensagem e os campos do evento."""
+
+    def format(self, record):
+        linha = {"ts": round(record.created, 6), "nivel": record.levelname, "logger": record.name,
+                 "msg": record.getMessage()}
+        linha.update(getattr(record, "campos", None) or {})
+        if getattr(record, "suprimidos", 0):
+            linha["suprimidos"] = record.suprimidos
+        if record.exc_info:
+            linha["erro"] = self.formatException(record.exc_info)
+        return json.dumps(linha, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Só enfileira: a formatação fica para a thread de escrita (o QueueHandler padrão formata aqui)."""
+
+    def prepare(self, record):
+        return record
+
+
+class BatchWriter(threading.Thread):
+    """
+    Esvazia a fila de registros em lotes de até LOTE, formata com `formatter`
+    e escreve cada lote em `destino` com um único write + flush.
+    """
+
+    def __init__(self, fila, destino, formatter):
+        super().__init__(name="log", daemon=True)
+        self.fila = fila
+        self.destino = destino
+        self.formatter = formatter
+        self._fim = object()
+
+    def run(self):
+        fim = False
+        while not fim:
+            try:
+                lote = [self.fila.get(timeout=INTERVALO)]
+            except queue.Empty:
+                continue
+            while len(lote) < LOTE:
+                try:
+                    lote.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            if lote[-1] is self._fim:
+                lote.pop()
+                fim = True
+            linhas = []
+            for registro in lote:
+                try:
+                    linhas.append(self.formatter.format(registro))
+                except Exception:
+                    linhas.append(f"(registro ilegível: {registro.msg!r})")
+            if linhas:
+                try:
+                    self.destino.write("\n".join(linhas) + "\n")
+                    self.destino.flush()
+                except (OSError, ValueError):
+                    pass ## terminal fechado: os logs se perdem, a transferência não
+
+    def stop(self):
+        self.fila.put(self._fim)
+        self.join(timeout=5)
+
+
+def configure(nivel=NIVEL_PADRAO, formato="texto", destino=None, assincrono=True, amostragem=1, por_segundo=None):
+    """
+    Configura os logs do processo: `nivel` ("DEBUG", "INFO"...), `formato`
+    ("texto" ou "json"), `destino` (stream; padrão sys.stdout, onde iam os
+    prints), escrita assíncrona em lotes e o limite de eventos abaixo de INFO
+    (`amostragem`: 1 de cada N; `por_segundo`). Pode ser chamada de novo.
+    """
+    global _configuracao
+    _configuracao = {"nivel": nivel, "formato": formato, "destino": destino, "assincrono": assincrono,
+                     "amostragem": amostragem, "por_segundo": por_segundo}
+    shutdown()
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel.upper() if isinstance(nivel, str) else nivel)
+    destino = destino or sys.stdout
+    formatter = JsonFormatter() if formato == "json" else TextFormatter("%(message)s")
+    if assincrono:
+        fila = queue.SimpleQueue()
+        handler = _QueueHandler(fila)
+        escritor = BatchWriter(fila, destino, formatter)
+        escritor.start()
+        _instalados.append(escritor)
+    else:
+        handler = logging.StreamHandler(destino)
+        handler.setFormatter(formatter)
+    if amostragem > 1 or por_segundo:
+        handler.addFilter(Sampler(amostragem, por_segundo))
+    raiz.addHandler(handler)
+    _instalados.append(handler)
+
+def shutdown():
+    """Escreve o que ainda está na fila e remove o que configure() instalou."""
+    raiz = logging.getLogger()
+    while _instalados:
+        item = _instalados.pop()
+        if isinstance(item, BatchWriter):
+            item.stop()
+        else:
+            raiz.removeHandler(item)
+            item.close()
+
+def _depois_do_fork():
+    ##A thread de escrita não passa para o processo filho (fluxos paralelos, servidor com
+    ##vários processos): sem ela, os registros do filho ficariam parados na fila
+    if any(isinstance(item, BatchWriter) for item in _instalados):
+        configure(**_configuracao)
+
+atexit.register(shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_depois_do_fork)
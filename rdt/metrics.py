@@ -0,0 +1,269 @@
+"""
+Métricas do processo: contadores, medidores e histogramas, com um endpoint local.
+
+Os módulos criam suas métricas uma vez, no registro global REGISTRO, e no
+caminho quente só fazem `contador.inc()` ou `histograma.record(valor)`: uma
+soma num inteiro, ou o cálculo de um índice e uma soma numa lista. Não há
+travas. Sob várias threads (HuntCin), alguma atualização simultânea pode se
+perder, o que não importa para métricas.
+
+Os histogramas seguem a ideia do HdrHistogram: baldes log-lineares (cada
+potência de 2 dividida em `sub` baldes iguais), então a memória é fixa, o
+erro relativo é no máximo 1/sub em qualquer escala (microssegundos ou
+minutos), e os percentis saem das contagens sem guardar as amostras.
+
+MetricsServer serve o registro em 127.0.0.1, na porta escolhida:
+ - HTTP: GET /metrics no formato texto do Prometheus (os histogramas viram
+   `summary` com p50/p90/p99/p99.9) e GET /metrics.json em JSON;
+ - UDP, na mesma porta: um datagrama "json" recebe o JSON; qualquer outro, o
+   texto do Prometheus (ex.: `echo -n json | nc -u -w1 127.0.0.1 9100`).
+"""
+
+import json
+import math
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTIS = (0.5, 0.9, 0.99, 0.999)
+TAMANHO_MAXIMO_UDP = 65507 # resposta UDP maior que isso é truncada (use o HTTP)
+
+
+class Counter:
+    """Valor que só cresce (pacotes, retransmissões, falhas...)."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valor = 0
+
+    def inc(self, quantidade=1):
+        self.valor += quantidade
+
+    def json(self):
+        return self.valor
+
+    def prometheus(self):
+        return [f"{self.nome} {_numero(self.valor)}"]
+
+
+class Gauge:
+    """Valor que sobe e desce. Com `funcao`, é calculado na hora da leitura (ex.: sessões ativas)."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, funcao=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valor = 0
+        self.funcao = funcao
+
+    def set(self, valor):
+        self.valor = valor
+
+    def inc(self, quantidade=1):
+        self.valor += quantidade
+
+    def dec(self, quantidade=1):
+        self.valor -= quantidade
+
+    def json(self):
+        if self.funcao is not None:
+            try:
+                return self.funcao()
+            except Exception:
+                return None ## a leitura não pode derrubar o endpoint
+        return self.valor
+
+    def prometheus(self):
+        valor = self.json()
+        return [] if valor is None else [f"{self.nome} {_numero(valor)}"]
+
+
+class Histogram:
+    """
+    Distribuição de valores entre `menor` e `maior` (fora disso, vão para o
+    primeiro ou o último balde), com erro relativo de no máximo 1/`sub`.
+    """
+
+    tipo = "summary"
+
+    def __init__(self, nome, ajuda, menor=1e-6, maior=3600.0, sub=32):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.menor = menor
+        self.sub = sub
+        self._ultimo = self._indice(maior)
+        self.contagens = [0] * (self._ultimo + 1)
+        self.total = 0
+        self.soma = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+
+    def _indice(self, valor):
+        ##Balde 0: até `menor`. Depois, valor/menor = m * 2**e com m em [0.5, 1): o expoente
+        ##escolhe a potência de 2 e a mantissa, um dos `sub` baldes dentro dela
+        if valor <= self.menor:
+            return 0
+        m, e = math.frexp(valor / self.menor)
+        return (e - 1) * self.sub + int((m - 0.5) * 2 * self.sub) + 1
+
+    def _limite(self, indice):
+        """Maior valor que cai no balde `indice`."""
+        if indice == 0:
+            return self.menor
+        e, s = divmod(indice - 1, self.sub)
+        return self.menor * 2 ** e * (1 + (s + 1) / self.sub)
+
+    def record(self, valor):
+        indice = self._indice(valor)
+        self.contagens[indice if indice < self._ultimo else self._ultimo] += 1
+        self.total += 1
+        self.soma += valor
+        if valor < self.minimo:
+            self.minimo = valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def quantile(self, q):
+        """Valor abaixo do qual ficam `q` (0 a 1) das amostras, ou None sem amostras."""
+        if not self.total:
+            return None
+        alvo = max(math.ceil(q * self.total), 1)
+        acumulado = 0
+        for indice, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return min(max(self._limite(indice), self.minimo), self.maximo)
+        return self.maximo
+
+    def json(self):
+        if not self.total:
+            return {"contagem": 0}
+        resumo = {"contagem": self.total, "soma": self.soma, "media": self.soma / self.total,
+                  "min": self.minimo, "max": self.maximo}
+        resumo.update({f"p{q * 100:g}": self.quantile(q) for q in QUANTIS})
+        return resumo
+
+    def prometheus(self):
+        linhas = [f'{self.nome}{{quantile="{q:g}"}} {_numero(self.quantile(q))}' for q in QUANTIS if self.total]
+        linhas.append(f"{self.nome}_sum {_numero(self.soma)}")
+        linhas.append(f"{self.nome}_count {self.total}")
+        return linhas
+
+
+def _numero(valor):
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, int):
+        return str(valor)
+    return f"{float(valor):.9g}"
+
+
+class Registry:
+    """Métricas do processo, pelo nome. Pedir de novo o mesmo nome devolve a mesma métrica."""
+
+    def __init__(self):
+        self.metricas = {}
+        self._trava = threading.Lock() # só para criar; atualizar não trava
+
+    def _obter(self, classe, nome, ajuda, **opcoes):
+        metrica = self.metricas.get(nome)
+        if metrica is None:
+            with self._trava:
+                metrica = self.metricas.get(nome)
+                if metrica is None:
+                    metrica = self.metricas[nome] = classe(nome, ajuda, **opcoes)
+        if not isinstance(metrica, classe):
+            raise ValueError(f"métrica {nome} já existe com outro tipo")
+        return metrica
+
+    def counter(self, nome, ajuda):
+        return self._obter(Counter, nome, ajuda)
+
+    def gauge(self, nome, ajuda, funcao=None):
+        medidor = self._obter(Gauge, nome, ajuda)
+        if funcao is not None:
+            medidor.funcao = funcao ## ex.: um servidor novo no mesmo processo
+        return medidor
+
+    def histogram(self, nome, ajuda, menor=1e-6, maior=3600.0, sub=32):
+        return self._obter(Histogram, nome, ajuda, menor=menor, maior=maior, sub=sub)
+
+    def json(self):
+        return {nome: metrica.json() for nome, metrica in list(self.metricas.items())}
+
+    def prometheus(self):
+        linhas = []
+        for nome, metrica in list(self.metricas.items()):
+            linhas.append(f"# HELP {nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {nome} {metrica.tipo}")
+            linhas.extend(metrica.prometheus())
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRO = Registry()
+
+
+class MetricsServer:
+    """
+    Serve `registro` por HTTP e por UDP em `host:porta`, cada um numa thread
+    daemon (funciona tanto com asyncio quanto com threads). close() encerra.
+    """
+
+    def __init__(self, porta, host="127.0.0.1", registro=REGISTRO):
+        self.registro = registro
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                caminho = handler.path.split("?")[0]
+                if caminho in ("/metrics.json", "/json"):
+                    corpo, tipo = json.dumps(registro.json()).encode(), "application/json"
+                elif caminho in ("/", "/metrics"):
+                    corpo, tipo = registro.prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header("Content-Type", tipo)
+                handler.send_header("Content-Length", str(len(corpo)))
+                handler.end_headers()
+                handler.wfile.write(corpo)
+
+            def log_message(handler, *args):
+                pass ## cada leitura do Prometheus não precisa ir para o terminal
+
+        self.http = ThreadingHTTPServer((host, porta), Handler)
+        self.http.daemon_threads = True
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.udp.bind((host, self.http.server_address[1]))
+        except OSError:
+            self.http.server_close()
+            self.udp.close()
+            raise
+        self.porta = self.http.server_address[1]
+        threading.Thread(target=self.http.serve_forever, name="metricas-http", daemon=True).start()
+        threading.Thread(target=self._udp, name="metricas-udp", daemon=True).start()
+
+    def _udp(self):
+        while True:
+            try:
+                pedido, endereco = self.udp.recvfrom(64)
+            except OSError:
+                return ## socket fechado
+            if pedido.strip().lower() == b"json":
+                resposta = json.dumps(self.registro.json()).encode()
+            else:
+                resposta = self.registro.prometheus().encode()
+            try:
+                self.udp.sendto(resposta[:TAMANHO_MAXIMO_UDP], endereco)
+            except OSError:
+                pass
+
+    def close(self):
+        self.http.shutdown()
+        self.http.server_close()
+        self.udp.close()
@@ -0,0 +1,56 @@
+"""
+Espaçamento de envio (pacing) por token bucket.
+
+Substitui o `time.sleep(0.001)` fixo depois de cada pacote: o balde ganha
+`taxa` bytes por segundo e acumula no máximo `rajada` bytes. Cada envio
+consome o tamanho do pacote e só espera quando o balde está vazio, então
+a vazão acompanha a taxa configurada (ou calculada pelo controle de
+congestionamento) em vez de ficar presa em ~1 MB/s.
+"""
+
+import time
+
+
+class TokenBucket:
+    """Limita a taxa de envio a `taxa` bytes/s com rajadas de até `rajada` bytes."""
+
+    def __init__(self, taxa, rajada):
+        self.taxa = float(taxa)
+        self.rajada = float(rajada)
+        self._tokens = float(rajada)
+        self._ultimo = time.monotonic()
+
+    def set_rate(self, taxa):
+        """Ajusta a taxa (bytes/s) sem perder os tokens já acumulados."""
+        self._reabastecer()
+        self.taxa = float(taxa)
+
+    def _reabastecer(self):
+        agora = time.monotonic()
+        self._tokens = min(self.rajada, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def delay(self, tamanho):
+        """
+        Versão sem bloqueio, para laços de eventos: se há tokens para
+        `tamanho` bytes, consome e retorna 0; senão retorna quantos segundos
+        faltam, sem consumir nada.
+        """
+        self._reabastecer()
+        if self._tokens >= tamanho or self.taxa <= 0:
+            self._tokens -= tamanho
+            return 0.0
+        return (tamanho - self._tokens) / self.taxa
+
+    def consume(self, tamanho):
+        """Consome tokens mesmo sem saldo (retransmissões urgentes); o saldo negativo atrasa os próximos envios."""
+        self._reabastecer()
+        self._tokens -= tamanho
+
+    def wait(self, tamanho):
+        """Bloqueia até haver tokens para enviar `tamanho` bytes e os consome."""
+        self._reabastecer()
+        if self._tokens < tamanho and self.taxa > 0:
+            time.sleep((tamanho - self._tokens) / self.taxa)
+            self._reabastecer()
+        self._tokens -= tamanho
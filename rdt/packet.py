@@ -0,0 +1,109 @@
+"""
+Formato binário dos pacotes RDT.
+
+Cada pacote começa com um cabeçalho fixo empacotado com `struct` (ordem de
+rede), seguido do payload:
+
+    versão (1) | tipo (1) | flags (1) | reservado (1) | sessão (4) | seq (4) | ack (4)
+    | janela (2) | tamanho (2) | crc32 (4)
+
+ - versão: permite acrescentar campos no futuro sem quebrar pacotes antigos;
+   pacotes de outra versão são descartados.
+ - sessão: identificador da transferência, escolhido pelo cliente; permite
+   que um servidor atenda várias transferências na mesma porta.
+ - seq/ack: inteiros de 32 bits (dão a volta em 2**32, ver unwrap_seq).
+ - janela: nos ACKs, quantos pacotes além de `ack` o receptor ainda aceita
+   (controle de fluxo).
+ - crc32: calculado sobre o cabeçalho (com o campo crc zerado) e o payload;
+   pacotes corrompidos são descartados como se tivessem sido perdidos.
+
+A leitura é feita direto de um memoryview, então o payload devolvido é uma
+fatia do buffer recebido, sem cópia.
+"""
+
+import struct
+import zlib
+from collections import namedtuple
+
+VERSAO = 3 # 2: campo janela (controle de fluxo); 3: campo sessão
+
+# --- Tipos de pacote ---
+TIPO_DADOS = 0
+TIPO_ACK = 1
+TIPO_FIN = 2
+TIPO_SYN = 3 # abre uma transferência; o payload leva os metadados (JSON)
+TIPO_SYNACK = 4 # aceita a transferência; o payload leva os parâmetros aceitos
+TIPO_ERRO = 5 # recusa a transferência; o payload leva a mensagem de erro
+TIPO_SONDA = 6 # sonda de tamanho (rdt/pmtu.py): seq = tamanho do payload, que é só preenchimento
+TIPO_SONDA_ACK = 7 # a sonda de `seq` bytes chegou inteira
+TIPO_REPARO = 8 # reparo FEC (rdt/fec.py): seq = primeiro bloco do grupo, ack = nº do reparo, janela = blocos no grupo
+
+# --- Flags ---
+FLAG_SACK = 0x01 # ACK seletivo: o campo seq indica o pacote confirmado individualmente
+FLAG_FEC = 0x02 # o bloco confirmado não chegou: foi reconstruído pelos reparos FEC
+FLAG_ZLIB = 0x04 # payload de dados comprimido com zlib (rdt/compress.py)
+FLAG_MAIS = 0x08 # a mensagem continua no próximo pacote de dados (mensagens fragmentadas do HuntCin)
+FLAG_REINICIO = 0x10 # o remetente desistiu dos pacotes anteriores: o receptor passa a esperar a partir deste seq
+
+CABECALHO = struct.Struct("!BBBxIIIHHI")
+TAM_CABECALHO = CABECALHO.size
+_SEM_CRC = struct.Struct("!BBBxIIIHH") # cabeçalho sem o campo crc32
+_CRC = struct.Struct("!I")
+MASCARA_SEQ = 0xFFFFFFFF
+
+Pacote = namedtuple("Pacote", "tipo flags sessao seq ack janela dados")
+
+
+def make_pkt(tipo, seq=0, ack=0, dados=b'', flags=0, janela=0, sessao=0):
+    """Monta um pacote com cabeçalho binário e checksum."""
+    pkt = bytearray(TAM_CABECALHO + len(dados))
+    pack_header_into(pkt, tipo, seq, ack, dados, flags, janela, sessao)
+    pkt[TAM_CABECALHO:] = dados
+    return bytes(pkt)
+
+def pack_header_into(buffer, tipo, seq=0, ack=0, dados=b'', flags=0, janela=0, sessao=0):
+    """
+    Escreve só o cabeçalho (com o crc de cabeçalho + `dados`) no início de
+    `buffer`, sem alocar nada. O payload pode ficar em outro buffer e ir junto
+    no envio (ex.: socket.sendmsg([cabecalho, dados])).
+    Retorna um memoryview do cabeçalho escrito.
+    """
+    view = memoryview(buffer)[:TAM_CABECALHO]
+    _SEM_CRC.pack_into(view, 0, VERSAO, tipo, flags, sessao, seq & MASCARA_SEQ, ack & MASCARA_SEQ,
+                       min(janela, 0xFFFF), len(dados))
+    crc = zlib.crc32(dados, zlib.crc32(view[:_SEM_CRC.size]))
+    _CRC.pack_into(view, _SEM_CRC.size, crc)
+    return view
+
+def parse_pkt(buffer, tamanho=None):
+    """
+    Decodifica um pacote a partir de bytes/bytearray/memoryview.
+    `tamanho` limita quantos bytes do buffer são válidos (útil com recv_into).
+    Retorna um Pacote (com `dados` como memoryview) ou None se o pacote for
+    inválido, de outra versão ou estiver corrompido.
+    """
+    view = memoryview(buffer)
+    if tamanho is not None:
+        view = view[:tamanho]
+    if len(view) < TAM_CABECALHO:
+        return None
+    versao, tipo, flags, sessao, seq, ack, janela, comprimento, crc = CABECALHO.unpack_from(view)
+    if versao != VERSAO or len(view) != TAM_CABECALHO + comprimento:
+        return None
+    dados = view[TAM_CABECALHO:]
+    if zlib.crc32(dados, zlib.crc32(view[:_SEM_CRC.size])) != crc:
+        return None
+    return Pacote(tipo, flags, sessao, seq, ack, janela, dados)
+
+def unwrap_seq(seq32, referencia):
+    """
+    Converte um número de sequência de 32 bits no inteiro mais próximo de
+    `referencia` com os mesmos 32 bits baixos, para que a janela continue
+    funcionando depois que a sequência der a volta.
+    """
+    candidato = (referencia & ~MASCARA_SEQ) | seq32
+    if candidato - referencia > (1 << 31):
+        candidato -= 1 << 32
+    elif referencia - candidato > (1 << 31):
+        candidato += 1 << 32
+    return candidato
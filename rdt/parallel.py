@@ -0,0 +1,135 @@
+"""
+Transferência de arquivos grandes em vários fluxos paralelos.
+
+Um fluxo RDT é conduzido por uma única thread, com um socket e uma janela:
+com arquivos grandes, um núcleo de CPU vira o limite. send_parallel divide
+o arquivo em faixas contíguas de bytes (split_ranges) e envia cada faixa
+numa sessão própria, com um socket próprio (outra porta de origem), num
+processo separado de um ProcessPoolExecutor. Cada fluxo tem o seu núcleo,
+a sua janela, o seu controle de congestionamento e o seu RTT.
+
+O SYN de cada fluxo leva, além dos metadados do arquivo, `deslocamento`
+(onde a faixa começa), `tamanho` (o da faixa), `total` (o do arquivo),
+`transferencia` (o mesmo número em todos os fluxos) e `fluxo`/`fluxos`. O
+servidor (rdt/server.py) cria o arquivo de destino já com o tamanho total
+(preallocate) e cada sessão grava os seus blocos na posição da faixa, sem
+depender das outras. No eco, cada sessão devolve só a sua faixa, com o
+mesmo `deslocamento`, e o processo do fluxo grava no arquivo de retorno,
+também pré-alocado. No modo resumo (rdt/verify.py) cada fluxo compara os
+hashes da sua faixa; as faixas erradas são reparadas depois que todos os
+fluxos terminam.
+
+Para o servidor também usar vários núcleos, ele pode atender a mesma porta
+em vários processos (serve_forever com `processos`, SO_REUSEPORT): o kernel
+entrega cada fluxo (cada porta de origem) sempre ao mesmo processo.
+
+Os processos do pool são criados com fork: os scripts do projeto não são
+importáveis, e com spawn o processo filho rodaria o script de novo.
+"""
+
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rdt.rto import RttEstimator
+from rdt.window import send_window, recv_window, new_session_id, TIMEOUT
+from rdt.verify import StreamingDigest, recv_report, VERIFICACAO_RESUMO, ALGORITMO, TAMANHO_FAIXA
+
+FLUXOS_MAXIMO = 16 # maior número de fluxos escolhido automaticamente
+FAIXA_MINIMA = 8 * 1024 * 1024 # no automático, cada fluxo leva pelo menos isso (abrir um fluxo tem custo: sondagem, SYN, eco)
+ALINHAMENTO = 64 * 1024 # as faixas começam em múltiplos disso, que também é múltiplo do tamanho de página
+BUFFER_RECEPCAO = 4 * 1024 * 1024 # buffer de recepção pedido ao SO por fluxo
+
+
+def auto_streams(tamanho):
+    """Quantos fluxos usar para `tamanho` bytes: um por núcleo, sem faixas menores que FAIXA_MINIMA."""
+    return max(1, min(os.cpu_count() or 1, tamanho // FAIXA_MINIMA, FLUXOS_MAXIMO))
+
+def split_ranges(tamanho, fluxos):
+    """
+    Divide `tamanho` bytes em até `fluxos` faixas contíguas, alinhadas em
+    ALINHAMENTO. Retorna [(inicio, tamanho)], com pelo menos uma faixa.
+    """
+    passo = -(-tamanho // max(fluxos, 1))
+    passo = max(-(-passo // ALINHAMENTO) * ALINHAMENTO, ALINHAMENTO)
+    return [(inicio, min(passo, tamanho - inicio)) for inicio in range(0, tamanho, passo)] or [(0, 0)]
+
+def preallocate(caminho, tamanho):
+    """
+    Garante que `caminho` existe com exatamente `tamanho` bytes, reservando
+    o espaço em disco quando o sistema permite. Não apaga o que já foi
+    gravado se o tamanho já estiver certo, então várias sessões da mesma
+    transferência podem chamar ao mesmo tempo.
+    """
+    fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != tamanho:
+            os.ftruncate(fd, tamanho)
+        if tamanho and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, tamanho)
+            except OSError:
+                pass ## sistema de arquivos sem suporte: o arquivo fica esparso
+    finally:
+        os.close(fd)
+
+
+def _send_range(destino, caminho, metadados, sessao, retorno, rto_inicial, prob_perda, opcoes):
+    ##Roda num processo do pool: envia uma faixa e recebe o eco (ou o resumo) dela
+    inicio = metadados["deslocamento"]
+    resultado = {"fluxo": metadados["fluxo"], "sessao": sessao, "inicio": inicio, "tamanho": metadados["tamanho"]}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_RECEPCAO)
+    rto = RttEstimator(rto_inicial)
+    resumo = None
+    if metadados.get("verificacao") == VERIFICACAO_RESUMO:
+        resumo = StreamingDigest(metadados.get("algoritmo", ALGORITMO), metadados.get("faixa", TAMANHO_FAIXA))
+    try:
+        comeco = time.monotonic()
+        with open(caminho, "rb") as arquivo:
+            arquivo.seek(inicio)
+            resultado["pacotes"], resultado["bytes"], resultado["retransmissoes"] = send_window(
+                sock, destino, arquivo, metadados, sessao, rto=rto, prob_perda=prob_perda, resumo=resumo, **opcoes)
+        resultado["segundos"] = time.monotonic() - comeco
+        if resumo is not None:
+            resultado["local"] = resumo.relatorio
+            resultado["remoto"] = recv_report(sock, sessao, rto, prob_perda)
+        elif retorno is not None:
+            with open(retorno, "r+b") as arquivo_retorno:
+                ##O SYN da volta traz o mesmo `deslocamento`: cada bloco cai na posição certa
+                resultado["devolvido"], _, _, _ = recv_window(sock, arquivo_retorno, sessao, rto, prob_perda)
+    finally:
+        sock.close()
+    return resultado
+
+def send_parallel(destino, caminho, metadados, fluxos=0, retorno=None, rto_inicial=TIMEOUT, prob_perda=0.0,
+                  **opcoes):
+    """
+    Envia `caminho` para `destino` em `fluxos` sessões paralelas (0: auto_streams),
+    cada uma num processo. `metadados` (nome, id, verificação...) vão em
+    todos os SYNs, com a faixa de cada fluxo. Com `retorno`, o eco de cada
+    faixa é gravado nesse arquivo, pré-alocado com o tamanho total.
+    `opcoes` vão para send_window (modo, tamanho_janela, bloco, fec...).
+    Retorna o resultado de cada fluxo, na ordem das faixas: dicts com
+    pacotes, bytes, retransmissoes, segundos e, no modo resumo, os
+    relatórios `local` e `remoto` da faixa.
+    Levanta ConnectionRefusedError se o servidor recusar algum fluxo.
+    """
+    total = os.path.getsize(caminho)
+    faixas = split_ranges(total, fluxos or auto_streams(total))
+    if retorno is not None:
+        preallocate(retorno, total)
+    transferencia = new_session_id()
+    sessoes = set()
+    while len(sessoes) < len(faixas):
+        sessoes.add(new_session_id())
+    with ProcessPoolExecutor(len(faixas), mp_context=multiprocessing.get_context("fork")) as pool:
+        futuros = []
+        for fluxo, ((inicio, tamanho), sessao) in enumerate(zip(faixas, sessoes)):
+            faixa = dict(metadados, tamanho=tamanho, deslocamento=inicio, total=total,
+                         transferencia=transferencia, fluxo=fluxo, fluxos=len(faixas))
+            futuros.append(pool.submit(_send_range, destino, caminho, faixa, sessao, retorno,
+                                       rto_inicial, prob_perda, opcoes))
+        return [futuro.result() for futuro in futuros]
@@ -0,0 +1,58 @@
+"""
+Tamanho do bloco (payload) de cada transferência, com sondagem do caminho.
+
+O bloco não é mais fixo em 1024 bytes: antes do SYN, o remetente descobre o
+maior payload que chega ao receptor sem se perder, no estilo do DPLPMTUD
+(RFC 8899). Ele envia sondas (TIPO_SONDA) preenchidas até cada tamanho de
+CANDIDATOS, com o bit "não fragmentar" ligado quando o SO permite, e o
+receptor responde cada sonda que chegou inteira com um TIPO_SONDA_ACK. O
+maior tamanho confirmado vai como `bloco` no SYN; o receptor pode reduzi-lo
+no SYNACK (ex.: buffer de recepção menor), e o valor do SYNACK vale para a
+transferência inteira, já que cada bloco é gravado na posição seq * bloco.
+
+Sondas perdidas não provam nada: uma rodada sem resposta para os tamanhos
+maiores é repetida até MAX_RODADAS vezes antes de desistir deles. Sem
+nenhuma confirmação, fica BLOCO_BASE, que qualquer caminho IPv4 comporta.
+"""
+
+import socket
+import sys
+
+from rdt.packet import TAM_CABECALHO
+
+BLOCO_BASE = 1024 # sempre aceito, mesmo sem sondar (o tamanho das versões anteriores)
+BLOCO_MAXIMO = 65507 - TAM_CABECALHO # maior payload UDP sobre IPv4, menos o cabeçalho RDT
+##Tamanhos sondados: Ethernet (MTU 1500), jumbo frames (MTU 9000), potências de 2 e o máximo
+CANDIDATOS = (1500 - 28 - TAM_CABECALHO, 9000 - 28 - TAM_CABECALHO, 16384, 32768, BLOCO_MAXIMO)
+MAX_RODADAS = 3 # rodadas de sondas sem resposta antes de desistir dos tamanhos maiores
+
+_PREENCHIMENTO = memoryview(bytes(BLOCO_MAXIMO)) # payload das sondas, alocado uma vez
+
+##Constantes do Linux (<linux/in.h>) que o módulo socket nem sempre exporta
+_IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+_IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+
+
+def candidates(bloco_maximo):
+    """Tamanhos a sondar, em ordem crescente, até `bloco_maximo`."""
+    if bloco_maximo <= BLOCO_BASE:
+        return []
+    return sorted({tamanho for tamanho in CANDIDATOS if BLOCO_BASE < tamanho < bloco_maximo} | {bloco_maximo})
+
+def padding(tamanho):
+    """Payload de uma sonda de `tamanho` bytes, sem alocar."""
+    return _PREENCHIMENTO[:tamanho]
+
+def set_dont_fragment(sock):
+    """
+    Liga o bit "não fragmentar" no socket (só no Linux): um datagrama maior
+    que o MTU do caminho falha no envio (EMSGSIZE) ou é descartado no
+    caminho, em vez de ser fragmentado. Retorna se foi possível.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+    except OSError:
+        return False
+    return True
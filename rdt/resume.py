@@ -0,0 +1,81 @@
+"""
+Retomada de transferências interrompidas.
+
+O receptor grava cada bloco na sua posição do arquivo (seq * bloco), então o
+progresso de um upload cabe em dois números: quantos blocos já chegaram em
+sequência (`contiguos`) e quais blocos depois deles já foram gravados fora de
+ordem (`extras`, no máximo uma janela). Esse diário fica ao lado do arquivo
+parcial, em `<arquivo>.parcial`, e é regravado a cada SALVAR_A_CADA blocos
+novos (e quando a sessão é abandonada).
+
+Se o processo morrer no meio, o próximo SYN com os mesmos nome, tamanho,
+bloco e identificação (`id`) do arquivo encontra o diário, e o SYNACK diz ao
+remetente a partir de qual bloco continuar. Sem `id` no SYN a transferência
+sempre recomeça do zero, porque não dá para saber se é o mesmo arquivo.
+"""
+
+import json
+import os
+
+SUFIXO = ".parcial"
+SALVAR_A_CADA = 64 # blocos novos entre duas gravações do diário
+
+
+class TransferJournal:
+    """Diário de progresso de um arquivo parcial."""
+
+    def __init__(self, caminho_arquivo, metadados):
+        self.caminho = caminho_arquivo + SUFIXO
+        ##O que identifica o arquivo sendo enviado; outro arquivo com o mesmo nome recomeça do zero
+        self.arquivo = {chave: metadados.get(chave) for chave in ("tamanho", "bloco", "id")}
+        self.contiguos = 0
+        self.extras = set()
+        self._novos = 0
+
+    @classmethod
+    def abrir(cls, caminho_arquivo, metadados):
+        """
+        Carrega o diário de `caminho_arquivo` se ele descreve o mesmo arquivo
+        e o arquivo parcial ainda existe; senão retorna um diário vazio.
+        """
+        diario = cls(caminho_arquivo, metadados)
+        if diario.arquivo["id"] is None or not os.path.exists(caminho_arquivo):
+            return diario
+        try:
+            with open(diario.caminho) as f:
+                salvo = json.load(f)
+            if salvo["arquivo"] == diario.arquivo:
+                diario.contiguos = int(salvo["contiguos"])
+                diario.extras = set(salvo["extras"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass ## diário ausente ou ilegível: recomeça do zero
+        return diario
+
+    @property
+    def retomado(self):
+        """Indica se já havia blocos gravados quando o diário foi aberto."""
+        return self.contiguos > 0 or bool(self.extras)
+
+    def atualizar(self, contiguos, extras, arquivo):
+        """Registra um bloco novo; grava o diário a cada SALVAR_A_CADA blocos."""
+        self._novos += 1
+        if self._novos >= SALVAR_A_CADA:
+            self.salvar(contiguos, extras, arquivo)
+
+    def salvar(self, contiguos, extras, arquivo):
+        """Grava o diário. Os dados vão para o SO antes, para o diário nunca estar à frente do arquivo."""
+        arquivo.flush()
+        self.contiguos = contiguos
+        self.extras = set(extras)
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w") as f:
+            json.dump({"arquivo": self.arquivo, "contiguos": contiguos, "extras": sorted(extras)}, f)
+        os.replace(temporario, self.caminho) ## troca atômica: um diário pela metade nunca fica no disco
+        self._novos = 0
+
+    def remover(self):
+        """Transferência concluída: o diário não é mais necessário."""
+        try:
+            os.remove(self.caminho)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,62 @@
+"""
+Timeout de retransmissão adaptativo (RTO), no estilo da RFC 6298.
+
+O RTO é calculado a partir do RTT medido:
+    SRTT   = (1 - ALFA) * SRTT + ALFA * amostra
+    RTTVAR = (1 - BETA) * RTTVAR + BETA * |SRTT - amostra|
+    RTO    = SRTT + max(G, K * RTTVAR)
+
+A cada timeout o RTO dobra (backoff exponencial) até RTO_MAX. Pela regra de
+Karn, quem usa o estimador só deve chamar sample() para pacotes que NÃO foram
+retransmitidos, já que não dá para saber a qual transmissão o ACK se refere.
+Um ACK que confirma dados novos mostra que o caminho voltou a funcionar, então
+reset_backoff() desfaz o backoff mesmo sem amostra nova (como faz o Linux).
+"""
+
+ALFA = 1 / 8
+BETA = 1 / 4
+K = 4
+G = 0.001 # granularidade do relógio (s)
+RTO_MIN = 0.01 # em loopback uma perda custa poucos milissegundos
+RTO_MAX = 60.0
+
+
+class RttEstimator:
+    """Mantém SRTT/RTTVAR de um caminho e calcula o RTO atual."""
+    ##Um estimador por caminho: o servidor do HuntCin tem um por cliente, então
+    ##__slots__ e nenhuma trava (cada estimador é usado por uma thread só)
+    __slots__ = ("srtt", "rttvar", "rto_min", "rto_max", "_rto_base", "_backoff")
+
+    def __init__(self, rto_inicial=1.0, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        self.srtt = None
+        self.rttvar = None
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self._rto_base = rto_inicial # RTO calculado pelo RTT, sem backoff
+        self._backoff = 0 # quantas vezes o RTO foi dobrado desde a última amostra
+
+    def sample(self, rtt):
+        """Registra uma amostra de RTT (em segundos) e recalcula o RTO."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALFA) * self.srtt + ALFA * rtt
+        rto = self.srtt + max(G, K * self.rttvar)
+        self._rto_base = min(max(rto, self.rto_min), self.rto_max)
+        self._backoff = 0
+
+    @property
+    def rto(self):
+        """Timeout atual (s), já considerando o backoff."""
+        return min(self._rto_base * 2 ** self._backoff, self.rto_max)
+
+    def backoff(self):
+        """Dobra o RTO após um timeout."""
+        if self.rto < self.rto_max:
+            self._backoff += 1
+
+    def reset_backoff(self):
+        """Desfaz o backoff quando dados novos são confirmados."""
+        self._backoff = 0
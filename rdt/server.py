@@ -0,0 +1,622 @@
+"""
+Servidor de arquivos RDT 3.0 com várias sessões ao mesmo tempo.
+
+Um único socket UDP atende todos os clientes: cada pacote leva o número da
+sessão (escolhido pelo cliente no SYN), e o servidor encaminha o pacote para
+a máquina de estados daquela sessão (WindowReceiver no upload, WindowSender
+no eco de volta). Tudo roda num laço asyncio, sem uma thread por cliente; os
+temporizadores de cada sessão são agendados com loop.call_at.
+
+Ciclo de uma sessão:
+ 1. SYN do cliente com nome e tamanho -> SYNACK, o arquivo é gravado em
+    `armazenamento/recebido_<nome>`. Se um upload anterior do mesmo arquivo
+    foi interrompido, o diário `recebido_<nome>.parcial` (rdt/resume.py) diz
+    quais blocos já estão lá, e o SYNACK manda o cliente continuar do
+    primeiro que falta;
+ 2. quando o upload termina (FIN ou silêncio do cliente), o servidor abre a
+    volta com o próprio SYN e devolve o arquivo com o mesmo modo, janela,
+    FEC (rdt/fec.py) e compressão (rdt/compress.py).
+    Se o SYN pediu `"verificacao": "resumo"` (rdt/verify.py), a volta leva
+    só o relatório com o hash do arquivo e de cada faixa, calculado durante
+    o upload; uma sessão de reparo (`deslocamento` no SYN) regrava uma faixa
+    do arquivo já recebido. Um arquivo enviado em vários fluxos
+    (rdt/parallel.py, `fluxos` no SYN) chega em várias sessões, uma por
+    faixa, que gravam no mesmo arquivo e devolvem só a sua faixa. No
+    reenvio por diferenças (rdt/delta.py), uma sessão sem upload recebe as
+    assinaturas do arquivo atual, e a seguinte envia as instruções que
+    montam o arquivo novo a partir dele. Um lote (rdt/batch.py, `lote` no
+    SYN) traz vários arquivos num fluxo só, separados no fim do upload, e a
+    volta é um lote com os mesmos arquivos (ou o hash de cada um). Os blocos
+    gravados ficam também na cache em memória do servidor (rdt/cache.py),
+    de onde o eco os lê;
+ 3. depois do FIN da volta a sessão fica mais TEMPO_FINAL segundos só para
+    absorver pacotes atrasados, e é descartada.
+
+O RTT medido e a janela de congestionamento do eco ficam guardados por
+endereço do cliente (path_state): um cliente que faz várias transferências
+pelo mesmo socket (rdt/session.py) não recomeça do RTO inicial nem do slow
+start a cada uma.
+"""
+
+import asyncio
+import io
+from collections import OrderedDict
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+
+from rdt.packet import (parse_pkt, make_pkt, TIPO_SYN, TIPO_DADOS, TIPO_FIN, TIPO_ERRO, TIPO_SONDA, TIPO_REPARO,
+                        TAM_CABECALHO)
+from rdt.buffers import send_parts
+from rdt.rto import RttEstimator
+from rdt.resume import TransferJournal
+from rdt.verify import StreamingDigest, VERIFICACAO_RESUMO, ALGORITMO, TAMANHO_FAIXA
+from rdt.parallel import preallocate
+from rdt.delta import signatures, apply_delta, base_id, DELTA_ASSINATURAS, DELTA_INSTRUCOES
+from rdt.batch import BatchReader, unpack, PREFIXO_RECEBIDO
+from rdt.cache import ChunkCache, CachedFile, MEMORIA
+from rdt.pmtu import BLOCO_MAXIMO
+from rdt.window import WindowSender, WindowReceiver, socket_capacity, make_probe_ack, TIMEOUT, BUFFER_SIZE
+from rdt.log import get_logger, log_event, INFO, WARNING, ERROR
+from rdt.metrics import REGISTRO, MetricsServer
+
+TEMPO_OCIOSO = 30.0 # sessão sem nenhum pacote por esse tempo é descartada
+TEMPO_FINAL = 5.0 # quanto tempo uma sessão encerrada continua absorvendo pacotes atrasados
+BUFFER_RECEPCAO = 8 * 1024 * 1024 # buffer de recepção do socket, dividido entre as sessões
+JANELA_MINIMA_SESSAO = 4 # janela anunciada mínima por sessão, mesmo com o buffer disputado
+TAMANHO_MAXIMO = 64 * 1024 ** 3 # maior arquivo em fluxos paralelos: o primeiro SYN já reserva o tamanho todo no disco
+CAMINHOS_MAXIMO = 4096 # clientes cujo RTT e janela ficam guardados; os usados há mais tempo são esquecidos
+##Campos numéricos do SYN e o menor valor aceito em cada um
+CAMPOS_INTEIROS = {"tamanho": 0, "bloco": 1, "janela": 1, "deslocamento": 0, "fec": 0, "compressao": 0, "total": 0,
+                   "fluxo": 0, "fluxos": 1, "faixa": 1, "bloco_delta": 0, "final": 0}
+
+log = get_logger("rdt.server")
+
+
+def parse_metadata(dados):
+    """
+    Metadados do SYN (um objeto JSON) com os campos numéricos conferidos.
+    Levanta ValueError se o payload não é um objeto ou algum campo é inválido.
+    """
+    try:
+        metadados = json.loads(bytes(dados)) if dados else {}
+    except ValueError:
+        raise ValueError("metadados não são JSON") from None ## UnicodeDecodeError também é ValueError
+    if not isinstance(metadados, dict):
+        raise ValueError("metadados não são um objeto JSON")
+    for campo, minimo in CAMPOS_INTEIROS.items():
+        valor = metadados.get(campo)
+        if valor is not None and (type(valor) is not int or valor < minimo):
+            raise ValueError(f"campo '{campo}' inválido")
+    return metadados
+
+
+class ServerSession:
+    """Estado de uma transferência (upload + eco) dentro do servidor."""
+
+    def __init__(self, servidor, syn, endereco, agora):
+        self.servidor = servidor
+        self.sessao = syn.sessao
+        self.endereco = endereco
+        self.caminho_rede = servidor.path_state(endereco) # RTT e janela do eco, de sessões anteriores
+        self.rto = self.caminho_rede["rto"]
+        self.remetente = None
+        self.encerrada_em = None
+        self._ultimo = agora
+        self._timer = None
+
+        self.recusa = None # motivo para recusar a sessão com TIPO_ERRO
+        try:
+            self.metadados = parse_metadata(syn.dados)
+        except ValueError as exc:
+            self.metadados = {}
+            self.recusa = f"SYN inválido: {exc}"
+        ##O diário de retomada identifica o arquivo pelo bloco que o receptor vai de fato usar
+        self.metadados["bloco"] = min(int(self.metadados.get("bloco", BUFFER_SIZE)), servidor.bloco_maximo)
+        self.nome = os.path.basename(str(self.metadados.get("nome", ""))) or f"sessao_{self.sessao}"
+        self.lote = "lote" in self.metadados # vários arquivos num fluxo só (rdt/batch.py)
+        ##Um lote é gravado inteiro ao lado dos arquivos e separado no fim
+        self.caminho = os.path.join(servidor.armazenamento, f"recebido_{self.nome}" + (".lote" if self.lote else ""))
+        self.arquivo = None
+        self.receptor = None
+        self.progresso = None
+        self.resumo = None
+        self.paralelo = "fluxos" in self.metadados # uma faixa de um arquivo enviado em vários fluxos
+        self.reparo = "deslocamento" in self.metadados and not self.paralelo # regrava uma faixa de um arquivo já recebido
+        self.delta = self.metadados.get("delta") # DELTA_ASSINATURAS ou DELTA_INSTRUCOES (rdt/delta.py)
+        if self.metadados.get("verificacao") == VERIFICACAO_RESUMO:
+            try:
+                self.resumo = StreamingDigest(self.metadados.get("algoritmo", ALGORITMO),
+                                              self.metadados.get("faixa", TAMANHO_FAIXA))
+            except (TypeError, ValueError) as exc:
+                self.recusa = str(exc)
+        if self.reparo and not os.path.exists(self.caminho):
+            self.recusa = f"'{self.nome}' não existe para ser reparado"
+        if self.paralelo and "total" not in self.metadados:
+            self.recusa = f"fluxo de '{self.nome}' sem o tamanho total"
+        elif self.paralelo and self.metadados["total"] > servidor.tamanho_maximo:
+            self.recusa = f"'{self.nome}' passa do tamanho máximo ({servidor.tamanho_maximo} bytes)"
+        elif self.paralelo and self.metadados["total"] < self.deslocamento_final:
+            self.recusa = f"faixa além do fim de '{self.nome}'"
+        if self.delta == DELTA_INSTRUCOES and (not os.path.exists(self.caminho)
+                                               or base_id(self.caminho) != self.metadados.get("base")):
+            self.recusa = f"'{self.nome}' mudou desde as assinaturas"
+
+    @property
+    def deslocamento_final(self):
+        return int(self.metadados.get("deslocamento", 0)) + int(self.metadados.get("tamanho", 0))
+
+    def conflita(self, outra):
+        """
+        As duas sessões gravariam no mesmo arquivo ao mesmo tempo. Fluxos do
+        mesmo envio paralelo podem; um pedido de assinaturas não grava nada.
+        """
+        if outra.caminho != self.caminho or outra.encerrada_em is not None:
+            return False
+        if DELTA_ASSINATURAS in (self.delta, outra.delta):
+            return False
+        return not (self.paralelo and outra.paralelo
+                    and self.metadados.get("transferencia") == outra.metadados.get("transferencia"))
+
+    def enviar(self, *partes):
+        self.servidor.sendto(partes, self.endereco)
+
+    def _preparar_cache(self):
+        """
+        Esquece o que a cache tem do arquivo que vai ser regravado e diz se os
+        blocos desta sessão podem entrar nela (função para `gravado`, ou None).
+        """
+        cache = self.servidor.cache
+        if cache is None or self.delta == DELTA_ASSINATURAS or self.lote:
+            return None ## nada a gravar, ou só o fluxo do lote, que vira outros arquivos
+        ##Fluxos do mesmo envio paralelo gravam faixas separadas: um não apaga os blocos do outro
+        irmaos = self.paralelo and any(
+            outra is not self and outra.paralelo and outra.encerrada_em is None and outra.caminho == self.caminho
+            and outra.metadados.get("transferencia") == self.metadados.get("transferencia")
+            for outra in self.servidor.sessoes.values())
+        if not irmaos:
+            cache.invalidate(self.caminho)
+        if self.delta is not None or self.reparo:
+            return None ## grava as instruções em outro arquivo, ou regrava com outro alinhamento
+        return lambda posicao, dados: cache.put(self.caminho, posicao, dados)
+
+    def start(self, syn, agora):
+        if self.delta == DELTA_ASSINATURAS:
+            self.arquivo = io.BytesIO() ## só o pedido: não há o que gravar
+        elif self.delta == DELTA_INSTRUCOES:
+            ##As instruções ficam ao lado do arquivo até o upload terminar
+            self.arquivo = open(self.caminho + ".delta", "w+b")
+        elif self.paralelo:
+            ##Todas as faixas gravam no mesmo arquivo, criado já com o tamanho total
+            ##pela primeira que chegar; sem diário, cada faixa é uma sessão curta
+            preallocate(self.caminho, int(self.metadados["total"]))
+            self.arquivo = open(self.caminho, "r+b")
+        elif self.reparo:
+            ##Só uma faixa: grava por cima do arquivo existente, sem diário
+            self.arquivo = open(self.caminho, "r+b")
+        elif self.lote:
+            self.arquivo = open(self.caminho, "w+b") ## sem diário: um lote interrompido recomeça
+        else:
+            self.progresso = TransferJournal.abrir(self.caminho, self.metadados)
+            if self.progresso.retomado:
+                self.arquivo = open(self.caminho, "r+b")
+            else:
+                self.progresso.remover() ## diário de outro arquivo com o mesmo nome
+                self.arquivo = open(self.caminho, "w+b") ## leitura também: o resumo relê blocos fora de ordem
+        self.receptor = WindowReceiver(self.arquivo, self.enviar, syn,
+                                       lambda: self.servidor.capacidade_sessao(self.receptor.bloco),
+                                       self.rto, self.servidor.prob_perda,
+                                       progresso=self.progresso,
+                                       ## no delta, o resumo é do arquivo montado; no lote, um por arquivo
+                                       resumo=self.resumo if self.delta is None and not self.lote else None,
+                                       bloco_maximo=self.servidor.bloco_maximo, gravado=self._preparar_cache())
+        log_event(log, INFO, "sessao", "[SERVIDOR] Sessão %(sessao)d de %(endereco)s: '%(nome)s', %(tamanho)d bytes (%(modo)s, blocos de %(bloco)d bytes).",
+                  sessao=self.sessao, endereco=self.endereco, nome=self.nome, tamanho=self.receptor.tamanho_esperado,
+                  modo=self.receptor.modo, bloco=self.receptor.bloco)
+        if self.paralelo:
+            log_event(log, INFO, "fluxo", "[SERVIDOR] Sessão %(sessao)d: fluxo %(fluxo)d de %(fluxos)d, bytes %(inicio)d a %(fim)d.",
+                      sessao=self.sessao, fluxo=int(self.metadados.get("fluxo", 0)), fluxos=int(self.metadados["fluxos"]),
+                      inicio=self.receptor.deslocamento, fim=self.deslocamento_final)
+        if self.progresso is not None and self.progresso.retomado:
+            log_event(log, INFO, "retomada", "[SERVIDOR] Sessão %(sessao)d: retomando do bloco %(inicio)d (%(recebido)d bytes já recebidos).",
+                      sessao=self.sessao, inicio=self.receptor.expected, recebido=self.receptor.total_recebido)
+        self.receptor.start(agora)
+        self._avancar(agora)
+
+    def on_packet(self, pkt, agora):
+        self._ultimo = agora
+        if self.encerrada_em is not None:
+            return
+        ##Dados, reparos, FIN e SYN do cliente são do upload; ACK e SYNACK respondem o eco
+        if pkt.tipo in (TIPO_SYN, TIPO_DADOS, TIPO_REPARO, TIPO_FIN):
+            self.receptor.on_packet(pkt, agora)
+        elif self.remetente is not None:
+            self.remetente.on_packet(pkt, agora)
+        self._avancar(agora)
+
+    def on_timer(self, agora):
+        self._timer = None
+        if self.encerrada_em is not None:
+            if agora >= self.encerrada_em + TEMPO_FINAL:
+                self.servidor.remover(self)
+                return
+        elif agora >= self._ultimo + TEMPO_OCIOSO:
+            log_event(log, WARNING, "ociosa", "[SERVIDOR] Sessão %(sessao)d ociosa por %(segundos).0fs. Descartando.",
+                      sessao=self.sessao, segundos=TEMPO_OCIOSO)
+            self.fechar(agora)
+        else:
+            self.receptor.on_timer(agora)
+            if self.remetente is not None:
+                self.remetente.on_timer(agora)
+            self._avancar(agora)
+            return
+        self._agendar()
+
+    def _avancar(self, agora):
+        ##Upload terminado: devolve o arquivo na mesma sessão
+        if self.remetente is None and self.receptor.encerrado:
+            self.arquivo.close()
+            if self.progresso is not None:
+                self.progresso.remover()
+            recebido = self.receptor.total_recebido
+            if self.delta == DELTA_INSTRUCOES:
+                recebido = self._aplicar_delta()
+            if self.delta == DELTA_ASSINATURAS:
+                ##No lugar do eco vão as assinaturas dos blocos do arquivo atual
+                self.arquivo = io.BytesIO(signatures(self.caminho, self.metadados.get("bloco_delta", 0)))
+                log_event(log, INFO, "assinaturas", "[SERVIDOR] Sessão %(sessao)d: enviando assinaturas de %(caminho)s (%(bytes)d bytes).",
+                          sessao=self.sessao, caminho=self.caminho, bytes=len(self.arquivo.getvalue()))
+                volta = {"nome": self.nome, "tamanho": len(self.arquivo.getvalue()), "conteudo": DELTA_ASSINATURAS}
+            elif self.lote:
+                self.arquivo, volta = self._separar_lote()
+            elif self.resumo is not None:
+                ##Modo resumo: no lugar do eco vai só o relatório com os hashes
+                relatorio = self.resumo.relatorio
+                if self.reparo:
+                    log_event(log, INFO, "reparo", "[SERVIDOR] Sessão %(sessao)d: faixa de %(recebido)d bytes regravada em %(caminho)s a partir do byte %(deslocamento)d.",
+                              sessao=self.sessao, recebido=self.receptor.total_recebido, caminho=self.caminho,
+                              deslocamento=self.receptor.deslocamento)
+                else:
+                    log_event(log, INFO, "salvo", "[SERVIDOR] Sessão %(sessao)d: arquivo salvo como %(caminho)s (%(recebido)d bytes).",
+                              sessao=self.sessao, caminho=self.caminho, recebido=recebido)
+                log_event(log, INFO, "resumo", "[SERVIDOR] Sessão %(sessao)d: enviando resumo %(algoritmo)s %(resumo).16s...",
+                          sessao=self.sessao, algoritmo=relatorio["algoritmo"], resumo=relatorio["resumo"])
+                self.arquivo = io.BytesIO(json.dumps(relatorio).encode())
+                volta = {"nome": self.nome, "tamanho": len(self.arquivo.getvalue()), "conteudo": VERIFICACAO_RESUMO}
+            else:
+                log_event(log, INFO, "salvo", "[SERVIDOR] Sessão %(sessao)d: arquivo salvo como %(caminho)s (%(recebido)d bytes). Devolvendo...",
+                          sessao=self.sessao, caminho=self.caminho, recebido=recebido)
+                if self.servidor.cache is not None:
+                    self.arquivo = CachedFile(self.caminho, self.servidor.cache)
+                else:
+                    self.arquivo = open(self.caminho, "rb")
+                volta = {"nome": self.nome, "tamanho": recebido}
+                if self.paralelo:
+                    ##Só a faixa desta sessão, que o cliente grava na mesma posição
+                    self.arquivo.seek(self.receptor.deslocamento)
+                    volta["deslocamento"] = self.receptor.deslocamento
+            self.remetente = WindowSender(
+                self.arquivo, self.enviar, volta,
+                self.sessao, self.receptor.modo, self.receptor.tamanho_janela, self.rto, self.servidor.prob_perda,
+                bloco=self.receptor.bloco, fec=self.receptor.fec, ## o caminho já foi sondado pelo cliente
+                compressao=self.receptor.compressao, cc=self.caminho_rede["cc"], combinado=True)
+            self.caminho_rede["cc"] = self.remetente.cc
+            self.remetente.start(agora)
+        if self.remetente is not None and self.remetente.concluido:
+            pacotes, total, retransmissoes = self.remetente.resultado
+            log_event(log, INFO, "eco", "[SERVIDOR] Sessão %(sessao)d: eco concluído (%(pacotes)d pacotes, %(bytes)d bytes, %(retransmissoes)d retransmissões).",
+                      sessao=self.sessao, pacotes=pacotes, bytes=total, retransmissoes=retransmissoes)
+            if isinstance(self.arquivo, CachedFile):
+                log_event(log, INFO, "cache", "[SERVIDOR] Sessão %(sessao)d: %(acertos)d blocos do eco lidos da memória, %(faltas)d do disco.",
+                          sessao=self.sessao, acertos=self.arquivo.acertos, faltas=self.arquivo.faltas)
+            self.fechar(agora)
+        self._agendar()
+
+    def _aplicar_delta(self):
+        """
+        Monta o arquivo novo a partir do atual e das instruções recebidas, e só
+        então troca um pelo outro. Retorna o tamanho do arquivo que ficou.
+        """
+        instrucoes = self.caminho + ".delta"
+        novo = self.caminho + ".novo"
+        try:
+            with open(self.caminho, "rb") as base, open(instrucoes, "rb") as entrada, open(novo, "wb") as saida:
+                total = apply_delta(base, entrada, saida, self.resumo)
+            if total != int(self.metadados.get("final", -1)):
+                raise ValueError(f"o arquivo montado tem {total} bytes")
+            os.replace(novo, self.caminho)
+            if self.servidor.cache is not None:
+                self.servidor.cache.invalidate(self.caminho)
+            log_event(log, INFO, "delta", "[SERVIDOR] Sessão %(sessao)d: %(caminho)s montado com %(recebido)d bytes de diferenças (%(total)d bytes).",
+                      sessao=self.sessao, caminho=self.caminho, recebido=self.receptor.total_recebido, total=total)
+        except (OSError, ValueError) as exc:
+            ##O arquivo anterior fica como estava; no modo resumo o cliente vê a diferença e repara
+            log_event(log, ERROR, "delta", "[SERVIDOR] Sessão %(sessao)d: instruções inválidas (%(erro)s). Arquivo anterior mantido.",
+                      sessao=self.sessao, erro=str(exc))
+        finally:
+            for caminho in (instrucoes, novo):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+        return os.path.getsize(self.caminho)
+
+    def _separar_lote(self):
+        """
+        Grava cada arquivo do lote recebido e prepara a volta: um lote com os
+        arquivos gravados ou, no modo resumo, o hash de cada um.
+        Retorna (arquivo da volta, metadados do SYN da volta).
+        """
+        algoritmo = self.resumo.algoritmo if self.resumo is not None else None
+        try:
+            arquivos = unpack(self.caminho, self.servidor.armazenamento, PREFIXO_RECEBIDO, algoritmo)
+        except ValueError as exc:
+            arquivos = [{"nome": self.nome, "tamanho": 0, "erro": str(exc)}]
+        finally:
+            os.remove(self.caminho)
+        erros = [arquivo for arquivo in arquivos if "erro" in arquivo]
+        log_event(log, WARNING if erros else INFO, "lote", "[SERVIDOR] Sessão %(sessao)d: lote '%(nome)s' com %(arquivos)d arquivos (%(recebido)d bytes), %(erros)d com erro.",
+                  sessao=self.sessao, nome=self.nome, arquivos=len(arquivos), recebido=self.receptor.total_recebido,
+                  erros=len(erros))
+        if self.resumo is not None:
+            relatorio = {"algoritmo": algoritmo, "arquivos": [{chave: arquivo[chave] for chave in ("nome", "tamanho", "resumo", "erro")
+                                                               if chave in arquivo} for arquivo in arquivos]}
+            volta = io.BytesIO(json.dumps(relatorio).encode())
+            return volta, {"nome": self.nome, "tamanho": len(volta.getvalue()), "conteudo": VERIFICACAO_RESUMO}
+        volta = BatchReader([(arquivo["caminho"], arquivo["nome"]) for arquivo in arquivos if "erro" not in arquivo],
+                            [(arquivo["nome"], arquivo["erro"]) for arquivo in erros], algoritmo=None)
+        return volta, {"nome": self.nome, "tamanho": volta.tamanho, "lote": len(arquivos)}
+
+    def fechar(self, agora):
+        self._guardar_progresso()
+        self.encerrada_em = agora
+        self._agendar()
+
+    def _guardar_progresso(self):
+        ##Upload abandonado no meio: grava o diário para o cliente poder retomar depois
+        if self.arquivo is not None:
+            if self.remetente is None and self.progresso is not None and self.receptor is not None:
+                self.progresso.salvar(self.receptor.expected, self.receptor.fora_de_ordem, self.arquivo)
+            self.arquivo.close()
+            self.arquivo = None
+            if self.remetente is None and self.delta == DELTA_INSTRUCOES:
+                os.remove(self.caminho + ".delta") ## instruções pela metade não servem para nada
+            elif self.remetente is None and self.lote:
+                os.remove(self.caminho) ## idem para um lote pela metade
+
+    def _agendar(self):
+        """Agenda on_timer para o próximo prazo; só reagenda se o prazo ficou mais cedo."""
+        if self.encerrada_em is not None:
+            prazo = self.encerrada_em + TEMPO_FINAL
+        else:
+            prazos = [self._ultimo + TEMPO_OCIOSO, self.receptor.prazo]
+            if self.remetente is not None:
+                prazos.append(self.remetente.prazo)
+            prazo = min(p for p in prazos if p is not None)
+        if self._timer is not None:
+            if self._timer.when() <= prazo:
+                return ## on_timer confere o relógio e reagenda se acordar cedo
+            self._timer.cancel()
+        self._timer = self.servidor.loop.call_at(prazo, self._disparar)
+
+    def _disparar(self):
+        self.on_timer(self.servidor.loop.time())
+
+    def cancelar(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._guardar_progresso()
+
+
+class FileServer:
+    """
+    Lê o socket do servidor e separa os pacotes por sessão. Com o log
+    "rdt.window" em DEBUG, as sessões registram cada pacote (rdt/log.py).
+
+    Em vez de um DatagramProtocol (que aloca um buffer novo a cada datagrama),
+    o socket é não bloqueante e vigiado com loop.add_reader: a cada aviso de
+    leitura, todos os datagramas na fila do socket são lidos com recvfrom_into
+    no mesmo buffer.
+    """
+
+    def __init__(self, sock, armazenamento, rto_inicial=TIMEOUT, prob_perda=0.0, bloco_maximo=BLOCO_MAXIMO,
+                 memoria_cache=MEMORIA, tamanho_maximo=TAMANHO_MAXIMO):
+        self.sock = sock
+        self.bloco_maximo = bloco_maximo # maior bloco aceito (e maior sonda respondida)
+        self.tamanho_maximo = tamanho_maximo # maior `total` de um envio em fluxos, que é reservado no disco
+        self.armazenamento = armazenamento
+        self.rto_inicial = rto_inicial
+        self.prob_perda = prob_perda
+        self.sessoes = {} # número da sessão -> ServerSession
+        self.caminhos = OrderedDict() # endereço -> {"rto", "cc"} da última sessão desse cliente
+        self.cache = ChunkCache(memoria_cache) if memoria_cache else None # blocos recebidos, para o eco
+        self.loop = asyncio.get_running_loop()
+        self._buffer = bytearray(bloco_maximo + TAM_CABECALHO) ## cabe o maior bloco que uma sessão pode combinar
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_RECEPCAO)
+        self._capacidade = {} # bloco -> pacotes desse tamanho que cabem no buffer de recepção
+        self.loop.add_reader(sock.fileno(), self._ler)
+        ##Lidos só quando alguém consulta as métricas
+        REGISTRO.gauge("rdt_sessoes_ativas", "Sessões no servidor (inclusive as que só absorvem pacotes atrasados)",
+                       lambda: len(self.sessoes))
+        REGISTRO.gauge("rdt_servidor_em_transito_pacotes", "Pacotes do eco enviados e não confirmados, somando as sessões",
+                       lambda: sum(len(s.remetente.pendentes) for s in list(self.sessoes.values()) if s.remetente))
+        REGISTRO.gauge("rdt_servidor_fora_de_ordem_pacotes", "Blocos esperando os anteriores, somando as sessões",
+                       lambda: sum(len(s.receptor.fora_de_ordem) for s in list(self.sessoes.values()) if s.receptor))
+
+    def path_state(self, endereco):
+        """
+        RttEstimator e CongestionControl (ou None) deixados pela última sessão
+        de `endereco`, para a próxima continuar deles. Se o endereço ainda
+        tem uma sessão ativa, a nova ganha um estado só dela.
+        """
+        if any(s.endereco == endereco and s.encerrada_em is None for s in self.sessoes.values()):
+            return {"rto": RttEstimator(self.rto_inicial), "cc": None}
+        estado = self.caminhos.pop(endereco, None) or {"rto": RttEstimator(self.rto_inicial), "cc": None}
+        self.caminhos[endereco] = estado
+        while len(self.caminhos) > CAMINHOS_MAXIMO:
+            self.caminhos.popitem(last=False)
+        return estado
+
+    def capacidade_sessao(self, bloco=BUFFER_SIZE):
+        """Parte do buffer de recepção que cabe a cada sessão ativa, em pacotes de `bloco` bytes."""
+        if bloco not in self._capacidade:
+            self._capacidade[bloco] = socket_capacity(self.sock, bloco)
+        return max(self._capacidade[bloco] // max(len(self.sessoes), 1), JANELA_MINIMA_SESSAO)
+
+    def sendto(self, partes, endereco):
+        try:
+            send_parts(self.sock, partes, endereco)
+        except (BlockingIOError, InterruptedError):
+            pass ## buffer de envio cheio: o pacote se perde e o RDT retransmite
+        except OSError as exc:
+            log_event(log, ERROR, "erro_socket", "[SERVIDOR] Erro no socket: %(erro)s", erro=str(exc))
+
+    def _ler(self):
+        while True:
+            try:
+                tamanho, endereco = self.sock.recvfrom_into(self._buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                log_event(log, ERROR, "erro_socket", "[SERVIDOR] Erro no socket: %(erro)s", erro=str(exc))
+                return
+            self.datagram_received(parse_pkt(self._buffer, tamanho), endereco)
+
+    def datagram_received(self, pkt, endereco):
+        if pkt is None:
+            return ## corrompido (ou sonda maior que o buffer): tratado como perdido
+        if pkt.tipo == TIPO_SONDA:
+            ##Sondas chegam antes do SYN, então são respondidas sem sessão
+            self.sendto([make_probe_ack(pkt)], endereco)
+            return
+        agora = self.loop.time()
+        sessao = self.sessoes.get(pkt.sessao)
+        if sessao is not None:
+            if endereco == sessao.endereco:
+                sessao.on_packet(pkt, agora)
+            return ## mesmo número de sessão vindo de outro endereço: ignorado
+        if pkt.tipo != TIPO_SYN:
+            return ## pacote atrasado de uma sessão que já foi descartada
+        nova = ServerSession(self, pkt, endereco, agora)
+        if nova.recusa is not None:
+            log_event(log, WARNING, "recusa", "[SERVIDOR] Sessão %(sessao)d recusada: %(motivo)s.",
+                      sessao=pkt.sessao, motivo=nova.recusa)
+            self.sendto([make_pkt(TIPO_ERRO, dados=nova.recusa.encode(), sessao=pkt.sessao)], endereco)
+            return
+        ##Dois uploads simultâneos do mesmo nome gravariam no mesmo arquivo
+        antiga = next((s for s in self.sessoes.values() if nova.conflita(s)), None)
+        if (antiga is not None and antiga.remetente is None
+                and nova.metadados.get("id") is not None and antiga.metadados.get("id") == nova.metadados.get("id")):
+            ##O mesmo arquivo de novo (o cliente caiu e voltou): a sessão antiga grava o
+            ##diário e é abandonada, e a nova continua de onde ela parou
+            log_event(log, INFO, "substituida", "[SERVIDOR] Sessão %(antiga)d substituída pela sessão %(sessao)d.",
+                      antiga=antiga.sessao, sessao=pkt.sessao)
+            antiga.fechar(agora)
+        elif antiga is not None:
+            log_event(log, WARNING, "recusa", "[SERVIDOR] Sessão %(sessao)d recusada: '%(nome)s' já está sendo recebido.",
+                      sessao=pkt.sessao, nome=nova.nome)
+            self.sendto([make_pkt(TIPO_ERRO, dados=f"'{nova.nome}' já está sendo recebido".encode(),
+                                  sessao=pkt.sessao)], endereco)
+            return
+        try:
+            nova.start(pkt, agora)
+        except (OSError, ValueError) as exc:
+            ##Ex.: disco cheio ou sem permissão: a sessão não chega a existir, e o cliente é avisado
+            nova.cancelar()
+            log_event(log, ERROR, "recusa", "[SERVIDOR] Sessão %(sessao)d recusada: não foi possível abrir '%(nome)s' (%(erro)s).",
+                      sessao=pkt.sessao, nome=nova.nome, erro=str(exc))
+            self.sendto([make_pkt(TIPO_ERRO, dados=f"não foi possível abrir '{nova.nome}'".encode(),
+                                  sessao=pkt.sessao)], endereco)
+            return
+        self.sessoes[pkt.sessao] = nova
+
+    def remover(self, sessao):
+        sessao.cancelar()
+        self.sessoes.pop(sessao.sessao, None)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        for sessao in list(self.sessoes.values()):
+            self.remover(sessao)
+        self.sock.close()
+
+
+async def serve(host="0.0.0.0", porta=5000, armazenamento="armazenamento_server",
+                rto_inicial=TIMEOUT, prob_perda=0.0, bloco_maximo=BLOCO_MAXIMO, porta_metricas=None,
+                reutilizar_porta=False, memoria_cache=MEMORIA, tamanho_maximo=TAMANHO_MAXIMO):
+    """
+    Atende transferências em `host:porta` até o processo ser interrompido.
+    Até `memoria_cache` bytes dos blocos recebidos ficam em memória para o eco (0 desliga).
+    Envios em fluxos paralelos de arquivos maiores que `tamanho_maximo` são recusados.
+    Com `porta_metricas`, serve as métricas em 127.0.0.1 nessa porta (rdt/metrics.py).
+    Com `reutilizar_porta`, outros processos podem atender a mesma porta (SO_REUSEPORT).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reutilizar_porta:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, porta))
+    servidor = FileServer(sock, armazenamento, rto_inicial, prob_perda, bloco_maximo, memoria_cache, tamanho_maximo)
+    metricas = None
+    if porta_metricas is not None:
+        try:
+            metricas = MetricsServer(porta_metricas)
+            log_event(log, INFO, "metricas", "Métricas em http://127.0.0.1:%(porta)d/metrics (e UDP na mesma porta).",
+                      porta=metricas.porta)
+        except OSError as exc:
+            ##Sem métricas o servidor continua funcionando (ex.: porta ocupada por outra instância)
+            log_event(log, WARNING, "metricas", "Métricas desligadas: porta %(porta)d indisponível (%(erro)s).",
+                      porta=porta_metricas, erro=str(exc))
+    log_event(log, INFO, "inicio", "Servidor RDT 3.0 aguardando sessões na porta %(porta)d...", porta=porta)
+    try:
+        await asyncio.Future()
+    finally:
+        servidor.close()
+        if metricas is not None:
+            metricas.close()
+
+
+def _servir(processo, porta_metricas, argumentos):
+    ##Processo filho de serve_forever: cada um com o seu laço, as suas sessões e as suas métricas
+    if porta_metricas is not None:
+        porta_metricas += processo
+    try:
+        asyncio.run(serve(porta_metricas=porta_metricas, reutilizar_porta=True, **argumentos))
+    except KeyboardInterrupt:
+        pass
+
+def serve_forever(host="0.0.0.0", porta=5000, armazenamento="armazenamento_server", rto_inicial=TIMEOUT,
+                  prob_perda=0.0, bloco_maximo=BLOCO_MAXIMO, porta_metricas=None, processos=1, memoria_cache=MEMORIA,
+                  tamanho_maximo=TAMANHO_MAXIMO):
+    """
+    Roda serve() até o processo ser interrompido, em `processos` processos
+    (0: um por núcleo) que atendem a mesma porta com SO_REUSEPORT. O kernel
+    entrega todos os pacotes de um endereço de origem ao mesmo processo,
+    então cada sessão fica inteira num processo, e os fluxos de um envio
+    paralelo (rdt/parallel.py) se espalham pelos núcleos. O processo `i`
+    serve as métricas dele em `porta_metricas + i`, e tem a sua própria
+    cache de `memoria_cache` bytes. Uma sessão só é
+    comparada com as do mesmo processo: dois clientes enviando o mesmo nome
+    ao mesmo tempo não são detectados se caírem em processos diferentes.
+    """
+    argumentos = {"host": host, "porta": porta, "armazenamento": armazenamento, "rto_inicial": rto_inicial,
+                  "prob_perda": prob_perda, "bloco_maximo": bloco_maximo, "memoria_cache": memoria_cache,
+                  "tamanho_maximo": tamanho_maximo}
+    processos = processos or os.cpu_count() or 1
+    if processos == 1:
+        asyncio.run(serve(porta_metricas=porta_metricas, **argumentos))
+        return
+    contexto = multiprocessing.get_context("fork") ## os scripts não são importáveis (ver rdt/parallel.py)
+    filhos = [contexto.Process(target=_servir, args=(i, porta_metricas, argumentos)) for i in range(processos)]
+    for filho in filhos:
+        filho.start()
+    ##kill no processo principal também encerra os filhos (no finally)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for filho in filhos:
+            filho.join()
+    finally:
+        for filho in filhos:
+            filho.terminate()
@@ -0,0 +1,213 @@
+"""
+Sessão de transferência reaproveitável, para usar o RDT como biblioteca.
+
+Os scripts de RDT_3.0/ fazem uma transferência por execução: abrem um
+socket, sondam o caminho e começam do slow start com o RTO inicial, e tudo o
+que foi medido se perde quando o processo termina. TransferSession guarda,
+de uma transferência para a próxima, o que já se sabe do caminho até o
+servidor:
+ - o socket, e com ele a porta de origem: o servidor reconhece o cliente e
+   também reaproveita o RTT e a janela do lado dele (rdt/server.py);
+ - o RttEstimator, com o RTT medido;
+ - o CongestionControl, com a cwnd e o ssthresh em que o último envio
+   terminou (rdt/congestion.py);
+ - o bloco confirmado pela sondagem (rdt/pmtu.py), feita só no primeiro envio.
+
+    with TransferSession(("127.0.0.1", 5000), verificacao=VERIFICACAO_RESUMO) as sessao:
+        for caminho in arquivos:
+            print(sessao.send_file(caminho))
+
+AsyncTransferSession oferece os mesmos métodos como corrotinas. A linha de
+comando `python3 -m rdt` (rdt/__main__.py) é uma camada fina sobre as duas
+coisas: esta sessão no cliente e serve_forever no servidor.
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import time
+
+from rdt.rto import RttEstimator
+from rdt.congestion import CongestionControl
+from rdt.pmtu import BLOCO_BASE, BLOCO_MAXIMO
+from rdt.buffers import send_parts
+from rdt.window import WindowSender, run_sender, recv_window, new_session_id, MODO_SR, TIMEOUT
+from rdt.verify import (StreamingDigest, recv_report, repair_ranges, VERIFICACAO_ECO, VERIFICACAO_RESUMO,
+                        ALGORITMO, TAMANHO_FAIXA)
+from rdt.delta import send_delta
+from rdt.batch import send_batch
+
+TAMANHO_JANELA = 64
+BUFFER_RECEPCAO = 4 * 1024 * 1024 # buffer de recepção pedido ao SO; a janela anunciada no retorno é quantos blocos cabem nele
+
+
+class TransferSession:
+    """
+    Um socket para `destino` e o estado do caminho até ele, reaproveitados
+    em todas as transferências. As opções (modo, janela, bloco, FEC,
+    compressão, verificação) são as constantes dos scripts de RDT_3.0/.
+    As transferências são uma de cada vez: o socket é bloqueante.
+    """
+
+    def __init__(self, destino, modo=MODO_SR, tamanho_janela=TAMANHO_JANELA, bloco=BLOCO_MAXIMO, fec=0,
+                 compressao=0, verificacao=VERIFICACAO_ECO, rto_inicial=TIMEOUT, prob_perda=0.0,
+                 buffer_recepcao=BUFFER_RECEPCAO):
+        self.destino = destino
+        self.modo = modo
+        self.tamanho_janela = tamanho_janela
+        self.fec = fec
+        self.compressao = compressao
+        self.verificacao = verificacao
+        self.prob_perda = prob_perda
+        self.rto = RttEstimator(rto_inicial)
+        self.cc = CongestionControl(tamanho_janela)
+        self.bloco = bloco
+        self.sondado = bloco <= BLOCO_BASE # o bloco já passou pelo caminho (ou não há o que sondar)
+        self.transferencias = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_recepcao)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    @property
+    def opcoes(self):
+        """Parâmetros de send_window para o próximo envio, com o que já foi aprendido do caminho."""
+        return {"modo": self.modo, "tamanho_janela": self.tamanho_janela, "bloco": self.bloco,
+                "sondar": not self.sondado, "fec": self.fec, "compressao": self.compressao, "cc": self.cc}
+
+    def _enviar(self, arquivo, metadados, sessao, resumo=None):
+        ##Como send_window, mas guarda o bloco que a sondagem confirmou
+        remetente = WindowSender(arquivo, lambda *partes: send_parts(self.sock, partes, self.destino), metadados,
+                                 sessao, rto=self.rto, prob_perda=self.prob_perda, resumo=resumo, **self.opcoes)
+        resultado = run_sender(self.sock, remetente)
+        if remetente.conectado:
+            self.bloco = remetente.bloco_sondado
+            self.sondado = True
+        return resultado
+
+    def send_file(self, caminho, nome=None, retorno=None, verificacao=None, delta=False):
+        """
+        Envia `caminho` (com o nome `nome`, ou o do próprio arquivo) e recebe a
+        volta: no eco, o arquivo devolvido é gravado em `retorno` (ou
+        descartado); no modo resumo, os hashes, e as faixas diferentes são
+        reparadas. Com `delta`, envia só as diferenças para a versão que o
+        servidor já tem (rdt/delta.py).
+        Retorna um dict com sessao, pacotes, bytes, retransmissoes, segundos e
+        `ok` (o servidor recebeu o arquivo íntegro, no resumo; o eco voltou
+        com o mesmo resumo do arquivo enviado, no eco).
+        Levanta ConnectionRefusedError se o servidor recusar a transferência.
+        """
+        verificacao = verificacao or self.verificacao
+        info = os.stat(caminho)
+        nome = nome or os.path.basename(caminho)
+        metadados = {"nome": nome, "tamanho": info.st_size, "id": f"{info.st_size}-{info.st_mtime_ns}"}
+        ##No modo resumo, comparado com o relatório do servidor; no eco, com o resumo do que voltou
+        resumo = StreamingDigest(ALGORITMO, TAMANHO_FAIXA)
+        if verificacao == VERIFICACAO_RESUMO:
+            metadados.update(verificacao=VERIFICACAO_RESUMO, algoritmo=ALGORITMO, faixa=TAMANHO_FAIXA)
+        sessao = new_session_id()
+        comeco = time.monotonic()
+        with open(caminho, "rb") as arquivo:
+            if delta:
+                ##Cada sessão do delta sai por _enviar, que guarda o bloco sondado na primeira
+                pacotes, enviados, retransmissoes = send_delta(self.sock, self.destino, arquivo, metadados, sessao,
+                                                               rto=self.rto, prob_perda=self.prob_perda,
+                                                               resumo=resumo, enviar=self._enviar)
+            else:
+                pacotes, enviados, retransmissoes = self._enviar(arquivo, metadados, sessao, resumo)
+        resultado = {"nome": nome, "sessao": sessao, "tamanho": info.st_size, "pacotes": pacotes,
+                     "bytes": enviados, "retransmissoes": retransmissoes}
+
+        local = resumo.relatorio
+        if verificacao == VERIFICACAO_RESUMO:
+            remoto = recv_report(self.sock, sessao, self.rto, self.prob_perda)
+            resultado["ok"] = remoto.get("resumo") == local["resumo"]
+            if not resultado["ok"]:
+                with open(caminho, "rb") as arquivo:
+                    erradas = repair_ranges(self.sock, self.destino, arquivo, metadados, local, remoto, rto=self.rto,
+                                            prob_perda=self.prob_perda, **self.opcoes)
+                resultado["ok"] = not erradas
+                resultado["faixas_erradas"] = erradas
+        else:
+            ##Sem `retorno`, o eco ainda precisa ser recebido (o servidor espera os ACKs) e conferido, num
+            ##arquivo temporário: o resumo relê dele os blocos que chegam fora de ordem
+            eco = StreamingDigest(ALGORITMO, TAMANHO_FAIXA)
+            with open(retorno, "w+b") if retorno is not None else tempfile.TemporaryFile() as arquivo_retorno:
+                resultado["devolvido"], _, _, _ = recv_window(self.sock, arquivo_retorno, sessao, self.rto,
+                                                              self.prob_perda, resumo=eco)
+            resultado["ok"] = eco.relatorio["resumo"] == local["resumo"] and eco.tamanho == info.st_size
+        resultado["segundos"] = time.monotonic() - comeco
+        self.transferencias += 1
+        return resultado
+
+    def send_batch(self, origem, retorno=None, verificacao=None):
+        """
+        Envia os arquivos de `origem` (diretório ou lista) numa sessão só
+        (rdt/batch.py). Retorna um dict com sessao, pacotes, bytes,
+        retransmissoes, segundos e `arquivos` (o resultado de cada um).
+        """
+        sessao = new_session_id()
+        comeco = time.monotonic()
+        pacotes, enviados, retransmissoes, arquivos = send_batch(
+            self.sock, self.destino, origem, sessao=sessao, rto=self.rto, prob_perda=self.prob_perda,
+            verificacao=verificacao or self.verificacao, retorno=retorno, **self.opcoes)
+        self.transferencias += 1
+        return {"sessao": sessao, "pacotes": pacotes, "bytes": enviados, "retransmissoes": retransmissoes,
+                "segundos": time.monotonic() - comeco, "arquivos": arquivos}
+
+    def receive_file(self, caminho, sessao=None):
+        """
+        Espera alguém enviar um arquivo para este socket (na sessão `sessao`,
+        ou em qualquer uma) e grava em `caminho`. Retorna um dict com bytes,
+        pacotes, endereco e metadados (o SYN do remetente).
+        """
+        with open(caminho, "wb") as arquivo:
+            recebido, pacotes, endereco, metadados = recv_window(self.sock, arquivo, sessao, self.rto,
+                                                                  self.prob_perda)
+        self.transferencias += 1
+        return {"bytes": recebido, "pacotes": pacotes, "endereco": endereco, "metadados": metadados}
+
+
+class AsyncTransferSession:
+    """
+    TransferSession para código asyncio: cada método é uma corrotina que
+    roda a transferência numa thread (asyncio.to_thread), sem travar o laço.
+    As transferências de uma sessão continuam uma de cada vez, na ordem em
+    que foram pedidas; para várias ao mesmo tempo, abra várias sessões
+    (cada uma com o seu socket e o seu caminho).
+    """
+
+    def __init__(self, destino, **opcoes):
+        self.sessao = TransferSession(destino, **opcoes)
+        self._vez = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def _rodar(self, funcao, *args, **kwargs):
+        async with self._vez:
+            return await asyncio.to_thread(funcao, *args, **kwargs)
+
+    async def send_file(self, caminho, **kwargs):
+        return await self._rodar(self.sessao.send_file, caminho, **kwargs)
+
+    async def send_batch(self, origem, **kwargs):
+        return await self._rodar(self.sessao.send_batch, origem, **kwargs)
+
+    async def receive_file(self, caminho, **kwargs):
+        return await self._rodar(self.sessao.receive_file, caminho, **kwargs)
+
+    async def close(self):
+        async with self._vez:
+            self.sessao.close()
@@ -0,0 +1,124 @@
+"""
+Verificação de integridade por resumo (hash) em vez do eco do arquivo.
+
+No modo legado (VERIFICACAO_ECO) o servidor devolve o arquivo inteiro e o
+cliente pode compará-lo com o original: o dobro de bytes no fio, de disco e
+de tempo. No modo VERIFICACAO_RESUMO os dois lados calculam, enquanto os
+dados passam, um hash incremental do arquivo (BLAKE2b por padrão) e um hash
+por faixa de TAMANHO_FAIXA bytes; o servidor devolve só esse relatório, em
+JSON, na mesma sessão em que faria o eco.
+
+Se o resumo do arquivo não bate, os hashes das faixas dizem quais trechos
+estão errados, e o cliente reenvia só essas faixas, cada uma numa sessão de
+reparo (metadado `deslocamento`), que grava por cima do trecho no arquivo já
+recebido.
+"""
+
+import hashlib
+import io
+import json
+
+from rdt.window import send_window, recv_window, new_session_id
+
+VERIFICACAO_ECO = "eco"
+VERIFICACAO_RESUMO = "resumo"
+ALGORITMOS = ("blake2b", "sha256") # algoritmos que o servidor aceita
+ALGORITMO = "blake2b"
+TAMANHO_FAIXA = 1024 * 1024 # bytes cobertos por cada hash de faixa
+
+
+class StreamingDigest:
+    """
+    Hash incremental de um fluxo de bytes, com um hash extra para cada faixa
+    de `tamanho_faixa` bytes. Os dados precisam chegar em ordem.
+    """
+
+    def __init__(self, algoritmo=ALGORITMO, tamanho_faixa=TAMANHO_FAIXA):
+        if algoritmo not in ALGORITMOS:
+            raise ValueError(f"algoritmo de resumo não suportado: {algoritmo}")
+        self.algoritmo = algoritmo
+        self.tamanho_faixa = int(tamanho_faixa)
+        self.tamanho = 0
+        self._total = hashlib.new(algoritmo)
+        self._faixa = hashlib.new(algoritmo)
+        self._na_faixa = 0 # bytes já somados à faixa atual
+        self.faixas = [] # hex de cada faixa completa
+        self._buffer = None # readinto de update_from_file
+
+    def update(self, dados):
+        """Soma `dados` (bytes, bytearray ou memoryview) ao resumo."""
+        dados = memoryview(dados)
+        self._total.update(dados)
+        self.tamanho += len(dados)
+        while len(dados):
+            parte = dados[:self.tamanho_faixa - self._na_faixa]
+            self._faixa.update(parte)
+            self._na_faixa += len(parte)
+            dados = dados[len(parte):]
+            if self._na_faixa == self.tamanho_faixa:
+                self.faixas.append(self._faixa.hexdigest())
+                self._faixa = hashlib.new(self.algoritmo)
+                self._na_faixa = 0
+
+    def update_from_file(self, arquivo, tamanho):
+        """Lê `tamanho` bytes da posição atual de `arquivo` e os soma ao resumo."""
+        if self._buffer is None:
+            self._buffer = memoryview(bytearray(64 * 1024))
+        while tamanho > 0:
+            lido = arquivo.readinto(self._buffer[:min(tamanho, len(self._buffer))])
+            if not lido:
+                break
+            self.update(self._buffer[:lido])
+            tamanho -= lido
+
+    @property
+    def relatorio(self):
+        """Resumo do que já passou, no formato trocado entre cliente e servidor."""
+        faixas = list(self.faixas)
+        if self._na_faixa:
+            faixas.append(self._faixa.hexdigest()) ## última faixa, incompleta
+        return {"algoritmo": self.algoritmo, "faixa": self.tamanho_faixa, "tamanho": self.tamanho,
+                "resumo": self._total.hexdigest(), "faixas": faixas}
+
+
+def bad_ranges(local, remoto):
+    """
+    Índices das faixas em que os relatórios `local` e `remoto` diferem.
+    Relatórios incompatíveis (outro algoritmo ou faixa) marcam todas as faixas.
+    """
+    if local["resumo"] == remoto.get("resumo") and local["tamanho"] == remoto.get("tamanho"):
+        return []
+    todas = list(range(len(local["faixas"])))
+    if remoto.get("algoritmo") != local["algoritmo"] or remoto.get("faixa") != local["faixa"]:
+        return todas
+    faixas = remoto.get("faixas") or []
+    return [i for i in todas if i >= len(faixas) or faixas[i] != local["faixas"][i]]
+
+
+def recv_report(sock, sessao, rto=None, prob_perda=0.0):
+    """Recebe o relatório que o servidor envia no lugar do eco (um JSON pequeno, pela mesma janela)."""
+    relatorio = io.BytesIO()
+    recv_window(sock, relatorio, sessao, rto=rto, prob_perda=prob_perda)
+    return json.loads(relatorio.getvalue())
+
+def repair_ranges(sock, destino, arquivo, metadados, local, remoto, rto=None, prob_perda=0.0, base=0, **opcoes):
+    """
+    Reenvia para `destino` as faixas de `arquivo` em que o relatório `remoto`
+    difere de `local`, uma sessão de reparo por faixa. `base` é o byte do
+    arquivo onde começa o trecho dos relatórios (um fluxo de rdt/parallel.py).
+    `opcoes` vão para send_window (modo, tamanho_janela). Retorna as faixas
+    que continuaram erradas depois do reparo.
+    """
+    erradas = []
+    for faixa in bad_ranges(local, remoto):
+        inicio = faixa * local["faixa"]
+        reparo = {"nome": metadados["nome"], "tamanho": min(local["faixa"], local["tamanho"] - inicio),
+                  "deslocamento": base + inicio, "verificacao": VERIFICACAO_RESUMO,
+                  "algoritmo": local["algoritmo"], "faixa": local["faixa"]}
+        resumo = StreamingDigest(local["algoritmo"], local["faixa"])
+        sessao = new_session_id()
+        arquivo.seek(base + inicio)
+        send_window(sock, destino, arquivo, reparo, sessao, rto=rto, prob_perda=prob_perda, resumo=resumo, **opcoes)
+        if recv_report(sock, sessao, rto, prob_perda).get("resumo") != resumo.relatorio["resumo"]:
+            erradas.append(faixa)
+    return erradas
@@ -0,0 +1,1090 @@
+"""
+Transmissão com janela deslizante (pipelining) para o RDT 3.0.
+
+Dois modos, escolhidos pela constante MODO dos scripts:
+ - GBN (Go-Back-N): o receptor só aceita pacotes em ordem e responde com ACK
+   cumulativo; no timeout o remetente volta à base e reenvia a janela.
+ - SR (Selective Repeat): o receptor guarda pacotes fora de ordem dentro da
+   janela e confirma cada um individualmente; no timeout o remetente reenvia
+   apenas os pacotes que expiraram.
+
+Os números de sequência são inteiros crescentes (0, 1, 2, ...) em vez do bit
+alternante; no fio eles viajam em 32 bits (ver rdt/packet.py). Todo ACK leva
+o ACK cumulativo (próxima sequência esperada em ordem), a sequência do pacote
+que o provocou (no SR, essa sequência fica confirmada individualmente) e a
+janela livre do receptor.
+
+Quantos pacotes ficam em trânsito é decidido a cada momento pelo menor valor
+entre TAMANHO_JANELA, a janela de congestionamento (rdt/congestion.py) e a
+janela anunciada pelo receptor; os envios são espaçados por um token bucket
+(rdt/pacer.py) na taxa cwnd / RTT.
+
+Cada transferência é uma sessão: o remetente abre com um SYN que leva os
+metadados (nome, tamanho, bloco, modo e janela, em JSON) e o receptor aceita
+com um SYNACK, que diz a partir de qual bloco enviar (diferente de 0 quando
+um upload interrompido é retomado, ver rdt/resume.py). Todos os pacotes levam
+o número da sessão, então um servidor pode atender várias transferências na
+mesma porta.
+
+WindowSender e WindowReceiver são máquinas de estado sem E/O: recebem pacotes
+e avisos de tempo, enviam por uma função `enviar` e informam em `prazo` quando
+precisam ser acordados. send_window/recv_window as usam com um socket
+bloqueante; o servidor de rdt/server.py usa as mesmas classes num laço asyncio.
+
+Os laços não alocam um bytes por pacote (ver rdt/buffers.py): o payload é uma
+fatia do arquivo mapeado com mmap, o cabeçalho é escrito num buffer fixo e os
+dois saem juntos com `enviar(cabecalho, dados)` (sendmsg); os ACKs também são
+escritos sempre no mesmo buffer.
+
+No modo SR, com `fec` no SYN, o remetente também envia pacotes de reparo
+para cada grupo de blocos (rdt/fec.py), e o receptor reconstrói blocos
+perdidos sem esperar o timeout e a retransmissão. Com `compressao` no SYN,
+o payload de cada pacote pode ir comprimido (rdt/compress.py).
+"""
+
+import json
+import socket
+import struct
+import time
+import random
+
+from rdt.packet import (make_pkt, pack_header_into, parse_pkt, unwrap_seq, TIPO_DADOS, TIPO_ACK,
+                        TIPO_FIN, TIPO_SYN, TIPO_SYNACK, TIPO_ERRO, TIPO_SONDA, TIPO_SONDA_ACK,
+                        TIPO_REPARO, FLAG_SACK, FLAG_FEC, FLAG_ZLIB, TAM_CABECALHO)
+from rdt.buffers import SlotRing, map_file, send_parts
+from rdt.pmtu import BLOCO_BASE, BLOCO_MAXIMO, MAX_RODADAS, candidates, padding, set_dont_fragment
+from rdt.rto import RttEstimator
+from rdt.congestion import CongestionControl
+from rdt.pacer import TokenBucket
+from rdt.fec import RedundancyControl, encode, decode, GRUPO_MAXIMO, ESPERA_GRUPO
+from rdt.compress import BlockCompressor, decompress
+from rdt.log import get_logger, log_event, DEBUG, INFO, WARNING
+from rdt.metrics import REGISTRO
+
+# --- Configurações padrão ---
+MODO_GBN = "GBN"
+MODO_SR = "SR"
+TAMANHO_JANELA = 16
+TIMEOUT = 1.0 # RTO inicial, antes da primeira medição de RTT
+BUFFER_SIZE = 1024 # bloco padrão, quando o remetente não sonda o caminho (ver rdt/pmtu.py)
+MAX_TIMEOUTS = 10 # timeouts seguidos sem nenhum ACK antes de desistir do receptor
+GANHO_SLOW_START = 2.0 # pacing: taxa = ganho * cwnd / RTT
+GANHO_CONGESTIONAMENTO = 1.25
+RAJADA_PACOTES = 4 # rajada máxima do pacer, em pacotes
+
+##Com FEC e compressão, o FEC protege o payload como foi para o fio, precedido das flags e do tamanho
+_SIMBOLO = struct.Struct("!BH")
+
+log = get_logger("rdt.window")
+
+##Métricas (rdt/metrics.py), somadas entre todas as transferências do processo
+_RTT = REGISTRO.histogram("rdt_rtt_segundos", "RTT medido pelos ACKs (só pacotes não retransmitidos)")
+_RETRANSMISSOES = REGISTRO.counter("rdt_retransmissoes_total", "Pacotes de dados retransmitidos")
+_ACKS_DUPLICADOS = REGISTRO.counter("rdt_acks_duplicados_total", "ACKs que não confirmaram nenhum pacote novo")
+_TIMEOUTS = REGISTRO.counter("rdt_timeouts_total", "Temporizadores de retransmissão vencidos")
+_PACOTES_CONFIRMADOS = REGISTRO.counter("rdt_pacotes_confirmados_total", "Pacotes de dados confirmados pelo receptor")
+_BYTES_CONFIRMADOS = REGISTRO.counter("rdt_bytes_confirmados_total", "Bytes de arquivo confirmados pelo receptor")
+_JANELA = REGISTRO.histogram("rdt_janela_pacotes", "Janela de congestionamento (cwnd) a cada ACK novo", menor=1, maior=1e6)
+_EM_TRANSITO = REGISTRO.histogram("rdt_em_transito_pacotes", "Pacotes enviados e não confirmados, a cada ACK novo",
+                                  menor=1, maior=1e6)
+_GOODPUT = REGISTRO.histogram("rdt_goodput_bytes_por_segundo", "Bytes confirmados / duração de cada transferência concluída",
+                              menor=1, maior=1e12)
+_DURACAO = REGISTRO.histogram("rdt_duracao_transferencia_segundos", "Duração de cada transferência concluída, do SYN ao último ACK")
+_CONCLUIDAS = REGISTRO.counter("rdt_transferencias_total", "Transferências enviadas até o fim")
+_FALHAS = REGISTRO.counter("rdt_transferencias_falhas_total", "Transferências abandonadas (recusa ou receptor em silêncio)")
+_PACOTES_RECEBIDOS = REGISTRO.counter("rdt_pacotes_recebidos_total", "Pacotes de dados recebidos, inclusive repetidos")
+_FORA_DE_ORDEM = REGISTRO.counter("rdt_fora_de_ordem_total", "Pacotes recebidos fora de ordem (SR guarda, GBN descarta)")
+_FILA = REGISTRO.histogram("rdt_fila_fora_de_ordem_pacotes", "Blocos guardados esperando os anteriores (SR), a cada chegada fora de ordem",
+                           menor=1, maior=1e6)
+_REPAROS = REGISTRO.counter("rdt_fec_reparos_enviados_total", "Pacotes de reparo FEC enviados")
+_RECUPERADOS = REGISTRO.counter("rdt_fec_recuperados_total", "Blocos perdidos reconstruídos pelo FEC, sem retransmissão")
+_ORIGINAIS = REGISTRO.counter("rdt_compressao_bytes_originais_total", "Bytes de arquivo das transferências com compressão")
+_COMPRIMIDOS = REGISTRO.counter("rdt_compressao_bytes_enviados_total", "Os mesmos bytes depois da compressão (sem retransmissões)")
+
+
+# --- Funções Auxiliares RDT ---
+def make_ack(expected, seq, janela, seletivo=False, sessao=0, buffer=None, recuperado=False):
+    """
+    Cria um ACK. `expected` é o ACK cumulativo (próxima sequência esperada em
+    ordem) e `seq` é o pacote que provocou este ACK, usado pelo remetente para
+    medir o RTT. Com `seletivo` (SR), `seq` também fica confirmado sozinho.
+    `janela` é quantos pacotes além de `expected` o receptor ainda aceita.
+    Com `buffer` (TAM_CABECALHO bytes), o ACK é escrito nele em vez de alocado.
+    `recuperado` avisa que `seq` foi reconstruído pelo FEC, não recebido.
+    """
+    flags = (FLAG_SACK if seletivo else 0) | (FLAG_FEC if recuperado else 0)
+    if buffer is not None:
+        return pack_header_into(buffer, TIPO_ACK, seq=seq, ack=expected, janela=janela,
+                                flags=flags, sessao=sessao)
+    return make_pkt(TIPO_ACK, seq=seq, ack=expected, janela=janela, flags=flags, sessao=sessao)
+
+def is_protocol_pkt(packet):
+    """Indica se o datagrama é um pacote RDT válido (de qualquer tipo)."""
+    return parse_pkt(packet) is not None
+
+def simulate_loss(prob_perda):
+    """
+    Simula a perda de um pacote com base na probabilidade informada.
+    Para medições reproduzíveis, use o proxy de rdt/impairment.py (PROB_PERDA = 0).
+    """
+    return random.random() < prob_perda
+
+def socket_capacity(sock, bloco=BUFFER_SIZE):
+    """Quantos pacotes cheios, com payload de `bloco` bytes, cabem no buffer de recepção do socket."""
+    rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    ##O kernel contabiliza cerca do dobro do payload por datagrama
+    return max(rcvbuf // (2 * (bloco + TAM_CABECALHO)), 1)
+
+def make_probe_ack(sonda):
+    """Resposta a uma sonda de tamanho (rdt/pmtu.py): confirma que `sonda.seq` bytes chegaram inteiros."""
+    return make_pkt(TIPO_SONDA_ACK, seq=sonda.seq, sessao=sonda.sessao)
+
+
+def new_session_id():
+    """Sorteia um número de sessão de 32 bits (0 fica livre como "sem sessão")."""
+    return random.randint(1, 0xFFFFFFFF)
+
+
+# --- Remetente ---
+class WindowSender:
+    """
+    Lado que envia um arquivo: SYN -> dados com janela deslizante -> FIN.
+    `enviar(*partes)` coloca as partes (cabeçalho, payload) no fio como um só
+    datagrama; `metadados` vai no SYN. `rto` é o RttEstimator do caminho;
+    passar o mesmo objeto em transferências seguidas aproveita o RTT já
+    medido. Os eventos de cada pacote vão para o log "rdt.window" no nível
+    DEBUG (rdt/log.py): desligados por padrão, não custam nem a formatação.
+
+    O envio começa na posição atual de `arquivo` e, se `metadados` tem
+    "tamanho", para depois desses bytes (as sessões de reparo de
+    rdt/verify.py reenviam só uma faixa). Com `resumo` (um StreamingDigest),
+    cada bloco é somado ao resumo na primeira vez que é lido.
+
+    `bloco` é o maior payload proposto no SYN. Com `sondar`, antes do SYN o
+    remetente sonda o caminho (rdt/pmtu.py) e propõe o maior tamanho
+    confirmado; o bloco usado é o que o receptor devolver no SYNACK.
+
+    Com `fec` (blocos por grupo, só no SR), cada grupo de blocos novos é
+    seguido dos seus reparos (rdt/fec.py), se o receptor aceitar no SYNACK.
+    Com `compressao` (nível do zlib), cada payload que comprime vai
+    comprimido (rdt/compress.py), também só se o receptor aceitar.
+
+    `cc` é o CongestionControl de uma transferência anterior pelo mesmo
+    caminho: como o `rto`, evita recomeçar do slow start. Depois da
+    sondagem, `bloco_sondado` é o tamanho que passou pelo caminho, que a
+    próxima transferência pode propor sem sondar de novo.
+
+    Com FEC e compressão, o bloco proposto diminui para o reparo (que leva
+    também as flags e o tamanho de cada payload) caber no tamanho sondado;
+    com `combinado`, `bloco` já foi combinado numa sessão anterior (o eco do
+    servidor) e é usado como está.
+    """
+
+    def __init__(self, arquivo, enviar, metadados=None, sessao=0, modo=MODO_SR,
+                 tamanho_janela=TAMANHO_JANELA, rto=None, prob_perda=0.0, resumo=None,
+                 bloco=BUFFER_SIZE, sondar=False, fec=0, compressao=0, cc=None, combinado=False):
+        self.arquivo = arquivo
+        self.combinado = combinado
+        self.resumo = resumo
+        self.bloco = bloco
+        self.enviar = enviar
+        self.sessao = sessao
+        self.modo = modo
+        self.tamanho_janela = tamanho_janela
+        self.rto = rto if rto is not None else RttEstimator(TIMEOUT)
+        self.prob_perda = prob_perda
+        self.metadados = dict(metadados or {})
+        self.metadados.update(bloco=bloco, modo=modo, janela=tamanho_janela)
+        if fec and modo == MODO_SR:
+            self.metadados["fec"] = min(fec, tamanho_janela)
+        if compressao:
+            self.metadados["compressao"] = compressao
+        if cc is not None:
+            cc.restart(tamanho_janela)
+        self.cc = cc if cc is not None else CongestionControl(tamanho_janela)
+        self.bloco_sondado = bloco # sem sondar, o bloco pedido
+        self.pacer = TokenBucket(taxa=0, rajada=RAJADA_PACOTES * (bloco + TAM_CABECALHO))
+
+        self.conectado = False # SYNACK recebido
+        self.concluido = False # FIN enviado (com ou sem sucesso)
+        self.falhou = False
+        self.erro = None # mensagem do TIPO_ERRO, se o receptor recusou
+        self.aceito = {} # parâmetros devolvidos no SYNACK
+        self.inicio = 0 # primeiro bloco enviado (o receptor pode já ter os anteriores)
+
+        self.base = 0 # menor sequência ainda não confirmada
+        self.next_seq = 0 # próxima sequência nova a ser usada
+        self.reenviar_de = 0 # GBN: depois de um timeout, volta para a base e reenvia daqui
+        self.limite_receptor = tamanho_janela # maior sequência (exclusiva) que o receptor aceita
+        self.ultimo_ack = 0
+        self.pendentes = {} # seq -> {"cab", "dados", "tam", "enviado_em", "prazo", "reenviado" (nº de reenvios)}
+        self.prazo_gbn = None # GBN usa um único temporizador para a base da janela
+        self.fim_arquivo = False
+        self._syn = None # {"pkt", "enviado_em", "prazo", "reenviado"} enquanto não há SYNACK
+        ##Sondagem do tamanho do bloco, antes do SYN: {"candidatos", "confirmado", "rodada", "enviado_em", "prazo"}
+        self._sonda = None
+        if sondar and candidates(bloco):
+            self._sonda = {"candidatos": candidates(bloco), "confirmado": BLOCO_BASE, "rodada": 0,
+                           "enviado_em": None, "prazo": None}
+            self._cabecalho_sonda = bytearray(TAM_CABECALHO)
+        self._pacer_ate = None # o pacer pediu para esperar até este instante
+        ##FEC, ligado pelo SYNACK: blocos por grupo, perda estimada e o grupo aberto
+        ##({"base", "blocos" (fatias já enviadas), "prazo"})
+        self.fec = 0
+        self.redundancia = None
+        self._grupo = None
+        self.compressor = None # BlockCompressor, se o receptor aceitou a compressão
+        self.bytes_no_fio = 0 # payload dos blocos novos, depois da compressão
+
+        ##Buffers dos pacotes em trânsito: nunca há mais pendentes que a janela
+        self._cabecalhos = SlotRing(tamanho_janela, TAM_CABECALHO)
+        self._deslocamento = arquivo.tell() ## envia a partir da posição atual, como read()
+        self._fim = self._deslocamento + int(self.metadados["tamanho"]) if "tamanho" in self.metadados else None
+        self._mapa = map_file(arquivo)
+        if self._mapa is not None:
+            self._fonte = memoryview(self._mapa)
+        else:
+            self._blocos = None # criados quando o SYNACK fixa o tamanho do bloco
+
+        self.pacotes_enviados = 0
+        self.total_enviado = 0
+        self.retransmissoes = 0
+        self.timeouts_seguidos = 0
+        self._iniciado_em = None
+
+    def _log(self, nivel, evento, mensagem, **campos):
+        log_event(log, nivel, evento, mensagem, sessao=self.sessao, **campos)
+
+    @property
+    def resultado(self):
+        return self.pacotes_enviados, self.total_enviado, self.retransmissoes
+
+    @property
+    def prazo(self):
+        """Próximo instante (time.monotonic) em que on_timer deve ser chamado, ou None."""
+        if self.concluido:
+            return None
+        if not self.conectado:
+            return self._sonda["prazo"] if self._sonda is not None else self._syn["prazo"]
+        prazos = [self._pacer_ate] if self._pacer_ate is not None else []
+        if self.modo == MODO_GBN:
+            if self.prazo_gbn is not None:
+                prazos.append(self.prazo_gbn)
+        elif self.pendentes:
+            prazos.append(min(p["prazo"] for p in self.pendentes.values()))
+        if self._grupo is not None:
+            prazos.append(self._grupo["prazo"])
+        return min(prazos) if prazos else None
+
+    def start(self, agora):
+        """Sonda o tamanho do bloco, se pedido, e envia o SYN com os metadados da transferência."""
+        self._iniciado_em = agora
+        if self._sonda is not None:
+            self._sondar(agora)
+        else:
+            self._abrir(agora)
+
+    def _abrir(self, agora):
+        if "fec" in self.metadados and "compressao" in self.metadados and not self.combinado:
+            ##Com os dois, cada reparo leva também as flags e o tamanho dos payloads (_SIMBOLO):
+            ##o bloco diminui para o reparo ainda caber no tamanho sondado
+            self.bloco -= _SIMBOLO.size
+        self.metadados["bloco"] = self.bloco
+        pkt = make_pkt(TIPO_SYN, dados=json.dumps(self.metadados).encode(), sessao=self.sessao)
+        self._syn = {"pkt": pkt, "enviado_em": agora, "prazo": agora + self.rto.rto, "reenviado": 0}
+        self.enviar(pkt)
+
+    def _sondar(self, agora):
+        ##Uma rodada: uma sonda de cada tamanho ainda não confirmado, todas de uma vez
+        sonda = self._sonda
+        for tamanho in list(sonda["candidatos"]):
+            if tamanho <= sonda["confirmado"]:
+                continue
+            if simulate_loss(self.prob_perda):
+                self._log(DEBUG, "perda_simulada", "  [SIMULAÇÃO] Sonda de %(tamanho)d bytes PERDIDA no envio.", tamanho=tamanho)
+                continue
+            dados = padding(tamanho)
+            cab = pack_header_into(self._cabecalho_sonda, TIPO_SONDA, seq=tamanho, dados=dados, sessao=self.sessao)
+            try:
+                self.enviar(cab, dados)
+            except OSError:
+                ##EMSGSIZE: maior que o MTU da própria interface, nem sai da máquina
+                sonda["candidatos"].remove(tamanho)
+        if not sonda["candidatos"] or sonda["confirmado"] >= sonda["candidatos"][-1]:
+            self._fim_sondagem(agora)
+            return
+        sonda["enviado_em"] = agora
+        sonda["prazo"] = agora + self.rto.rto
+
+    def _fim_sondagem(self, agora):
+        self.bloco = self.bloco_sondado = self._sonda["confirmado"]
+        self._sonda = None
+        self._log(INFO, "sondagem", "  [REMETENTE] Sondagem concluída: blocos de até %(bloco)d bytes chegam ao receptor.",
+                  bloco=self.bloco)
+        self._abrir(agora)
+
+    def _ler(self, seq):
+        """Payload do pacote `seq`, sem cópia quando o arquivo está mapeado."""
+        inicio = self._deslocamento + seq * self.bloco
+        fim = inicio + self.bloco if self._fim is None else min(inicio + self.bloco, self._fim)
+        if self._mapa is not None:
+            return self._fonte[inicio:fim]
+        bloco = self._blocos.slot(seq)[:max(fim - inicio, 0)]
+        return bloco[:self.arquivo.readinto(bloco)]
+
+    def _transmitir(self, seq, p, reenvio=False):
+        if simulate_loss(self.prob_perda):
+            self._log(DEBUG, "perda_simulada", "  [SIMULAÇÃO] Pacote %(seq)d PERDIDO no envio.", seq=seq)
+        else:
+            self.enviar(p["cab"], p["dados"])
+            if reenvio:
+                self._log(DEBUG, "reenvio", "  [REMETENTE] Reenviado pacote **%(seq)d**.", seq=seq)
+            else:
+                self._log(DEBUG, "envio", "  [REMETENTE] Enviado pacote **%(seq)d**.", seq=seq)
+
+    def _confirmar(self, seq, recuperado=False):
+        p = self.pendentes.pop(seq, None)
+        if p:
+            if self.redundancia is not None and not p["reenviado"]:
+                self.redundancia.sample(recuperado)
+            self.pacotes_enviados += 1
+            self.total_enviado += p["tam"]
+            _PACOTES_CONFIRMADOS.inc()
+            _BYTES_CONFIRMADOS.inc(p["tam"])
+        return p is not None
+
+    def _agrupar(self, seq, dados, simbolo, agora):
+        ##Junta o bloco recém-enviado (`simbolo`: o que o FEC protege) ao grupo aberto;
+        ##o grupo fecha cheio ou no último bloco
+        if self._grupo is None:
+            self._grupo = {"base": seq, "blocos": [],
+                           "prazo": agora + ESPERA_GRUPO * (self.rto.srtt or self.rto.rto)}
+        self._grupo["blocos"].append(simbolo)
+        ultimo = len(dados) < self.bloco or (
+            self._fim is not None and self._deslocamento + (seq + 1) * self.bloco >= self._fim)
+        if ultimo or len(self._grupo["blocos"]) >= self.fec:
+            self._fechar_grupo(agora)
+
+    def _fechar_grupo(self, agora):
+        grupo, self._grupo = self._grupo, None
+        blocos = grupo["blocos"]
+        m = self.redundancia.repairs(len(blocos))
+        if not m:
+            return
+        for j, reparo in enumerate(encode(blocos, m)):
+            self.pacer.consume(TAM_CABECALHO + len(reparo)) ## como as retransmissões: não espera, mas paga
+            if simulate_loss(self.prob_perda):
+                self._log(DEBUG, "perda_simulada", "  [SIMULAÇÃO] Reparo %(reparo)d do grupo %(base)d PERDIDO no envio.",
+                          reparo=j, base=grupo["base"])
+                continue
+            cab = pack_header_into(self._cabecalho_reparo, TIPO_REPARO, seq=grupo["base"], ack=j, janela=len(blocos),
+                                   dados=reparo, sessao=self.sessao)
+            self.enviar(cab, reparo)
+            _REPAROS.inc()
+        ##O receptor pode reconstruir os blocos do grupo com os reparos: a retransmissão
+        ##só vale um RTO depois deles, senão ela quase sempre sairia antes da reconstrução
+        for seq in range(grupo["base"], grupo["base"] + len(blocos)):
+            p = self.pendentes.get(seq)
+            if p is not None and not p["reenviado"]:
+                p["prazo"] = max(p["prazo"], agora + self.rto.rto)
+        self._log(DEBUG, "reparo", "  [REMETENTE] Grupo %(base)d (%(blocos)d blocos): %(reparos)d reparo(s), perda estimada %(perda).3f.",
+                  base=grupo["base"], blocos=len(blocos), reparos=m, perda=self.redundancia.perda)
+
+    def _atualizar_pacer(self):
+        ##Sem RTT medido ainda, o pacer não limita (taxa 0 = sem espera)
+        if self.rto.srtt:
+            ganho = GANHO_SLOW_START if self.cc.slow_start else GANHO_CONGESTIONAMENTO
+            self.pacer.set_rate(ganho * self.cc.cwnd * (self.bloco + TAM_CABECALHO) / self.rto.srtt)
+
+    def _encerrar(self, falhou=False):
+        ##Avisa o receptor que não há mais nada a enviar
+        self.falhou = falhou
+        self._liberar()
+        self.enviar(make_pkt(TIPO_FIN, seq=self.next_seq, sessao=self.sessao))
+
+    def _liberar(self):
+        self.concluido = True
+        if self.falhou:
+            _FALHAS.inc()
+        self.pendentes.clear()
+        self._grupo = None ## o grupo guarda fatias do mapa
+        if self._mapa is not None:
+            self._fonte.release()
+            try:
+                self._mapa.close()
+            except BufferError:
+                pass ## ainda há fatias do mapa vivas na pilha: ele fecha quando elas forem coletadas
+            self._mapa = None
+
+    def _preencher(self, agora):
+        ##Preenche a janela: primeiro o que o GBN precisa reenviar, depois pacotes novos
+        if self._pacer_ate is not None:
+            if agora < self._pacer_ate:
+                return
+            self._pacer_ate = None
+        while True:
+            limite = min(self.base + self.cc.janela, self.limite_receptor)
+            if not self.pendentes:
+                limite = max(limite, self.base + 1) ## janela fechada: sonda com um pacote
+            reenvio = self.reenviar_de < self.next_seq
+            if reenvio:
+                if self.reenviar_de >= limite:
+                    break
+                p = self.pendentes.get(self.reenviar_de)
+                if not p:
+                    self.reenviar_de += 1
+                    continue
+                tamanho = TAM_CABECALHO + len(p["dados"])
+            else:
+                if self.fim_arquivo or self.next_seq >= limite:
+                    break
+                tamanho = self.bloco + TAM_CABECALHO
+            espera = self.pacer.delay(tamanho)
+            if espera:
+                self._pacer_ate = agora + espera
+                break
+            if reenvio:
+                self._transmitir(self.reenviar_de, p, reenvio=True)
+                p["reenviado"] += 1
+                self.retransmissoes += 1
+                _RETRANSMISSOES.inc()
+                self.reenviar_de += 1
+                continue
+            dados = self._ler(self.next_seq)
+            if not dados:
+                self.fim_arquivo = True
+                break
+            if self.resumo is not None:
+                self.resumo.update(dados)
+            payload, flags = dados, 0
+            if self.compressor is not None:
+                payload, comprimido = self.compressor.compress(dados)
+                if comprimido:
+                    flags = FLAG_ZLIB
+                    self.pacer.consume(len(payload) - len(dados)) ## o pacer cobrou um bloco cheio: devolve a diferença
+            self.bytes_no_fio += len(payload)
+            cab = pack_header_into(self._cabecalhos.slot(self.next_seq), TIPO_DADOS, seq=self.next_seq,
+                                   dados=payload, flags=flags, sessao=self.sessao)
+            p = self.pendentes[self.next_seq] = {"cab": cab, "dados": payload, "tam": len(dados), "enviado_em": agora,
+                                                 "prazo": agora + self.rto.rto, "reenviado": 0}
+            if self.prazo_gbn is None:
+                self.prazo_gbn = agora + self.rto.rto
+            self._transmitir(self.next_seq, p)
+            if self.fec:
+                simbolo = payload if self.compressor is None else _SIMBOLO.pack(flags, len(payload)) + payload
+                self._agrupar(self.next_seq, dados, simbolo, agora)
+            self.next_seq += 1
+            self.reenviar_de = self.next_seq
+        if self.fim_arquivo and self._grupo is not None:
+            self._fechar_grupo(agora) ## arquivo com tamanho múltiplo do bloco: o último bloco não era curto
+
+        ##Tudo enviado e confirmado
+        if self.fim_arquivo and not self.pendentes:
+            duracao = agora - self._iniciado_em
+            _CONCLUIDAS.inc()
+            _DURACAO.record(duracao)
+            if duracao > 0:
+                _GOODPUT.record(self.total_enviado / duracao)
+            if self.compressor is not None:
+                _ORIGINAIS.inc(self.total_enviado)
+                _COMPRIMIDOS.inc(self.bytes_no_fio)
+                self._log(INFO, "compressao", "  [REMETENTE] Compressão: %(originais)d bytes do arquivo foram enviados como %(enviados)d.",
+                          originais=self.total_enviado, enviados=self.bytes_no_fio)
+            self._encerrar()
+
+    def on_timer(self, agora):
+        """Trata os prazos vencidos: reenvio do SYN, retransmissões e o pacer."""
+        if self.concluido:
+            return
+        if self._sonda is not None:
+            if agora >= self._sonda["prazo"]:
+                ##Rodada sem resposta dos tamanhos maiores: as sondas podem só ter se perdido
+                self._sonda["rodada"] += 1
+                if self._sonda["rodada"] >= MAX_RODADAS:
+                    self._fim_sondagem(agora)
+                else:
+                    self._sondar(agora)
+            return
+        if not self.conectado:
+            if agora >= self._syn["prazo"]:
+                self.timeouts_seguidos += 1
+                if self.timeouts_seguidos > MAX_TIMEOUTS:
+                    self._log(WARNING, "desistencia", "  [REMETENTE] Receptor não responde após %(timeouts)d timeouts. Desistindo.",
+                              timeouts=MAX_TIMEOUTS)
+                    self.falhou = True
+                    self._liberar()
+                    return
+                self.rto.backoff()
+                self._syn["reenviado"] += 1
+                self._syn["prazo"] = agora + self.rto.rto
+                self.enviar(self._syn["pkt"])
+            return
+
+        if self.modo == MODO_GBN:
+            expirou = self.prazo_gbn is not None and agora >= self.prazo_gbn
+            seguido = expirou
+        else:
+            expirados = [seq for seq in sorted(self.pendentes) if self.pendentes[seq]["prazo"] <= agora]
+            expirou = bool(expirados)
+            ##Cada pacote tem seu temporizador: só conta como timeout seguido quando
+            ##a base expira, senão uma janela cheia "expira" várias vezes num RTT longo
+            seguido = self.base in expirados
+        if expirou:
+            _TIMEOUTS.inc(1 if self.modo == MODO_GBN else len(expirados))
+            self.timeouts_seguidos += seguido
+            if self.timeouts_seguidos > MAX_TIMEOUTS:
+                self._log(WARNING, "desistencia", "  [REMETENTE] Receptor não responde após %(timeouts)d timeouts. Desistindo.",
+                          timeouts=MAX_TIMEOUTS)
+                self._encerrar(falhou=True)
+                return
+            if self.modo == MODO_GBN:
+                ##Um único temporizador: o backoff vale para a janela inteira. Um timeout
+                ##isolado reduz a janela à metade; timeouts seguidos voltam ao slow start
+                self.rto.backoff()
+                if self.timeouts_seguidos > 1:
+                    self.cc.on_timeout(self.next_seq)
+                else:
+                    self.cc.on_loss(self.base, self.next_seq)
+                self._log(DEBUG, "timeout", "  [REMETENTE] Timeout para pacote %(seq)d (RTO %(rto).3fs, cwnd %(cwnd)d). **Voltando para** %(seq)d.",
+                          seq=self.base, rto=self.rto.rto, cwnd=self.cc.janela)
+                self.reenviar_de = self.base
+                self.prazo_gbn = agora + self.rto.rto
+            else:
+                for seq in expirados:
+                    self.cc.on_loss(seq, self.next_seq)
+                self._log(DEBUG, "timeout", "  [REMETENTE] Timeout para pacote(s) %(seqs)s (RTO %(rto).3fs, cwnd %(cwnd)d). **Reenviando**...",
+                          seqs=expirados, rto=self.rto.rto, cwnd=self.cc.janela)
+                for seq in expirados:
+                    p = self.pendentes[seq]
+                    if self.redundancia is not None and not p["reenviado"]:
+                        self.redundancia.sample(True)
+                    ##Retransmissões não esperam o pacer, mas consomem seus tokens
+                    self.pacer.consume(TAM_CABECALHO + len(p["dados"]))
+                    self._transmitir(seq, p, reenvio=True)
+                    p["reenviado"] += 1
+                    ##SR: cada pacote tem seu temporizador, então o backoff é por pacote
+                    p["prazo"] = agora + min(self.rto.rto * 2 ** p["reenviado"], self.rto.rto_max)
+                    self.retransmissoes += 1
+                    _RETRANSMISSOES.inc()
+            self._atualizar_pacer()
+        if self._grupo is not None and agora >= self._grupo["prazo"]:
+            self._fechar_grupo(agora) ## a janela não deixou o grupo encher antes de os primeiros blocos expirarem
+        self._preencher(agora)
+
+    def _tratar_sonda(self, tamanho, agora):
+        sonda = self._sonda
+        if tamanho not in sonda["candidatos"] or tamanho <= sonda["confirmado"]:
+            return ## resposta atrasada ou de um tamanho menor que o já confirmado
+        ##Regra de Karn: só a primeira rodada mede o RTT
+        if sonda["rodada"] == 0:
+            self.rto.sample(agora - sonda["enviado_em"])
+        sonda["confirmado"] = tamanho
+        if tamanho == sonda["candidatos"][-1]:
+            self._fim_sondagem(agora)
+
+    def on_packet(self, pkt, agora):
+        """Trata um pacote (já decodificado) vindo do receptor."""
+        if self.concluido:
+            return
+        if pkt.tipo == TIPO_ERRO:
+            self.erro = bytes(pkt.dados).decode(errors="replace")
+            self._log(WARNING, "recusa", "  [REMETENTE] Transferência recusada: %(erro)s", erro=self.erro)
+            self.falhou = True
+            self._liberar()
+            return
+        if self._sonda is not None:
+            if pkt.tipo == TIPO_SONDA_ACK:
+                self._tratar_sonda(pkt.seq, agora)
+            return
+        if pkt.tipo == TIPO_SYNACK:
+            if self.conectado or self._syn is None:
+                return ## SYNACK duplicado
+            ##Regra de Karn também vale para o SYN
+            if not self._syn["reenviado"]:
+                self.rto.sample(agora - self._syn["enviado_em"])
+                _RTT.record(agora - self._syn["enviado_em"])
+            self.rto.reset_backoff()
+            self.aceito = json.loads(bytes(pkt.dados)) if pkt.dados else {}
+            ##O receptor pode ter reduzido o bloco (buffer menor, ou o bloco de um upload a retomar)
+            self.bloco = min(int(self.aceito.get("bloco", self.bloco)), self.bloco)
+            self.pacer.rajada = RAJADA_PACOTES * (self.bloco + TAM_CABECALHO)
+            if self._mapa is None:
+                self._blocos = SlotRing(self.tamanho_janela, self.bloco)
+            self.conectado = True
+            self.timeouts_seguidos = 0
+            ##FEC só se o receptor aceitou; o grupo nunca passa da janela (os blocos ainda estão no anel)
+            self.fec = min(int(self.aceito.get("fec", 0)), int(self.metadados.get("fec", 0)), self.tamanho_janela)
+            if self.fec:
+                self.redundancia = RedundancyControl()
+                self._cabecalho_reparo = bytearray(TAM_CABECALHO)
+            if self.aceito.get("compressao") and self.metadados.get("compressao"):
+                self.compressor = BlockCompressor(int(self.metadados["compressao"]))
+            ##Retomada: o receptor já tem os blocos antes de `inicio`
+            self.inicio = int(self.aceito.get("inicio", 0))
+            if self.inicio:
+                self._log(INFO, "retomada", "  [REMETENTE] Receptor já tem %(inicio)d blocos. Retomando do bloco %(inicio)d.",
+                          inicio=self.inicio)
+                self.arquivo.seek(self._deslocamento)
+                if self.resumo is not None:
+                    ##O resumo precisa dos blocos que não serão enviados de novo
+                    self.resumo.update_from_file(self.arquivo, self.inicio * self.bloco)
+                self.arquivo.seek(self._deslocamento + self.inicio * self.bloco)
+                self.base = self.next_seq = self.reenviar_de = self.ultimo_ack = self.inicio
+            self.limite_receptor = self.inicio + pkt.janela
+            self._atualizar_pacer()
+            self._preencher(agora)
+            return
+        if pkt.tipo != TIPO_ACK or not self.conectado:
+            return
+
+        base = self.base
+        ack = unwrap_seq(pkt.ack, base)
+        seq_ack = unwrap_seq(pkt.seq, base)
+        self.timeouts_seguidos = 0
+
+        ##Controle de fluxo: o ACK mais recente diz até onde o receptor aceita
+        if ack >= self.ultimo_ack:
+            self.ultimo_ack = ack
+            self.limite_receptor = ack + pkt.janela
+
+        ##O RTT é medido pelo pacote que provocou este ACK.
+        ##Regra de Karn: só vale se ele não foi retransmitido.
+        ##Bloco reconstruído pelo FEC: o ACK só saiu quando o reparo chegou, não mede o RTT
+        recuperado = bool(pkt.flags & FLAG_FEC)
+        p = self.pendentes.get(seq_ack)
+        if p and not p["reenviado"] and not recuperado:
+            self.rto.sample(agora - p["enviado_em"])
+            _RTT.record(agora - p["enviado_em"])
+
+        ##ACK cumulativo: confirma tudo antes de `ack` (vale para os dois modos)
+        novos = 0
+        if ack > base:
+            for seq in range(base, ack):
+                novos += self._confirmar(seq, recuperado and seq == seq_ack)
+            self._log(DEBUG, "ack", "  [REMETENTE] ACK %(ack)d recebido. Pacotes até %(ultimo)d aceitos.", ack=ack, ultimo=ack - 1)
+            self.base = ack
+
+        ##ACK seletivo: confirma também o pacote indicado em seq
+        if self.modo == MODO_SR and pkt.flags & FLAG_SACK:
+            if self._confirmar(seq_ack, recuperado):
+                self._log(DEBUG, "sack", "  [REMETENTE] ACK seletivo %(seq)d recebido. Pacote aceito.", seq=seq_ack)
+                novos += 1
+
+        if not novos:
+            _ACKS_DUPLICADOS.inc()
+            self._log(DEBUG, "ack_duplicado", "  [REMETENTE] ACK duplicado (%(ack)d) recebido.", ack=ack)
+            ##A janela anunciada pode ter aberto
+            self._preencher(agora)
+            return
+
+        self.rto.reset_backoff()
+        self.cc.on_ack(novos)
+        _JANELA.record(self.cc.janela)
+        _EM_TRANSITO.record(len(self.pendentes))
+        self._atualizar_pacer()
+        self.base = min(self.pendentes) if self.pendentes else self.next_seq
+        self.reenviar_de = max(self.reenviar_de, self.base)
+        if self.modo == MODO_GBN:
+            self.prazo_gbn = agora + self.rto.rto if self.pendentes else None
+        self._preencher(agora)
+
+
+# --- Receptor ---
+class WindowReceiver:
+    """
+    Lado que recebe um arquivo, criado a partir do SYN do remetente (de quem
+    adota modo, janela, bloco e tamanho esperado). Responde com SYNACK,
+    confirma os dados e grava cada bloco na sua posição de `arquivo` (que
+    precisa aceitar seek). `capacidade()` diz quantos pacotes ainda cabem no
+    buffer de recepção; num servidor ela é dividida entre as sessões.
+    Com `progresso` (um TransferJournal), continua de onde um upload anterior
+    parou e mantém o diário atualizado. Com `resumo` (um StreamingDigest), os
+    blocos são somados ao resumo à medida que ficam contíguos; os que
+    chegaram fora de ordem são relidos do arquivo, que então também precisa
+    aceitar leitura. Se o SYN pede `fec` (modo SR), os reparos que chegam
+    reconstroem blocos perdidos; para isso, os blocos recentes ficam também
+    em memória, até ficarem mais de um grupo para trás. Payloads com
+    FLAG_ZLIB são descomprimidos antes de tudo (rdt/compress.py).
+    `gravado(posicao, dados)`, se dado, é chamado depois de cada bloco
+    gravado (ex.: a cache de blocos do servidor, rdt/cache.py).
+    """
+
+    def __init__(self, arquivo, enviar, syn, capacidade=None, rto=None, prob_perda=0.0,
+                 aceito=None, progresso=None, resumo=None, bloco_maximo=BLOCO_MAXIMO, gravado=None):
+        self.arquivo = arquivo
+        self.resumo = resumo
+        self.gravado = gravado
+        self.enviar = enviar
+        self.sessao = syn.sessao
+        self.metadados = json.loads(bytes(syn.dados)) if syn.dados else {}
+        self.tamanho_esperado = int(self.metadados.get("tamanho", 0))
+        ##O bloco proposto no SYN, limitado ao que este receptor aceita; vai de volta no SYNACK
+        self.bloco = min(int(self.metadados.get("bloco", BUFFER_SIZE)), bloco_maximo)
+        self.deslocamento = int(self.metadados.get("deslocamento", 0)) # onde o bloco 0 fica no arquivo
+        self.modo = self.metadados.get("modo", MODO_SR)
+        self.tamanho_janela = int(self.metadados.get("janela", TAMANHO_JANELA))
+        self.capacidade = capacidade or (lambda: self.tamanho_janela)
+        self.rto = rto if rto is not None else RttEstimator(TIMEOUT)
+        self.prob_perda = prob_perda
+        self.aceito = dict(aceito or {})
+        self.aceito.update(modo=self.modo, janela=self.tamanho_janela, bloco=self.bloco)
+        self.fec = 0
+        if self.modo == MODO_SR and self.metadados.get("fec"):
+            self.fec = self.aceito["fec"] = min(int(self.metadados["fec"]), GRUPO_MAXIMO, self.tamanho_janela)
+        self._copias = {} # FEC: seq -> cópia do bloco recebido, enquanto algum grupo pode precisar dele
+        self._reparos = {} # FEC: primeiro bloco do grupo -> {"n", "reparos": {j: dados}}, só de grupos incompletos
+        ##Compressão: o receptor só precisa aceitar; o nível fica guardado para o eco usar o mesmo
+        self.compressao = int(self.metadados.get("compressao") or 0)
+        if self.compressao:
+            self.aceito["compressao"] = self.compressao
+
+        self.progresso = progresso
+        self.expected = 0 # primeiro bloco que ainda falta (todos os anteriores estão no arquivo)
+        self.fora_de_ordem = set() # SR: blocos depois de `expected` já gravados no arquivo
+        self.total_recebido = 0 # bytes do arquivo já gravados, inclusive os de uma sessão anterior
+        self.pacotes_recebidos = 0
+        self._posicao = None # posição de escrita do arquivo, para só chamar seek quando preciso
+        self._ack = bytearray(TAM_CABECALHO) # todo ACK é escrito neste mesmo buffer
+        if progresso is not None and progresso.retomado:
+            self.expected = progresso.contiguos
+            self.fora_de_ordem = set(progresso.extras)
+            self.total_recebido = (min(self.expected * self.bloco, self.tamanho_esperado)
+                                   + sum(self._tamanho_bloco(seq) for seq in self.fora_de_ordem))
+        if resumo is not None and self.expected:
+            ##O resumo é só do que chegou nesta sessão: soma o que já estava no arquivo
+            arquivo.seek(self.deslocamento)
+            resumo.update_from_file(arquivo, min(self.expected * self.bloco, self.tamanho_esperado))
+        self.aceito["inicio"] = self.expected
+        self.fin = False
+        self.encerrado = False # completo e FIN recebido (ou remetente em silêncio)
+        self._ultimo = None # instante do último pacote, para a espera final
+
+    def _log(self, nivel, evento, mensagem, **campos):
+        log_event(log, nivel, evento, mensagem, sessao=self.sessao, **campos)
+
+    @property
+    def completo(self):
+        return self.total_recebido >= self.tamanho_esperado
+
+    @property
+    def prazo(self):
+        ##O último ACK pode ter se perdido: continua confirmando retransmissões
+        ##até o remetente avisar com FIN (ou ficar em silêncio por 2 RTOs, no mínimo TIMEOUT)
+        if self.encerrado or not self.completo or self._ultimo is None:
+            return None
+        return self._ultimo + max(2 * self.rto.rto, TIMEOUT)
+
+    def start(self, agora):
+        """Aceita a transferência respondendo o SYN."""
+        self._ultimo = agora
+        self._enviar_synack()
+        self._verificar()
+
+    def _enviar_synack(self):
+        self.enviar(make_pkt(TIPO_SYNACK, janela=self._janela_livre(),
+                             dados=json.dumps(self.aceito).encode(), sessao=self.sessao))
+
+    def _janela_livre(self):
+        ##A janela anunciada nunca passa do que cabe no buffer do socket
+        return max(min(self.tamanho_janela, self.capacidade()) - len(self.fora_de_ordem), 0)
+
+    def _tamanho_bloco(self, seq):
+        return max(min(self.bloco, self.tamanho_esperado - seq * self.bloco), 0)
+
+    def _gravar(self, seq, dados):
+        ##Cada bloco vai direto para a sua posição; em ordem, não precisa de seek
+        posicao = self.deslocamento + seq * self.bloco
+        if posicao != self._posicao:
+            self.arquivo.seek(posicao)
+        self.arquivo.write(dados)
+        if self.gravado is not None:
+            self.gravado(posicao, dados)
+        self._posicao = posicao + len(dados)
+        self.total_recebido += len(dados)
+        self.pacotes_recebidos += 1
+
+    def _resumir(self, seq, dados=None):
+        ##Soma ao resumo o bloco que acabou de ficar contíguo; sem `dados`, relê do arquivo
+        if self.resumo is None:
+            return
+        if dados is not None:
+            self.resumo.update(dados)
+            return
+        self.arquivo.seek(self.deslocamento + seq * self.bloco)
+        self._posicao = None
+        self.resumo.update_from_file(self.arquivo, self._tamanho_bloco(seq))
+
+    def _avancar(self):
+        while self.expected in self.fora_de_ordem:
+            self.fora_de_ordem.discard(self.expected)
+            self._resumir(self.expected)
+            self.expected += 1
+        if self.progresso is not None:
+            self.progresso.atualizar(self.expected, self.fora_de_ordem, self.arquivo)
+
+    def _enviar_ack(self, seq, seletivo=False, duplicado=False, recuperado=False):
+        confirmado = seq if seletivo else self.expected - 1
+        if simulate_loss(self.prob_perda):
+            self._log(DEBUG, "perda_simulada", "  [SIMULAÇÃO] ACK %(ack)d PERDIDO no envio.", ack=confirmado)
+        else:
+            self.enviar(make_ack(self.expected, seq, self._janela_livre(), seletivo, self.sessao, self._ack, recuperado))
+            if duplicado:
+                self._log(DEBUG, "reenvio_ack", "  [RECEPTOR] Reenviado ACK **%(ack)d**.", ack=confirmado)
+            else:
+                self._log(DEBUG, "envio_ack", "  [RECEPTOR] Enviado ACK **%(ack)d**.", ack=confirmado)
+
+    def _tratar(self, seq, dados, simbolo=None):
+        ##`simbolo`: o que o FEC guarda deste bloco, se não forem os próprios dados
+        _PACOTES_RECEBIDOS.inc()
+        if self.modo == MODO_GBN:
+            if seq == self.expected:
+                self._log(DEBUG, "recebido", "  [RECEPTOR] Recebido pacote **%(seq)d** (esperado).", seq=seq)
+                self._gravar(seq, dados)
+                self._resumir(seq, dados)
+                self.expected += 1
+                self._avancar()
+                self._enviar_ack(seq)
+            else:
+                if seq > self.expected:
+                    _FORA_DE_ORDEM.inc()
+                self._log(DEBUG, "rejeitado", "  [RECEPTOR] Recebido pacote %(seq)d (duplicado/fora de ordem). Rejeitado.", seq=seq)
+                if self.expected > 0:
+                    self._enviar_ack(seq, duplicado=True)
+        else:
+            if self.expected <= seq < self.expected + self.tamanho_janela:
+                novo = seq == self.expected or seq not in self.fora_de_ordem
+                if seq == self.expected:
+                    self._log(DEBUG, "recebido", "  [RECEPTOR] Recebido pacote **%(seq)d** (esperado).", seq=seq)
+                    self._gravar(seq, dados)
+                    self._resumir(seq, dados)
+                    self.expected += 1
+                    self._avancar()
+                elif novo:
+                    self._log(DEBUG, "fora_de_ordem", "  [RECEPTOR] Recebido pacote %(seq)d fora de ordem. Guardado.", seq=seq)
+                    self._gravar(seq, dados)
+                    self.fora_de_ordem.add(seq)
+                    _FORA_DE_ORDEM.inc()
+                    _FILA.record(len(self.fora_de_ordem))
+                    self._avancar()
+                if novo and self.fec:
+                    ##O buffer de recepção é reaproveitado no próximo pacote: guarda uma cópia
+                    self._copias[seq] = simbolo if simbolo is not None else bytes(dados)
+                self._enviar_ack(seq, seletivo=True)
+                if novo and self.fec:
+                    self._recuperar(seq)
+            elif self.expected - self.tamanho_janela <= seq < self.expected:
+                ##Já entregue: o ACK deve ter se perdido, confirma de novo
+                self._log(DEBUG, "duplicado", "  [RECEPTOR] Recebido pacote %(seq)d (duplicado). Rejeitado.", seq=seq)
+                self._enviar_ack(seq, seletivo=True, duplicado=True)
+
+    def _faltando(self, base, n):
+        return [seq for seq in range(max(base, self.expected), base + n) if seq not in self.fora_de_ordem]
+
+    def _tratar_reparo(self, base, j, n, dados):
+        if not 0 < n <= self.fec or base + n <= self.expected or self._tamanho_bloco(base + n - 1) <= 0:
+            return ## grupo inválido ou já entregue inteiro
+        grupo = self._reparos.get(base)
+        if grupo is None:
+            if not self._faltando(base, n):
+                return
+            grupo = self._reparos[base] = {"n": n, "reparos": {}}
+        grupo["reparos"].setdefault(j, bytes(dados))
+        self._reconstruir(base)
+
+    def _recuperar(self, seq):
+        ##Um bloco novo pode completar um grupo cujos reparos chegaram antes dele
+        for base in [b for b, grupo in self._reparos.items() if b <= seq < b + grupo["n"]]:
+            self._reconstruir(base)
+        ##Blocos mais de um grupo atrás do primeiro que falta não entram em nenhum grupo incompleto
+        limite = self.expected - self.fec
+        while self._copias:
+            antigo = next(iter(self._copias))
+            if antigo >= limite:
+                break
+            del self._copias[antigo]
+        for base in [b for b, grupo in self._reparos.items() if b + grupo["n"] <= self.expected]:
+            del self._reparos[base]
+
+    def _reconstruir(self, base):
+        grupo = self._reparos[base]
+        n = grupo["n"]
+        faltando = self._faltando(base, n)
+        if not faltando:
+            del self._reparos[base]
+            return
+        if len(faltando) > len(grupo["reparos"]):
+            return ## ainda faltam reparos (ou os blocos chegam depois)
+        presentes = {seq - base: self._copias.get(seq) for seq in range(base, base + n) if seq not in faltando}
+        if None in presentes.values():
+            return ## bloco gravado numa sessão anterior (retomada): fica para a retransmissão
+        del self._reparos[base]
+        simbolos = decode(presentes, grupo["reparos"], [seq - base for seq in faltando])
+        blocos = {}
+        for seq in faltando:
+            blocos[seq] = self._abrir_simbolo(seq, simbolos[seq - base])
+            if blocos[seq] is None:
+                return ## reparo inconsistente com os blocos: fica para a retransmissão
+        for seq in faltando:
+            dados = blocos[seq]
+            self._log(DEBUG, "recuperado", "  [RECEPTOR] Pacote %(seq)d reconstruído pelo FEC.", seq=seq)
+            self._gravar(seq, dados)
+            if seq == self.expected:
+                self._resumir(seq, dados)
+                self.expected += 1
+            else:
+                self.fora_de_ordem.add(seq)
+            self._copias[seq] = simbolos[seq - base]
+            _RECUPERADOS.inc()
+        self._avancar()
+        for seq in faltando:
+            self._enviar_ack(seq, seletivo=True, recuperado=True)
+
+    def _abrir_simbolo(self, seq, simbolo):
+        ##Bloco `seq` a partir do que o FEC reconstruiu (completado com zeros até o maior do grupo)
+        tamanho = self._tamanho_bloco(seq)
+        if not self.compressao:
+            return simbolo[:tamanho]
+        flags, comprimento = _SIMBOLO.unpack_from(simbolo)
+        dados = simbolo[_SIMBOLO.size:_SIMBOLO.size + comprimento]
+        if flags & FLAG_ZLIB:
+            dados = decompress(dados, self.bloco)
+        return dados if dados is not None and len(dados) == tamanho else None
+
+    def _verificar(self):
+        if self.completo and self.fin:
+            self.encerrado = True
+
+    def on_packet(self, pkt, agora):
+        """Trata um pacote (já decodificado) vindo do remetente."""
+        self._ultimo = agora
+        if pkt.tipo == TIPO_SYN:
+            self._enviar_synack() ## o SYNACK se perdeu
+        elif pkt.tipo == TIPO_SONDA:
+            self.enviar(make_probe_ack(pkt)) ## sonda atrasada ou repetida
+        elif pkt.tipo == TIPO_DADOS:
+            dados = pkt.dados
+            if pkt.flags & FLAG_ZLIB:
+                dados = decompress(dados, self.bloco)
+                if dados is None:
+                    return ## não descomprime ou passa do bloco: tratado como corrompido
+            simbolo = None
+            if self.fec and self.compressao:
+                simbolo = _SIMBOLO.pack(pkt.flags & FLAG_ZLIB, len(pkt.dados)) + pkt.dados
+            self._tratar(unwrap_seq(pkt.seq, self.expected), dados, simbolo)
+        elif pkt.tipo == TIPO_REPARO and self.fec:
+            self._tratar_reparo(unwrap_seq(pkt.seq, self.expected), pkt.ack, pkt.janela, pkt.dados)
+        elif pkt.tipo == TIPO_FIN:
+            self.fin = True
+        self._verificar()
+
+    def on_timer(self, agora):
+        """Encerra a espera final se o remetente ficou em silêncio."""
+        prazo = self.prazo
+        if prazo is not None and agora >= prazo:
+            self.encerrado = True
+
+
+# --- Uso com socket bloqueante ---
+def _esperar(sock, prazo, buffer):
+    """
+    recvfrom_into com timeout até `prazo`.
+    Retorna (pacote, endereco), com o pacote já decodificado (ou None se estiver
+    corrompido), ou (None, None) se o prazo vencer.
+    """
+    sock.settimeout(None if prazo is None else max(prazo - time.monotonic(), 0.0001))
+    try:
+        tamanho, endereco = sock.recvfrom_into(buffer)
+    except socket.timeout:
+        return None, None
+    return parse_pkt(buffer, tamanho), endereco
+
+def send_window(sock, destino, arquivo, metadados=None, sessao=0, modo=MODO_SR,
+                tamanho_janela=TAMANHO_JANELA, rto=None, prob_perda=0.0, resumo=None, bloco=BUFFER_SIZE, fec=0,
+                compressao=0, sondar=None, cc=None):
+    """
+    Envia o conteúdo de `arquivo` para `destino` usando janela deslizante,
+    abrindo a sessão `sessao` com um SYN que leva `metadados`. Com `resumo`
+    (rdt/verify.py), o hash do que foi enviado é calculado durante o envio.
+    Com `bloco` maior que BLOCO_BASE, o caminho é sondado antes do SYN
+    (rdt/pmtu.py) e o bloco usado é o maior que passa, até `bloco`; com
+    `sondar` False, `bloco` é proposto direto (já foi sondado antes).
+    Com `fec` (SR), grupos de até `fec` blocos levam reparos (rdt/fec.py).
+    Com `compressao` (nível do zlib), os blocos que comprimem vão comprimidos.
+    `cc` é o controle de congestionamento de um envio anterior (WindowSender).
+    Retorna (pacotes_enviados, total_enviado, retransmissoes).
+    Levanta ConnectionRefusedError se o receptor recusar a transferência.
+    """
+    if sondar is None:
+        sondar = bloco > BLOCO_BASE
+    remetente = WindowSender(arquivo, lambda *partes: send_parts(sock, partes, destino), metadados,
+                             sessao, modo, tamanho_janela, rto, prob_perda, resumo=resumo,
+                             bloco=bloco, sondar=sondar, fec=fec, compressao=compressao, cc=cc)
+    return run_sender(sock, remetente)
+
+def run_sender(sock, remetente):
+    """
+    Conduz o WindowSender `remetente` até o fim, com o socket bloqueante
+    `sock`. Retorna (pacotes_enviados, total_enviado, retransmissoes).
+    Levanta ConnectionRefusedError se o receptor recusar a transferência.
+    """
+    if remetente._sonda is not None:
+        set_dont_fragment(sock) ## sonda grande demais se perde em vez de chegar fragmentada
+    buffer = bytearray(BUFFER_SIZE + TAM_CABECALHO) ## só chegam ACKs, SYNACK e ERRO: pacotes pequenos
+    timeout_original = sock.gettimeout()
+    try:
+        remetente.start(time.monotonic())
+        while not remetente.concluido:
+            pkt, endereco = _esperar(sock, remetente.prazo, buffer)
+            if endereco is None:
+                remetente.on_timer(time.monotonic())
+                continue
+            if pkt is None or pkt.sessao != remetente.sessao:
+                continue ## corrompido ou de outra sessão: tratado como perdido
+            remetente.on_packet(pkt, time.monotonic())
+    finally:
+        sock.settimeout(timeout_original)
+
+    if remetente.erro is not None:
+        raise ConnectionRefusedError(remetente.erro)
+    return remetente.resultado
+
+def recv_window(sock, arquivo, sessao=None, rto=None, prob_perda=0.0, bloco_maximo=BLOCO_MAXIMO, resumo=None):
+    """
+    Espera o SYN da sessão `sessao` (ou de qualquer sessão, se None), recebe
+    o arquivo anunciado com janela deslizante e grava em `arquivo`. Sondas de
+    tamanho de até `bloco_maximo` bytes que chegarem antes do SYN são
+    respondidas. Com `resumo` (um StreamingDigest), o que chega é somado a
+    ele; os blocos fora de ordem são relidos de `arquivo`. Retorna (total_recebido, pacotes_recebidos,
+    endereco_remetente, metadados).
+    """
+    buffer = bytearray(bloco_maximo + TAM_CABECALHO) ## cabe a maior sonda que o remetente pode mandar
+    timeout_original = sock.gettimeout()
+    try:
+        while True:
+            pkt, endereco = _esperar(sock, None, buffer)
+            if pkt is None or sessao not in (None, pkt.sessao):
+                continue ## ACKs atrasados de outra transferência são descartados aqui
+            if pkt.tipo == TIPO_SONDA:
+                send_parts(sock, [make_probe_ack(pkt)], endereco)
+            elif pkt.tipo == TIPO_SYN:
+                break
+
+        receptor = WindowReceiver(arquivo, lambda *partes: send_parts(sock, partes, endereco), pkt,
+                                  None, rto, prob_perda, resumo=resumo, bloco_maximo=bloco_maximo)
+        capacidade = socket_capacity(sock, receptor.bloco)
+        receptor.capacidade = lambda: capacidade
+        ##Do tamanho do bloco combinado; com FEC e compressão, cada reparo leva também o _SIMBOLO
+        buffer = bytearray(receptor.bloco + (_SIMBOLO.size if receptor.fec and receptor.compressao else 0) + TAM_CABECALHO)
+        receptor.start(time.monotonic())
+        while not receptor.encerrado:
+            pkt, endereco_pkt = _esperar(sock, receptor.prazo, buffer)
+            if endereco_pkt is None:
+                receptor.on_timer(time.monotonic())
+                continue
+            if pkt is None or endereco_pkt != endereco or pkt.sessao != receptor.sessao:
+                continue
+            receptor.on_packet(pkt, time.monotonic())
+    finally:
+        sock.settimeout(timeout_original)
+
+    return receptor.total_recebido, receptor.pacotes_recebidos, endereco, receptor.metadados
@@ -0,0 +1,121 @@
+"""
+Lotes de arquivos (rdt/batch.py): unpack separa exatamente o que o
+BatchReader juntou, com os mesmos nomes, conteúdos e hashes.
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from rdt import batch
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+        self.origem = os.path.join(self.pasta, "fotos")
+        gerador = random.Random(4)
+        self.conteudos = {
+            "fotos/a.txt": b"primeiro",
+            "fotos/vazio": b"",
+            "fotos/sub/b.bin": gerador.randbytes(5000),
+            "fotos/sub/c.bin": gerador.randbytes(1),
+            "fotos/z/fundo/d.bin": gerador.randbytes(70000),
+        }
+        for nome, conteudo in self.conteudos.items():
+            caminho = os.path.join(self.pasta, *nome.split("/"))
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, "wb") as arquivo:
+                arquivo.write(conteudo)
+
+    def _juntar(self, leitor, pedaco):
+        ##Lê o fluxo do lote em pedaços de `pedaco` bytes e grava num arquivo, como o servidor
+        caminho = os.path.join(self.pasta, f"lote_{pedaco}")
+        with open(caminho, "wb") as saida:
+            while dados := leitor.read(pedaco):
+                saida.write(dados)
+        return caminho
+
+    def test_list_files(self):
+        ##Em cada pasta, os arquivos (em ordem) antes das subpastas
+        nomes = [nome for _, nome in batch.list_files(self.origem)]
+        self.assertEqual(nomes, ["fotos/a.txt", "fotos/vazio", "fotos/sub/b.bin", "fotos/sub/c.bin", "fotos/z/fundo/d.bin"])
+        caminhos = [os.path.join(self.origem, "a.txt"), os.path.join(self.origem, "sub", "b.bin")]
+        self.assertEqual(batch.list_files(caminhos), [(caminhos[0], "a.txt"), (caminhos[1], "b.bin")])
+        with self.assertRaises(ValueError):
+            batch.list_files(caminhos + caminhos[:1])
+
+    def test_unpack_inverte_o_lote(self):
+        arquivos = batch.list_files(self.origem)
+        for pedaco in (1, 7, 1500, 1 << 20):
+            with self.subTest(pedaco=pedaco), batch.BatchReader(arquivos) as leitor:
+                lote = self._juntar(leitor, pedaco)
+                self.assertEqual(os.path.getsize(lote), leitor.tamanho)
+                raiz = os.path.join(self.pasta, f"saida_{pedaco}")
+                resultados = batch.unpack(lote, raiz, batch.PREFIXO_RECEBIDO, batch.ALGORITMO)
+                self.assertEqual([r["nome"] for r in resultados], [nome for _, nome in arquivos])
+                for resultado, resumo in zip(resultados, leitor.resumos):
+                    conteudo = self.conteudos[resultado["nome"]]
+                    self.assertNotIn("erro", resultado)
+                    self.assertEqual(resultado["tamanho"], len(conteudo))
+                    self.assertEqual(resultado["caminho"], batch.destination(raiz, resultado["nome"], batch.PREFIXO_RECEBIDO))
+                    with open(resultado["caminho"], "rb") as arquivo:
+                        self.assertEqual(arquivo.read(), conteudo)
+                    esperado = hashlib.new(batch.ALGORITMO, conteudo).hexdigest()
+                    self.assertEqual(resultado["resumo"], esperado)
+                    self.assertEqual(resumo.hexdigest(), esperado)
+                self.assertEqual(leitor.mudaram, set())
+
+    def test_releitura_nao_muda_os_hashes(self):
+        ##Retransmissões leem de novo trechos já lidos; cada arquivo entra no hash uma vez só
+        arquivos = batch.list_files(self.origem)
+        with batch.BatchReader(arquivos) as leitor:
+            inicio = leitor.read(3000)
+            leitor.seek(100)
+            self.assertEqual(leitor.read(2900), inicio[100:])
+            leitor.seek(0)
+            with open(self._juntar(leitor, 4096), "rb") as lote:
+                self.assertEqual(lote.read(3000), inicio)
+            for (_, nome), resumo in zip(arquivos, leitor.resumos):
+                self.assertEqual(resumo.hexdigest(), hashlib.new(batch.ALGORITMO, self.conteudos[nome]).hexdigest())
+
+    def test_erros_do_manifesto_e_lote_cortado(self):
+        arquivos = batch.list_files(self.origem)
+        with batch.BatchReader(arquivos, erros=[("fotos/sumiu", "sem permissão")]) as leitor:
+            fluxo = leitor.read(leitor.tamanho)
+        lote = os.path.join(self.pasta, "cortado")
+        with open(lote, "wb") as saida:
+            saida.write(fluxo[:-10]) ## o último arquivo não chega inteiro
+        resultados = {r["nome"]: r for r in batch.unpack(lote, os.path.join(self.pasta, "saida"), batch.PREFIXO_RECEBIDO)}
+        self.assertEqual(resultados["fotos/sumiu"]["erro"], "sem permissão")
+        self.assertEqual(resultados["fotos/z/fundo/d.bin"]["erro"], "lote terminou antes do arquivo")
+        self.assertNotIn("erro", resultados["fotos/a.txt"])
+
+    def test_manifesto_invalido(self):
+        for nome, fluxo in (("sem linha", b"{}"), ("não é json", b"x\n"), ("sem arquivos", b"{}\n")):
+            lote = os.path.join(self.pasta, "invalido")
+            with open(lote, "wb") as saida:
+                saida.write(fluxo)
+            with self.subTest(nome), self.assertRaises(ValueError):
+                batch.unpack(lote, self.pasta, batch.PREFIXO_RECEBIDO)
+
+    def test_nome_fora_da_raiz(self):
+        ##Um manifesto do cliente não escreve fora da pasta do servidor
+        for nome in ("../fora", "/etc/x", "a//b", "a/./b", ""):
+            with self.subTest(nome=nome):
+                self.assertIsNone(batch.destination(self.pasta, nome, batch.PREFIXO_RECEBIDO))
+        lote = os.path.join(self.pasta, "malicioso")
+        with open(lote, "wb") as saida:
+            saida.write(json.dumps({"arquivos": [{"nome": "../fora", "tamanho": 2}]}).encode() + b"\nok")
+        resultado, = batch.unpack(lote, os.path.join(self.pasta, "saida"), batch.PREFIXO_RECEBIDO)
+        self.assertEqual(resultado["erro"], "nome inválido")
+        self.assertFalse(os.path.exists(os.path.join(self.pasta, "fora")))
+
+
+if __name__ == "__main__":
+    unittest.main()
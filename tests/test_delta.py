@@ -0,0 +1,103 @@
+"""
+Instruções de delta (rdt/delta.py): montadas a partir das assinaturas do
+arquivo antigo, reconstroem o arquivo novo depois de inserções e remoções.
+"""
+import hashlib
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from rdt import delta
+
+BLOCO = delta.BLOCO_MINIMO
+TAMANHO = 64 * BLOCO + 300
+
+
+class DeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.caminho = os.path.join(pasta.name, "antigo.bin")
+        self.antigo = random.Random(1).randbytes(TAMANHO)
+        with open(self.caminho, "wb") as arquivo:
+            arquivo.write(self.antigo)
+
+    def _montar(self, novo):
+        """Delta de `novo` contra o arquivo antigo; retorna (montado, copiados, tamanho das instruções)."""
+        assinaturas = delta.parse_signatures(delta.signatures(self.caminho, BLOCO))
+        instrucoes = io.BytesIO()
+        copiados = delta.make_delta(novo, assinaturas, instrucoes)
+        tamanho_delta = instrucoes.tell()
+        instrucoes.seek(0)
+        saida = io.BytesIO()
+        resumo = hashlib.sha256()
+        with open(self.caminho, "rb") as base:
+            total = delta.apply_delta(base, instrucoes, saida, resumo=resumo)
+        self.assertEqual(total, len(novo))
+        self.assertEqual(resumo.digest(), hashlib.sha256(novo).digest())
+        return saida.getvalue(), copiados, tamanho_delta
+
+    def test_assinaturas(self):
+        assinaturas = delta.parse_signatures(delta.signatures(self.caminho, BLOCO))
+        self.assertEqual(assinaturas["bloco"], BLOCO)
+        self.assertEqual(assinaturas["base"], delta.base_id(self.caminho))
+        self.assertEqual(len(assinaturas["blocos"]), TAMANHO // BLOCO) ## só os blocos completos
+        ausente = delta.parse_signatures(delta.signatures(self.caminho + ".nao", BLOCO))
+        self.assertEqual((ausente["base"], ausente["blocos"]), (None, []))
+
+    def test_reconstroi_depois_de_edicoes(self):
+        a = self.antigo
+        extra = random.Random(2).randbytes(3 * BLOCO + 17)
+        casos = {
+            "igual": a,
+            "insercao no meio": a[:10 * BLOCO + 5] + extra + a[10 * BLOCO + 5:],
+            "remocao no meio": a[:20 * BLOCO + 3] + a[25 * BLOCO + 700:],
+            "insercao e remocao": extra[:40] + a[:5 * BLOCO] + a[9 * BLOCO + 1:40 * BLOCO] + extra + a[40 * BLOCO:],
+            "blocos trocados": a[30 * BLOCO:] + a[:30 * BLOCO],
+            "no fim": a + extra,
+            "cortado": a[:TAMANHO // 2 + 11],
+            "vazio": b"",
+        }
+        for nome, novo in casos.items():
+            with self.subTest(nome):
+                montado, copiados, tamanho_delta = self._montar(novo)
+                self.assertEqual(montado, novo)
+                if len(novo) > TAMANHO // 2:
+                    ##Uma edição local só manda de literal a região editada
+                    self.assertGreater(copiados, len(novo) - 8 * BLOCO)
+                    self.assertLess(tamanho_delta, len(novo) - copiados + 8 * BLOCO)
+
+    def test_arquivo_todo_diferente(self):
+        novo = random.Random(3).randbytes(TAMANHO)
+        montado, copiados, _ = self._montar(novo)
+        self.assertEqual(montado, novo)
+        self.assertEqual(copiados, 0)
+
+    def test_aceita_memoryview(self):
+        novo = self.antigo[BLOCO // 2:]
+        montado, _, _ = self._montar(memoryview(novo))
+        self.assertEqual(montado, novo)
+
+    def test_instrucoes_invalidas(self):
+        casos = {
+            "cópia além do fim": delta._INSTRUCAO.pack(delta.COPIA, TAMANHO - 10, 11),
+            "tipo desconhecido": delta._INSTRUCAO.pack(7, 0, 1),
+            "literal incompleto": delta._INSTRUCAO.pack(delta.LITERAL, 0, 10) + b"abc",
+            "instrução incompleta": delta._INSTRUCAO.pack(delta.COPIA, 0, 1)[:-1],
+        }
+        for nome, instrucoes in casos.items():
+            with self.subTest(nome), open(self.caminho, "rb") as base:
+                with self.assertRaises(ValueError):
+                    delta.apply_delta(base, io.BytesIO(instrucoes), io.BytesIO())
+
+    def test_block_size(self):
+        self.assertEqual(delta.block_size(0), delta.BLOCO_MINIMO)
+        self.assertEqual(delta.block_size(100 * 1024 ** 2), 10 * 1024)
+        self.assertEqual(delta.block_size(1024 ** 4), delta.BLOCO_MAXIMO)
+
+
+if __name__ == "__main__":
+    unittest.main()
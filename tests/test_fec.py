@@ -0,0 +1,80 @@
+"""
+Código de apagamento do FEC (rdt/fec.py): com quaisquer K dos K + M
+símbolos de um grupo, decode devolve os blocos que faltam.
+"""
+import itertools
+import random
+import unittest
+
+from rdt import fec
+
+
+class FecTest(unittest.TestCase):
+
+    def _grupo(self, k, tamanho=300):
+        gerador = random.Random(k)
+        ##Blocos de tamanhos diferentes: o último costuma ser menor
+        return [gerador.randbytes(tamanho - 7 * i) for i in range(k)]
+
+    def test_qualquer_k_de_k_mais_m(self):
+        for k, m in ((1, 1), (4, 2), (5, 3)):
+            blocos = self._grupo(k)
+            reparos = fec.encode(blocos, m)
+            tamanho = max(len(bloco) for bloco in blocos)
+            self.assertEqual([len(r) for r in reparos], [tamanho] * m)
+            simbolos = list(range(k + m)) ## 0..k-1 são blocos, k.. são reparos
+            for recebidos in itertools.combinations(simbolos, k):
+                faltando = [i for i in range(k) if i not in recebidos]
+                if not faltando:
+                    continue
+                with self.subTest(k=k, m=m, recebidos=recebidos):
+                    presentes = {i: blocos[i] for i in recebidos if i < k}
+                    disponiveis = {s - k: reparos[s - k] for s in recebidos if s >= k}
+                    recuperados = fec.decode(presentes, disponiveis, faltando)
+                    self.assertEqual(sorted(recuperados), faltando)
+                    for i in faltando:
+                        ##O bloco volta completado com zeros até o tamanho do reparo
+                        self.assertEqual(recuperados[i], blocos[i].ljust(tamanho, b"\0"))
+
+    def test_reparo_zero_e_o_xor(self):
+        blocos = self._grupo(6)
+        tamanho = max(len(bloco) for bloco in blocos)
+        xor = 0
+        for bloco in blocos:
+            xor ^= int.from_bytes(bloco, "little")
+        self.assertEqual(fec.encode(blocos, 1), [xor.to_bytes(tamanho, "little")])
+        self.assertEqual({fec.coefficient(0, i) for i in range(fec.GRUPO_MAXIMO)}, {1})
+
+    def test_aceita_memoryview(self):
+        blocos = self._grupo(3)
+        reparos = fec.encode([memoryview(b) for b in blocos], 2)
+        self.assertEqual(reparos, fec.encode(blocos, 2))
+        recuperados = fec.decode({1: memoryview(blocos[1])}, {0: reparos[0], 1: reparos[1]}, [0, 2])
+        self.assertEqual(recuperados[0], blocos[0])
+
+
+class RedundancyControlTest(unittest.TestCase):
+
+    def test_sem_perda_nao_ha_reparo(self):
+        self.assertEqual(fec.RedundancyControl(perda=0.0).repairs(fec.GRUPO), 0)
+
+    def test_reparos_crescem_com_a_perda(self):
+        anterior = 0
+        for perda in (0.01, 0.05, 0.1, 0.2):
+            m = fec.RedundancyControl(perda=perda).repairs(fec.GRUPO)
+            self.assertGreaterEqual(m, anterior)
+            anterior = m
+        self.assertGreater(anterior, 0)
+        self.assertEqual(fec.RedundancyControl(perda=0.9).repairs(fec.GRUPO), fec.REPAROS_MAXIMO)
+
+    def test_media_movel(self):
+        controle = fec.RedundancyControl(perda=0.0)
+        controle.sample(True)
+        self.assertAlmostEqual(controle.perda, fec.PESO)
+        for _ in range(2000):
+            controle.sample(False)
+        self.assertLess(controle.perda, 1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
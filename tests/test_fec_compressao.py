@@ -0,0 +1,70 @@
+"""
+FEC com compressão ligada: com os dois, cada reparo leva também as flags e o
+tamanho do payload (_SIMBOLO), e o receptor precisa recebê-lo inteiro.
+"""
+import filecmp
+import io
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import unittest
+
+from rdt.packet import parse_pkt
+from rdt.window import _RECUPERADOS, _SIMBOLO, WindowSender, recv_window, send_window
+
+PROB_PERDA = 0.1
+BLOCO = 8000
+TAMANHO_ARQUIVO = 400 * 1024
+
+
+class FecCompressaoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+
+    def test_recv_window_recupera_com_compressao(self):
+        origem = os.path.join(self.pasta.name, "aleatorio.bin")
+        destino = os.path.join(self.pasta.name, "recebido.bin")
+        with open(origem, "wb") as arquivo:
+            arquivo.write(os.urandom(TAMANHO_ARQUIVO)) ## não comprime: cada bloco vai com FLAG_ZLIB desligada
+        receptor = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        remetente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(receptor.close)
+        self.addCleanup(remetente.close)
+        receptor.bind(("127.0.0.1", 0))
+
+        def enviar():
+            with open(origem, "rb") as arquivo:
+                send_window(remetente, receptor.getsockname(), arquivo, {"nome": "aleatorio.bin",
+                            "tamanho": TAMANHO_ARQUIVO}, sessao=15, prob_perda=PROB_PERDA, bloco=BLOCO,
+                            fec=8, compressao=6)
+
+        random.seed(15) ## só o remetente sorteia perdas
+        recuperados = _RECUPERADOS.valor
+        thread = threading.Thread(target=enviar, daemon=True)
+        thread.start()
+        with open(destino, "wb") as arquivo:
+            recebido, _, _, metadados = recv_window(receptor, arquivo, 15)
+        thread.join(10)
+        self.assertEqual(metadados["bloco"], BLOCO - _SIMBOLO.size)
+        self.assertEqual(recebido, TAMANHO_ARQUIVO)
+        self.assertTrue(filecmp.cmp(origem, destino, shallow=False))
+        self.assertGreater(_RECUPERADOS.valor, recuperados)
+
+    def test_bloco_combinado_nao_diminui(self):
+        ##O eco do servidor propõe o bloco que o cliente já diminuiu: os reparos dos dois lados têm o mesmo tamanho
+        for combinado, esperado in ((False, BLOCO - _SIMBOLO.size), (True, BLOCO)):
+            enviados = []
+            remetente = WindowSender(io.BytesIO(b"x" * BLOCO), lambda *partes: enviados.append(b"".join(partes)),
+                                     {"tamanho": BLOCO}, bloco=BLOCO, fec=8, compressao=6, combinado=combinado)
+            remetente.start(0.0)
+            syn = parse_pkt(bytearray(enviados[0]), len(enviados[0]))
+            self.assertEqual(json.loads(bytes(syn.dados))["bloco"], esperado)
+
+
+if __name__ == "__main__":
+    unittest.main()
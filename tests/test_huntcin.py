@@ -0,0 +1,260 @@
+"""
+Servidor HuntCin desistindo de um cliente (on_timeout) quando o cliente
+recebeu os dados e só os ACKs se perderam, ou com uma mensagem pela metade:
+a próxima mensagem precisa chegar ao cliente, e não ser tomada por duplicata.
+Depois de desistências seguidas (ou muito tempo sem pacotes), o jogador sai
+do jogo e o endereço é esquecido.
+"""
+import importlib.util
+import os
+import random
+import time
+import unittest
+
+from rdt.packet import FLAG_REINICIO, TIPO_ACK, TIPO_DADOS, parse_pkt
+
+PASTA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "HuntCin")
+
+
+def _carregar(nome, arquivo):
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(PASTA, arquivo))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+servidor = _carregar("huntcin_server", "server.py")
+cliente = _carregar("huntcin_client", "client.py")
+
+
+def setUpModule():
+    ##Porta livre qualquer, no lugar da porta fixa do jogo
+    servidor.open_socket("127.0.0.1", 0)
+    cliente.SERVER_PORT = servidor.server.getsockname()[1]
+
+def tearDownModule():
+    servidor.server.close()
+    cliente.client.close()
+
+
+class ReinicioTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.addr = cliente.client.getsockname()
+        servidor.clients.clear()
+        self.sessao = servidor.ensure_client(self.addr)
+        cliente.seq_recv = 0
+        cliente.partes.clear()
+        self._descartar_acks()
+
+    async def asyncTearDown(self):
+        if self.sessao.timer is not None:
+            self.sessao.timer.cancel()
+
+    def _descartar_acks(self):
+        ##Os ACKs do cliente ficam no socket do servidor, que ninguém lê: é a perda dos ACKs
+        try:
+            while True:
+                servidor.server.recvfrom(servidor.BUFFER_SIZE)
+        except BlockingIOError:
+            pass
+
+    def _receber(self):
+        """Entrega ao cliente o próximo pacote que o servidor mandou; retorna (pacote, texto)."""
+        dados, _ = cliente.client.recvfrom(cliente.BUFFER_SIZE)
+        pkt = parse_pkt(dados)
+        self.assertEqual(pkt.tipo, TIPO_DADOS)
+        return pkt, cliente.on_data(pkt)
+
+    def _desistir(self):
+        self.sessao.limite = time.monotonic() - 1
+        self.sessao.timer.cancel()
+        servidor.on_timeout(self.addr, self.sessao)
+
+    async def test_mensagem_depois_de_perder_so_os_acks(self):
+        servidor.reliable_send(self.addr, "primeira")
+        self.assertEqual(self._receber()[1], "primeira")
+        self._descartar_acks()
+        self._desistir()
+        self.assertEqual(self.sessao.em_transito, [])
+
+        servidor.reliable_send(self.addr, "segunda")
+        pkt, texto = self._receber()
+        self.assertTrue(pkt.flags & FLAG_REINICIO)
+        self.assertEqual(texto, "segunda")
+        servidor.on_ack(self.addr, self.sessao, cliente.seq_recv)
+        self.assertEqual(self.sessao.em_transito, [])
+
+        ##Retransmissão do reinício já aceito: duplicata, não recua a espera
+        cliente.on_data(pkt)
+        servidor.reliable_send(self.addr, "terceira")
+        self.assertEqual(self._receber()[1], "terceira")
+
+    async def test_mensagem_interrompida_no_meio(self):
+        servidor.JANELA, janela = 1, servidor.JANELA
+        self.addCleanup(setattr, servidor, "JANELA", janela)
+        servidor.reliable_send(self.addr, "x" * (2 * servidor.FRAGMENTO + 1))
+        self.assertIsNone(self._receber()[1])
+        servidor.on_ack(self.addr, self.sessao, cliente.seq_recv) ## o primeiro pedaço foi confirmado
+        self.assertTrue(self.sessao.meio_mensagem)
+        self._receber() ## o segundo chega, o ACK dele se perde
+        self._descartar_acks()
+        self._desistir()
+
+        ##O aviso sai já, sem esperar a próxima mensagem
+        pkt, texto = self._receber()
+        self.assertTrue(pkt.flags & FLAG_REINICIO)
+        self.assertIsNone(texto)
+        self.assertEqual(cliente.partes, [])
+        servidor.on_ack(self.addr, self.sessao, cliente.seq_recv)
+
+        servidor.reliable_send(self.addr, "depois")
+        self.assertEqual(self._receber()[1], "depois")
+
+
+class DesconexaoTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.addr = cliente.client.getsockname()
+        for indice in (servidor.clients, servidor.online, servidor.names, servidor.players):
+            indice.clear()
+        self.sessao = servidor.ensure_client(self.addr)
+        servidor.handle_msg(self.addr, "login ana")
+        cliente.seq_recv = 0
+        cliente.partes.clear()
+        self._descartar()
+
+    async def asyncTearDown(self):
+        for sessao in servidor.clients.values():
+            if sessao.timer is not None:
+                sessao.timer.cancel()
+
+    def _descartar(self):
+        ##Tudo o que está nos dois sockets se perde
+        for sock in (servidor.server, cliente.client):
+            espera = sock.gettimeout()
+            sock.setblocking(False)
+            try:
+                while True:
+                    sock.recvfrom(servidor.BUFFER_SIZE)
+            except BlockingIOError:
+                pass
+            sock.settimeout(espera)
+
+    def _desistir(self):
+        servidor.reliable_send(self.addr, "sem resposta")
+        self._descartar()
+        self.sessao.limite = time.monotonic() - 1
+        self.sessao.timer.cancel()
+        servidor.on_timeout(self.addr, self.sessao)
+
+    def _desconectado(self):
+        self.assertNotIn(self.addr, servidor.clients)
+        self.assertNotIn(self.addr, servidor.online)
+        self.assertNotIn("ana", servidor.names)
+        self.assertNotIn(self.sessao, servidor.players)
+        self.assertFalse(self.sessao.online)
+        self.assertIsNone(self.sessao.timer)
+
+    async def test_desistencias_seguidas_desconectam(self):
+        self._desistir()
+        self.assertIn(self.addr, servidor.online)
+        self._desistir()
+        self._desconectado()
+
+        ##Mensagens para quem foi esquecido não recriam a sessão
+        servidor.reliable_send(self.addr, "tarde demais")
+        self.assertNotIn(self.addr, servidor.clients)
+
+    async def test_pacote_do_cliente_zera_as_desistencias(self):
+        self._desistir()
+        cliente.client.sendto(cliente.make_ack(cliente.seq_recv), servidor.server.getsockname())
+        servidor.receive_packets()
+        self.assertEqual(self.sessao.desistencias, 0)
+        self._desistir()
+        self.assertIn(self.addr, servidor.online)
+        self.assertIs(servidor.clients[self.addr], self.sessao)
+
+    async def test_ocioso_esquecido(self):
+        servidor.evict_idle()
+        self.assertIn(self.addr, servidor.clients)
+        self.sessao.visto_em = time.monotonic() - servidor.TEMPO_OCIOSO - 1
+        servidor.evict_idle()
+        self._desconectado()
+
+    async def test_cliente_esquecido_volta(self):
+        servidor.reliable_send(self.addr, "ok")
+        self._descartar()
+        self.sessao.visto_em = 0.0
+        servidor.evict_idle()
+
+        ##O cliente continua da numeração em que estava; a nova sessão a segue
+        cliente.seq_recv = 5
+        cliente.client.sendto(cliente.make_data(7, "hint"), servidor.server.getsockname())
+        servidor.receive_packets()
+        sessao = servidor.clients[self.addr]
+        self.assertEqual(sessao.expected_seq_recv, 8)
+        while True:
+            dados, _ = cliente.client.recvfrom(cliente.BUFFER_SIZE)
+            pkt = parse_pkt(dados)
+            if pkt.tipo == TIPO_ACK:
+                self.assertEqual(pkt.ack, 8)
+                continue
+            break
+        self.assertEqual(pkt.seq, 5)
+        self.assertEqual(cliente.on_data(pkt), "ERRO: Faça login primeiro.")
+        sessao.timer.cancel()
+
+
+class SpatialHashTest(unittest.TestCase):
+    """near e nearest do índice espacial comparados com uma varredura de todos os objetos."""
+
+    def _indice(self, celula, n, lado, semente):
+        gerador = random.Random(semente)
+        indice = servidor.SpatialHash(celula)
+        posicoes = {}
+        for obj in range(n):
+            posicoes[obj] = (gerador.randint(1, lado), gerador.randint(1, lado))
+            indice.add(obj, posicoes[obj])
+        ##Alguns saem e outros andam, como jogadores e tesouros durante a partida
+        for obj in range(0, n, 5):
+            indice.remove(obj)
+            del posicoes[obj]
+        for obj in [o for o in range(1, n, 7) if o in posicoes]:
+            posicoes[obj] = (gerador.randint(1, lado), gerador.randint(1, lado))
+            indice.move(obj, posicoes[obj])
+        return indice, posicoes, gerador
+
+    def test_near_igual_a_varredura(self):
+        for celula, n, lado in ((1, 50, 20), (4, 200, 60), (servidor.CELULA, 300, 500)):
+            indice, posicoes, gerador = self._indice(celula, n, lado, celula)
+            self.assertEqual(len(indice), len(posicoes))
+            self.assertEqual(set(indice), set(posicoes))
+            for _ in range(100):
+                pos, raio = (gerador.randint(-5, lado + 5), gerador.randint(-5, lado + 5)), gerador.randint(0, 30)
+                esperado = {obj for obj, (x, y) in posicoes.items() if abs(x - pos[0]) <= raio and abs(y - pos[1]) <= raio}
+                with self.subTest(celula=celula, pos=pos, raio=raio):
+                    self.assertEqual(set(indice.near(pos, raio)), esperado)
+
+    def test_nearest_igual_a_varredura(self):
+        for celula, n, lado in ((1, 30, 20), (4, 200, 60), (servidor.CELULA, 5, 2000), (servidor.CELULA, 300, 500)):
+            indice, posicoes, gerador = self._indice(celula, n, lado, celula + n)
+            for _ in range(100):
+                pos = (gerador.randint(-50, lado + 50), gerador.randint(-50, lado + 50))
+                distancias = {obj: abs(x - pos[0]) + abs(y - pos[1]) for obj, (x, y) in posicoes.items()}
+                with self.subTest(celula=celula, n=n, pos=pos):
+                    ##Empates podem dar qualquer um dos mais perto; a distância é que tem de bater
+                    self.assertEqual(distancias[indice.nearest(pos)], min(distancias.values()))
+
+    def test_vazio(self):
+        indice = servidor.SpatialHash()
+        self.assertIsNone(indice.nearest((1, 1)))
+        self.assertEqual(list(indice.near((1, 1), 10)), [])
+        indice.add("a", (3, 3))
+        indice.remove("a")
+        self.assertIsNone(indice.nearest((1, 1)))
+        self.assertEqual(indice._celulas, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
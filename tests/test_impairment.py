@@ -0,0 +1,28 @@
+"""Perfis do proxy de degradação (rdt/impairment.py)."""
+import unittest
+
+from rdt.impairment import PERFIL_PADRAO, PERFIS, load_profile
+
+
+class LoadProfileTest(unittest.TestCase):
+
+    def test_sentido_substitui_o_nivel_de_cima(self):
+        perfil = load_profile({"perda": 0.1, "atraso": 0.02, "ida": {"perda": 0.3}})
+        self.assertEqual(perfil["ida"]["perda"], 0.3)
+        self.assertEqual(perfil["volta"]["perda"], 0.1)
+        self.assertEqual(perfil["ida"]["atraso"], 0.02)
+        self.assertEqual(set(perfil["volta"]), set(PERFIL_PADRAO))
+
+    def test_chaves_desconhecidas(self):
+        for perfil in ({"perdaa": 0.3}, {"ida": {"perdaa": 0.3}}, {"volta": {"atrasso": 0.1}}):
+            with self.subTest(perfil=perfil):
+                with self.assertRaises(ValueError):
+                    load_profile(perfil)
+
+    def test_perfis_prontos(self):
+        for nome in PERFIS:
+            self.assertEqual(set(load_profile(nome)["ida"]), set(PERFIL_PADRAO))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+FileServer no loopback recebendo SYNs que não viram sessão: o cliente
+recebe TIPO_ERRO e nada fica na tabela de sessões.
+"""
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from rdt.packet import TIPO_ERRO, TIPO_SYN, make_pkt, parse_pkt
+from rdt.server import FileServer
+
+
+class FileServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.armazenamento = os.path.join(self.pasta.name, "servidor")
+        os.makedirs(self.armazenamento)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        self.endereco = sock.getsockname()
+        self.loop = asyncio.new_event_loop()
+        self.erros = [] ## exceções que escapariam para o laço
+
+        async def iniciar():
+            self.servidor = FileServer(sock, self.armazenamento, memoria_cache=0)
+
+        self.loop.set_exception_handler(lambda _, contexto: self.erros.append(contexto))
+        self.loop.run_until_complete(iniciar())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.addCleanup(self._parar)
+        self.cliente = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.cliente.settimeout(2)
+        self.addCleanup(self.cliente.close)
+
+    def _parar(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.servidor.close()
+        self.loop.close()
+
+    def _syn(self, dados, sessao=7):
+        """Envia um SYN com `dados` e retorna a resposta do servidor."""
+        self.cliente.sendto(make_pkt(TIPO_SYN, dados=dados, sessao=sessao), self.endereco)
+        resposta, _ = self.cliente.recvfrom(2048)
+        return parse_pkt(resposta)
+
+    def test_sessao_que_nao_abre_o_arquivo_e_recusada(self):
+        os.rmdir(self.armazenamento) ## open() do arquivo recebido falha
+        dados = json.dumps({"nome": "a.bin", "tamanho": 10}).encode()
+        for _ in range(2): ## o SYN retransmitido também é recusado, sem sessão presa
+            resposta = self._syn(dados)
+            self.assertEqual(resposta.tipo, TIPO_ERRO)
+            self.assertEqual(self.servidor.sessoes, {})
+        self.assertEqual(self.erros, [])
+
+    def test_metadados_invalidos_sao_recusados(self):
+        for sessao, dados in enumerate([b"nao e json", b"\xff\xfe", b"[1, 2]",
+                                        json.dumps({"nome": "a.bin", "tamanho": "10"}).encode(),
+                                        json.dumps({"nome": "a.bin", "tamanho": 10, "bloco": 0}).encode(),
+                                        json.dumps({"nome": "a.bin", "tamanho": -1}).encode()], start=1):
+            with self.subTest(dados=dados):
+                resposta = self._syn(dados, sessao)
+                self.assertEqual(resposta.tipo, TIPO_ERRO)
+                self.assertIn("SYN inválido", bytes(resposta.dados).decode())
+        self.assertEqual(self.servidor.sessoes, {})
+        self.assertEqual(self.erros, [])
+
+
+    def test_fluxo_paralelo_grande_demais_e_recusado(self):
+        fluxo = {"nome": "a.bin", "tamanho": 10, "deslocamento": 0, "fluxo": 0, "fluxos": 2, "transferencia": "t"}
+        for sessao, total in enumerate([2 ** 62, self.servidor.tamanho_maximo + 1, None], start=1):
+            with self.subTest(total=total):
+                dados = dict(fluxo, total=total) if total is not None else fluxo
+                self.assertEqual(self._syn(json.dumps(dados).encode(), sessao).tipo, TIPO_ERRO)
+        self.assertEqual(self.servidor.sessoes, {})
+        self.assertFalse(os.path.exists(os.path.join(self.armazenamento, "recebido_a.bin")))
+        self.assertEqual(self.erros, [])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+TransferSession com delta, contra um FileServer no loopback: o bloco sondado
+fica guardado também no envio por diferenças, e o `ok` do eco confere o
+conteúdo devolvido.
+"""
+import asyncio
+import filecmp
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from rdt.pmtu import BLOCO_BASE
+from rdt.server import FileServer
+from rdt.session import TransferSession
+
+TAMANHO_ARQUIVO = 512 * 1024
+
+
+class SessionDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.loop = asyncio.new_event_loop()
+        armazenamento = os.path.join(self.pasta.name, "servidor")
+        os.makedirs(armazenamento)
+
+        async def iniciar():
+            self.servidor = FileServer(self.sock, armazenamento, memoria_cache=0)
+
+        self.loop.run_until_complete(iniciar())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.addCleanup(self._parar)
+
+    def _parar(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.servidor.close()
+        self.loop.close()
+
+    def test_delta_guarda_bloco_e_confere_eco(self):
+        origem = os.path.join(self.pasta.name, "arquivo.bin")
+        retorno = os.path.join(self.pasta.name, "retorno.bin")
+        conteudo = bytearray(os.urandom(TAMANHO_ARQUIVO))
+        with open(origem, "wb") as arquivo:
+            arquivo.write(conteudo)
+        with TransferSession(self.sock.getsockname()) as sessao:
+            self.assertTrue(sessao.send_file(origem)["ok"])
+
+        conteudo[1000:1100] = os.urandom(100)
+        with open(origem, "wb") as arquivo:
+            arquivo.write(conteudo)
+        with TransferSession(self.sock.getsockname()) as sessao:
+            self.assertFalse(sessao.sondado)
+            resultado = sessao.send_file(origem, retorno=retorno, delta=True)
+            self.assertTrue(sessao.sondado)
+            self.assertGreater(sessao.bloco, BLOCO_BASE)
+        self.assertLess(resultado["bytes"], TAMANHO_ARQUIVO) ## foram só as instruções
+        self.assertTrue(resultado["ok"])
+        self.assertTrue(filecmp.cmp(origem, retorno, shallow=False))
+
+
+if __name__ == "__main__":
+    unittest.main()